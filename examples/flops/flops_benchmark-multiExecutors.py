@@ -13,19 +13,22 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 #
+import os
+import sys
 import click
 import time
 import numpy as np
 import pickle as pickle
-from mpi4py import MPI
 
-from lithops import FunctionExecutor
 from plots import (
     create_execution_histogram,
     create_rates_histogram,
     create_total_gflops_plot,
 )
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "motifs"))
+from hpc_fanout import FanOut  # noqa: E402
+
 
 def compute_flops(loopcount, MAT_N):
     A = np.arange(MAT_N**2, dtype=np.float64).reshape(MAT_N, MAT_N)
@@ -73,82 +76,48 @@ def compute_flops(loopcount, MAT_N):
 #     return res
 
 
-def benchmark(backend, storage, workers, memory, loopcount, matn, debug):
+def benchmark(backend, storage, workers, memory, loopcount, matn, debug, executors=None, tasks_per_executor=896):
     log_level = "INFO" if not debug else "DEBUG"
-    max_workers_per_executor = 896
-
-    # MPI setup
-    comm = MPI.COMM_WORLD
-    rank = comm.Get_rank()
-    size = comm.Get_size()
-
-    num_batches = (workers + max_workers_per_executor - 1) // max_workers_per_executor
-    print(f'num_batches:{num_batches}')
-    # All ranks must call gather, even if they do no work
-    if rank < num_batches:
-        batch_start = rank * max_workers_per_executor
-        batch_end = min(batch_start + max_workers_per_executor, workers)
-        batch_size = batch_end - batch_start
-
-        iterable = [(loopcount, matn) for _ in range(batch_size)]
-
-        print(f"[Rank {rank}] Launching executor with {batch_size} workers...")
-        print(iterable[0])
-        
-        fexec = FunctionExecutor(backend=backend, storage=storage,
-                                 runtime_memory=memory, log_level=log_level)
-
-        batch_start_time = time.time()
-        batch_futures = fexec.map(compute_flops, iterable)
-        batch_results = fexec.get_result(throw_except=False)
-        batch_end_time = time.time()
-
-        # Process results
-        batch_results = [flops for flops in batch_results if flops is not None]
-        batch_stats = [f.stats for f in batch_futures if not f.error]
-        batch_total_time = batch_end_time - batch_start_time
-        batch_executed = len(batch_stats)
-        batch_flops = batch_executed * 2 * loopcount * matn**3
-        
-    else:
-        batch_results = []
-        batch_stats = []
-        batch_total_time = 0.0
-        batch_flops = 0
-        batch_executed = 0
-    
-    # All ranks must participate
-    all_results = comm.gather(batch_results, root=0)
-    all_stats = comm.gather(batch_stats, root=0)
-    all_flops = comm.gather(batch_flops, root=0)
-    all_times = comm.gather(batch_total_time, root=0)
-    all_counts = comm.gather(batch_executed, root=0)
-
-    if rank == 0:
-        global_start_time = time.time() - max(all_times)  # approximate global start
-        total_time = max(all_times)
-        total_flops = sum(all_flops)
-        total_workers = sum(all_counts)
-
-        print("\nMPI Benchmark Summary")
-        print("----------------------")
-        print("Total workers executed:", total_workers)
-        print("Total time:", round(total_time, 3), "seconds")
-        print("Estimated GFLOPS:", round(total_flops / 1e9 / total_time, 4))
-        
-        res= {
-            "start_time": global_start_time,
-            "total_time": total_time,
-            "est_flops": total_flops,
-            "worker_stats": [s for batch in all_stats for s in batch],
-            "results": [r for batch in all_results for r in batch],
-            "workers": total_workers,
-            "loopcount": loopcount,
-            "MATN": matn,
-        }
-        pickle.dump(res, open(f"multiexecutor.pickle", "wb"))
-        return res
-    return {}  # non-root ranks return an empty dict
+    iterable = [(loopcount, matn) for _ in range(workers)]
+
+    # Each chunk of the map runs in its own executor, all of them from this process
+    fan_out = FanOut(compute_flops, iterable, executors=executors, max_tasks_per_executor=tasks_per_executor,
+                     backend=backend, storage=storage, runtime_memory=memory, log_level=log_level)
+    print(f"Launching {len(fan_out.chunks)} executors for {fan_out.total} tasks...")
+
+    # Stats are aggregated as futures complete, not gathered per executor at the end
+    results = []
+    worker_stats = []
+    for future, result in fan_out:
+        if result is not None:
+            results.append(result)
+        if not future.error:
+            worker_stats.append(future.stats)
+            if len(worker_stats) % 1000 == 0:
+                print(f"{len(worker_stats)}/{fan_out.total} tasks done")
+
+    total_time = fan_out.end_time - fan_out.start_time
+    total_workers = len(worker_stats)
+    total_flops = total_workers * 2 * loopcount * matn**3
+
+    print("\nMulti-executor Benchmark Summary")
+    print("--------------------------------")
+    print("Executors:", len(fan_out.chunks))
+    print("Total workers executed:", total_workers)
+    print("Total time:", round(total_time, 3), "seconds")
+    print("Estimated GFLOPS:", round(total_flops / 1e9 / total_time, 4))
+
+    res = {
+        "start_time": fan_out.start_time,
+        "total_time": total_time,
+        "est_flops": total_flops,
+        "worker_stats": worker_stats,
+        "results": results,
+        "workers": total_workers,
+        "loopcount": loopcount,
+        "MATN": matn,
+    }
+    return res
 
 
 def create_plots(data, outdir, name):
@@ -166,11 +135,15 @@ def create_plots(data, outdir, name):
 @click.option("--name", help="filename to save results in")
 @click.option("--loopcount", default=6, help="Number of matmuls to do.", type=int)
 @click.option("--matn", default=1024, help="size of matrix", type=int)
+@click.option("--executors", default=None, help="executors to split the tasks in, by default as many as needed "
+                                                "for --tasks_per_executor", type=int)
+@click.option("--tasks_per_executor", default=896, help="maximum tasks mapped by each executor", type=int)
 @click.option("--debug", "-d", is_flag=True, help="debug mode")
-def run_benchmark(backend, storage, tasks, memory, outdir, name, loopcount, matn, debug):
+def run_benchmark(backend, storage, tasks, memory, outdir, name, loopcount, matn, executors, tasks_per_executor,
+                  debug):
     name = "{}_flops".format(tasks) if name is None else name
     if True:
-        res = benchmark(backend, storage, tasks, memory, loopcount, matn, debug)
+        res = benchmark(backend, storage, tasks, memory, loopcount, matn, debug, executors, tasks_per_executor)
         pickle.dump(res, open(f"{outdir}/{name}.pickle2", "wb"))
     else:
         res = pickle.load(open(f"{outdir}/{name}.pickle", "rb"))
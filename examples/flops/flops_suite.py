@@ -0,0 +1,411 @@
+#
+# Copyright Cloudlab URV 2020
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import os
+import sys
+import json
+import time
+import socket
+import click
+import uuid
+import tempfile
+import subprocess
+import numpy as np
+import pickle as pickle
+
+from lithops import FunctionExecutor
+
+THREAD_ENV_VARS = ['OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS', 'BLIS_NUM_THREADS',
+                   'NUMEXPR_NUM_THREADS', 'VECLIB_MAXIMUM_THREADS']
+POPCOUNT_TABLE = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def gemm_setup(dtype):
+    def setup(n):
+        rng = np.random.default_rng(0)
+        return {'A': rng.random((n, n)).astype(dtype),
+                'B': rng.random((n, n)).astype(dtype),
+                'C': np.empty((n, n), dtype=dtype)}
+    return setup
+
+
+def gemm_run(state):
+    np.dot(state['A'], state['B'], out=state['C'])
+
+
+def triad_setup(n):
+    rng = np.random.default_rng(0)
+    return {'a': np.empty(n), 'b': rng.random(n), 'c': rng.random(n), 'scalar': 3.0}
+
+
+def triad_run(state):
+    # a = b + scalar * c, in two passes over a as NumPy has no fused triad
+    np.multiply(state['c'], state['scalar'], out=state['a'])
+    np.add(state['a'], state['b'], out=state['a'])
+
+
+def fft_setup(n):
+    rng = np.random.default_rng(0)
+    return {'x': rng.random(n) + 1j * rng.random(n)}
+
+
+def fft_run(state):
+    np.fft.fft(state['x'])
+
+
+def bincount_setup(n):
+    # Genotypes (0-2) of two SNPs and case/control labels of n patients, as in the MDR contingency tables
+    rng = np.random.default_rng(0)
+    return {'snp1': rng.integers(0, 3, n, dtype=np.int64),
+            'snp2': rng.integers(0, 3, n, dtype=np.int64),
+            'labels': rng.integers(0, 2, n, dtype=np.int64)}
+
+
+def bincount_run(state):
+    codes = state['snp1'] * 3 + state['snp2']
+    np.bincount(codes + 9 * state['labels'], minlength=18)
+
+
+def popcount_setup(n):
+    rng = np.random.default_rng(0)
+    return {'bits': rng.integers(0, 2**63, n // 64, dtype=np.uint64)}
+
+
+def popcount_run(state):
+    if hasattr(np, 'bitwise_count'):
+        np.bitwise_count(state['bits']).sum()
+    else:
+        POPCOUNT_TABLE[state['bits'].view(np.uint8)].sum()
+
+
+# Kernels: setup(size) builds the inputs once, run(state) is timed, work(size) is the work of one run
+KERNELS = {
+    'gemm_f32': {'setup': gemm_setup(np.float32), 'run': gemm_run, 'work': lambda n: 2 * n**3,
+                 'unit': 'GFLOPS', 'size': 2048},
+    'gemm_f64': {'setup': gemm_setup(np.float64), 'run': gemm_run, 'work': lambda n: 2 * n**3,
+                 'unit': 'GFLOPS', 'size': 2048},
+    # STREAM convention: 24 bytes per element (read b and c, write a)
+    'triad': {'setup': triad_setup, 'run': triad_run, 'work': lambda n: 24 * n,
+              'unit': 'GB/s', 'size': 2**24},
+    # Usual FFT convention: 5 N log2(N) flops
+    'fft': {'setup': fft_setup, 'run': fft_run, 'work': lambda n: 5 * n * np.log2(n),
+            'unit': 'GFLOPS', 'size': 2**20},
+    'bincount': {'setup': bincount_setup, 'run': bincount_run, 'work': lambda n: n,
+                 'unit': 'Gpatients/s', 'size': 2**24},
+    'popcount': {'setup': popcount_setup, 'run': popcount_run, 'work': lambda n: n,
+                 'unit': 'Gbits/s', 'size': 2**30},
+}
+
+
+def run_kernel(kernel, size, loopcount):
+    spec = KERNELS[kernel]
+    state = spec['setup'](size)
+    spec['run'](state)  # warm up
+
+    start = time.time()
+    for i in range(loopcount):
+        spec['run'](state)
+    end = time.time()
+
+    work = spec['work'](size) * loopcount
+    return {'kernel': kernel, 'size': size, 'loopcount': loopcount, 'start_time': start, 'end_time': end,
+            'rate': work / (end - start) / 1e9, 'unit': spec['unit']}
+
+
+def thread_env(threads):
+    env = dict(os.environ)
+    env.update({var: str(threads) for var in THREAD_ENV_VARS})
+    # The kernel process imports this module and its dependencies from the same paths as this one
+    env['PYTHONPATH'] = os.pathsep.join(p for p in sys.path if p)
+    return env
+
+
+def run_pinned(kernels, sizes, loopcount, threads=1, cpus=None):
+    """Rates of the kernels in a new process with `threads` BLAS/OpenMP threads, pinned to `cpus`.
+
+    Thread counts are set in the environment and the affinity before the process
+    starts, so they apply to every BLAS/OpenMP thread created when numpy loads.
+    """
+    cmd = [sys.executable, os.path.abspath(__file__), 'kernels', '--loopcount', str(loopcount),
+           '--kernels', ','.join(kernels)]
+    for kernel in kernels:
+        cmd += ['--size', '{}={}'.format(kernel, sizes[kernel])]
+    preexec_fn = (lambda: os.sched_setaffinity(0, cpus)) if cpus else None
+    proc = subprocess.run(cmd, env=thread_env(threads), preexec_fn=preexec_fn, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError('Kernel process failed:\n{}'.format(proc.stderr))
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def local_baseline(kernels, sizes, loopcount):
+    """Rates of the kernels on one core of this machine, with a single BLAS thread."""
+    cpus = {min(os.sched_getaffinity(0))} if hasattr(os, 'sched_getaffinity') else None
+    try:
+        return run_pinned(kernels, sizes, loopcount, 1, cpus)
+    except RuntimeError as e:
+        raise click.ClickException('Baseline measurement failed: {}'.format(e))
+
+
+def claim_slot(run_id, slots):
+    """Claim a free group of cores among `slots` on this node, with exclusive lock files in its temp dir.
+
+    Returns the slot and its lock file, or (None, None) if all of them are taken.
+    """
+    directory = os.path.join(tempfile.gettempdir(), 'flops-sweep-{}'.format(run_id))
+    os.makedirs(directory, exist_ok=True)
+    for slot in range(slots):
+        path = os.path.join(directory, 'slot{}'.format(slot))
+        try:
+            os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        except FileExistsError:
+            continue
+        return slot, path
+    return None, None
+
+
+def slot_cpus(slot, threads):
+    """CPUs of the `slot`-th group of `threads` cores among the ones this process may run on."""
+    allowed = sorted(os.sched_getaffinity(0))
+    return set(allowed[slot * threads:(slot + 1) * threads])
+
+
+def run_kernel_threads(kernel, size, loopcount, threads, tasks_per_worker, run_id, pin):
+    slot, lock = None, None
+    # Without enough cores for disjoint groups, the tasks run unpinned rather than on overlapping cores
+    if pin and hasattr(os, 'sched_setaffinity') and threads * tasks_per_worker <= len(os.sched_getaffinity(0)):
+        slot, lock = claim_slot(run_id, tasks_per_worker)
+    try:
+        cpus = slot_cpus(slot, threads) if slot is not None else None
+        res = run_pinned([kernel], {kernel: size}, loopcount, threads, cpus)[kernel]
+    finally:
+        if lock is not None:
+            os.remove(lock)
+            try:
+                os.rmdir(os.path.dirname(lock))
+            except OSError:
+                pass  # other tasks of the node still hold their slots
+    res.update({'threads': threads, 'slot': slot, 'pinned': cpus is not None, 'host': socket.gethostname()})
+    return res
+
+
+def kernel_sizes(kernels, size_overrides):
+    sizes = {kernel: KERNELS[kernel]['size'] for kernel in kernels}
+    for override in size_overrides:
+        kernel, _, size = override.partition('=')
+        if kernel not in KERNELS or not size.isdigit():
+            raise click.BadParameter('Sizes must be KERNEL=N with a kernel of {}'.format(list(KERNELS)))
+        sizes[kernel] = int(size)
+    return sizes
+
+
+def parse_kernels(kernels):
+    kernels = [k.strip() for k in kernels.split(',') if k.strip()]
+    unknown = [k for k in kernels if k not in KERNELS]
+    if unknown:
+        raise click.BadParameter('Unknown kernels {}, choose from {}'.format(unknown, list(KERNELS)))
+    return kernels
+
+
+def benchmark(backend, storage, tasks, memory, kernels, sizes, loopcount, debug):
+    log_level = 'INFO' if not debug else 'DEBUG'
+    fexec = FunctionExecutor(backend=backend, storage=storage, runtime_memory=memory, log_level=log_level)
+
+    res = {}
+    for kernel in kernels:
+        # All tasks run the same kernel at the same time, so shared resources (memory bandwidth) are contended
+        iterable = [(kernel, sizes[kernel], loopcount) for i in range(tasks)]
+        start_time = time.time()
+        worker_futures = fexec.map(run_kernel, iterable)
+        results = fexec.get_result(worker_futures, throw_except=False)
+        end_time = time.time()
+        results = [r for r in results if r is not None]
+        res[kernel] = {'start_time': start_time,
+                       'total_time': end_time - start_time,
+                       'worker_stats': [f.stats for f in worker_futures if not f.error],
+                       'results': results}
+        print('{}: {} tasks in {:.3f} s'.format(kernel, len(results), end_time - start_time))
+    return res
+
+
+def summarize(res, baseline):
+    summary = {}
+    for kernel, datum in res.items():
+        rates = np.array([r['rate'] for r in datum['results']])
+        summary[kernel] = {'unit': KERNELS[kernel]['unit'],
+                           'baseline': baseline[kernel]['rate'],
+                           'task_median': float(np.median(rates)) if len(rates) else float('nan'),
+                           'aggregate': float(rates.sum()),
+                           'speedup': float(np.median(rates)) / baseline[kernel]['rate'] if len(rates) else float('nan')}
+    return summary
+
+
+def sweep(backend, storage, runtime, memory, kernels, sizes, loopcount, cores, workers, thread_counts, pin, debug):
+    log_level = 'INFO' if not debug else 'DEBUG'
+    fexec = FunctionExecutor(backend=backend, storage=storage, runtime=runtime, runtime_memory=memory,
+                             log_level=log_level)
+
+    res = []
+    for kernel in kernels:
+        for threads in thread_counts:
+            # cores // threads tasks of `threads` threads fill every worker, each one claims a group of cores
+            tasks_per_worker = cores // threads
+            run_id = uuid.uuid4().hex
+            iterable = [(kernel, sizes[kernel], loopcount, threads, tasks_per_worker, run_id, pin)
+                        for i in range(tasks_per_worker * workers)]
+            worker_futures = fexec.map(run_kernel_threads, iterable)
+            results = [r for r in fexec.get_result(worker_futures, throw_except=False) if r is not None]
+            node_rates = host_rates(results, KERNELS[kernel]['work'](sizes[kernel]) * loopcount)
+            node_rate = float(np.median(list(node_rates.values()))) if node_rates else float('nan')
+            tasks_per_host = {host: sum(r['host'] == host for r in results) for host in node_rates}
+            unpinned = sum(not r['pinned'] for r in results)
+            # Nothing makes the runtime spread the tasks evenly, points where it did not are not comparable
+            valid = len(results) == len(iterable) and not (pin and unpinned) and \
+                all(n == tasks_per_worker for n in tasks_per_host.values())
+            if not valid:
+                print('{} x {} threads: {}/{} tasks succeeded, {} unpinned, tasks per node {}, '
+                      'not used for the recommendation'.format(kernel, threads, len(results), len(iterable),
+                                                               unpinned, tasks_per_host))
+            res.append({'kernel': kernel, 'threads': threads, 'tasks_per_worker': tasks_per_worker,
+                        'node_rate': node_rate, 'node_rates': node_rates, 'tasks_per_host': tasks_per_host,
+                        'unit': KERNELS[kernel]['unit'], 'unpinned': unpinned, 'valid': valid,
+                        'worker_stats': [f.stats for f in worker_futures if not f.error], 'results': results})
+            print('{}: {} tasks x {} threads, {:.3f} {} per node (median of {} nodes)'.format(
+                kernel, tasks_per_worker, threads, node_rate, KERNELS[kernel]['unit'], len(node_rates)))
+    return res
+
+
+def host_rates(results, task_work):
+    """Rate of each node: the work of its tasks over the window where they ran."""
+    rates = {}
+    for host in sorted({r['host'] for r in results}):
+        host_results = [r for r in results if r['host'] == host]
+        window = max(r['end_time'] for r in host_results) - min(r['start_time'] for r in host_results)
+        rates[host] = task_work * len(host_results) / window / 1e9 if window > 0 else float('nan')
+    return rates
+
+
+def recommend(res):
+    """cpus_task giving the best rate per node for each kernel, among the evenly spread and pinned points."""
+    best = {}
+    for datum in res:
+        if datum['valid'] and datum['node_rate'] == datum['node_rate'] and \
+                (datum['kernel'] not in best or datum['node_rate'] > best[datum['kernel']]['node_rate']):
+            best[datum['kernel']] = datum
+    return {kernel: {'cpus_task': datum['threads'], 'node_rate': datum['node_rate'], 'unit': datum['unit']}
+            for kernel, datum in best.items()}
+
+
+def print_sweep(res, recommendation):
+    print('{:>10} {:>8} {:>8} {:>14} {:>12} {:>6}'.format('kernel', 'tasks', 'threads', 'per node', 'unit', 'valid'))
+    for datum in res:
+        print('{:>10} {:>8} {:>8} {:>14.3f} {:>12} {:>6}'.format(
+            datum['kernel'], datum['tasks_per_worker'], datum['threads'], datum['node_rate'], datum['unit'],
+            'yes' if datum['valid'] else 'no'))
+    for kernel, rec in recommendation.items():
+        print('{}: cpus_task: {} ({:.3f} {} per node)'.format(kernel, rec['cpus_task'], rec['node_rate'], rec['unit']))
+
+
+def print_summary(summary):
+    print('{:>10} {:>12} {:>12} {:>12} {:>14} {:>10}'.format(
+        'kernel', 'unit', '1 core', 'task median', 'aggregate', 'x 1 core'))
+    for kernel, s in summary.items():
+        print('{:>10} {:>12} {:>12.3f} {:>12.3f} {:>14.3f} {:>10.2f}'.format(
+            kernel, s['unit'], s['baseline'], s['task_median'], s['aggregate'], s['speedup']))
+
+
+@click.group()
+def cli():
+    pass
+
+
+@cli.command('run')
+@click.option('--backend', '-b', default=None, help='compute backend name', type=str)
+@click.option('--storage', '-s', default=None, help='storage backend name', type=str)
+@click.option('--tasks', default=10, help='how many tasks', type=int)
+@click.option('--memory', default=1024, help='Memory per worker in MB', type=int)
+@click.option('--outdir', default='.', help='dir to save results in')
+@click.option('--name', help='filename to save results in')
+@click.option('--kernels', default=','.join(KERNELS), help='comma separated kernels to run')
+@click.option('--size', 'size_overrides', multiple=True, help='problem size of a kernel as KERNEL=N')
+@click.option('--loopcount', default=5, help='Number of timed runs of each kernel.', type=int)
+@click.option('--debug', '-d', is_flag=True, help='debug mode')
+def run_command(backend, storage, tasks, memory, outdir, name, kernels, size_overrides, loopcount, debug):
+    name = '{}_suite'.format(tasks) if name is None else name
+    kernels = parse_kernels(kernels)
+    sizes = kernel_sizes(kernels, size_overrides)
+    print('Measuring single core baseline...')
+    baseline = local_baseline(kernels, sizes, loopcount)
+    res = benchmark(backend, storage, tasks, memory, kernels, sizes, loopcount, debug)
+    summary = summarize(res, baseline)
+    pickle.dump({'kernels': res, 'sizes': sizes, 'loopcount': loopcount, 'baseline': baseline, 'summary': summary},
+                open(f'{outdir}/{name}.pickle', 'wb'))
+    print_summary(summary)
+
+
+@cli.command('sweep')
+@click.option('--backend', '-b', default=None, help='compute backend name', type=str)
+@click.option('--storage', '-s', default=None, help='storage backend name', type=str)
+@click.option('--runtime', '-r', default=None, help='runtime name, should run as many tasks per worker as CPUs '
+                                                      '(cpus_task: 1)', type=str)
+@click.option('--memory', default=1024, help='Memory per worker in MB', type=int)
+@click.option('--cores', required=True, help='CPUs of each worker (cpus_worker)', type=int)
+@click.option('--workers', default=1, help='Workers (nodes) to fill with tasks', type=int)
+@click.option('--threads', 'thread_counts', default=None,
+              help='comma separated threads per task, by default the powers of 2 up to --cores')
+@click.option('--pin/--no-pin', default=True, help='pin each task, and all its threads, to its own group of cores')
+@click.option('--outdir', default='.', help='dir to save results in')
+@click.option('--name', help='filename to save results in')
+@click.option('--kernels', default='gemm_f32,gemm_f64,triad,fft', help='comma separated kernels to run')
+@click.option('--size', 'size_overrides', multiple=True, help='problem size of a kernel as KERNEL=N')
+@click.option('--loopcount', default=5, help='Number of timed runs of each kernel.', type=int)
+@click.option('--debug', '-d', is_flag=True, help='debug mode')
+def sweep_command(backend, storage, runtime, memory, cores, workers, thread_counts, pin, outdir, name, kernels,
+                  size_overrides, loopcount, debug):
+    """Fill the workers with tasks of 1 to --cores threads and find the best cpus_task for each kernel."""
+    name = '{}_sweep'.format(cores) if name is None else name
+    kernels = parse_kernels(kernels)
+    sizes = kernel_sizes(kernels, size_overrides)
+    if thread_counts is None:
+        thread_counts = [2**i for i in range(cores.bit_length()) if 2**i <= cores]
+    else:
+        thread_counts = [int(t) for t in thread_counts.split(',')]
+    if any(t < 1 or t > cores for t in thread_counts):
+        raise click.BadParameter('Threads per task must be between 1 and --cores')
+    res = sweep(backend, storage, runtime, memory, kernels, sizes, loopcount, cores, workers, thread_counts, pin,
+                debug)
+    recommendation = recommend(res)
+    pickle.dump({'sweep': res, 'sizes': sizes, 'loopcount': loopcount, 'cores': cores, 'workers': workers,
+                 'recommendation': recommendation}, open(f'{outdir}/{name}.pickle', 'wb'))
+    print_sweep(res, recommendation)
+
+
+@cli.command('kernels', hidden=True)
+@click.option('--kernels', default=','.join(KERNELS), help='comma separated kernels to run')
+@click.option('--size', 'size_overrides', multiple=True, help='problem size of a kernel as KERNEL=N')
+@click.option('--loopcount', default=5, help='Number of timed runs of each kernel.', type=int)
+def kernels_command(kernels, size_overrides, loopcount):
+    """Run the kernels in this process and print their rates as JSON (see run_pinned)."""
+    kernels = parse_kernels(kernels)
+    sizes = kernel_sizes(kernels, size_overrides)
+    res = {kernel: run_kernel(kernel, sizes[kernel], loopcount) for kernel in kernels}
+    cpus = sorted(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else None
+    for kernel_res in res.values():
+        kernel_res['cpus'] = cpus
+    print(json.dumps(res))
+
+
+if __name__ == '__main__':
+    cli()
@@ -15,6 +15,7 @@
 #
 
 import os
+import sys
 import pylab
 import logging
 import numpy as np
@@ -22,6 +23,9 @@ import pandas as pd
 import seaborn as sns
 from matplotlib.collections import LineCollection
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'motifs'))
+from hpc_timeline import downsample_segments, interval_sum, spread_sum
+
 pylab.switch_backend("Agg")
 logger = logging.getLogger(__name__)
 
@@ -42,34 +46,21 @@ def create_execution_histogram(benchmark_data, dst):
         tr_start_time = x[:, 0] - tzero
         tr_end_time = x[:, 1] - tzero
 
-        N = len(tr_start_time)
-
-        runtime_calls_hist = np.zeros((N, len(runtime_bins)))
-
-        for i in range(N):
-            s = tr_start_time[i]
-            e = tr_end_time[i]
-            a, b = np.searchsorted(runtime_bins, [s, e])
-            if b-a > 0:
-                runtime_calls_hist[i, a:b] = 1
-
         return {'start_time': tr_start_time,
                 'end_time': tr_end_time,
-                'runtime_calls_hist': runtime_calls_hist}
+                'runtime_calls_hist': interval_sum(runtime_bins, tr_start_time, tr_end_time)}
 
     fig = pylab.figure(figsize=(5, 5))
     ax = fig.add_subplot(1, 1, 1)
 
     time_hist = compute_times_rates(time_rates)
 
-    N = len(time_hist['start_time'])
-    line_segments = LineCollection([[[time_hist['start_time'][i], i],
-                                     [time_hist['end_time'][i], i]] for i in range(N)],
+    line_segments = LineCollection(downsample_segments(time_hist['start_time'], time_hist['end_time']),
                                    linestyles='solid', color='k', alpha=0.6, linewidth=0.4)
 
     ax.add_collection(line_segments)
 
-    ax.plot(runtime_bins, time_hist['runtime_calls_hist'].sum(axis=0), label='Parallel Functions', zorder=-1)
+    ax.plot(runtime_bins, time_hist['runtime_calls_hist'], label='Parallel Functions', zorder=-1)
 
     yplot_step = int(np.max([1, total_calls/20]))
     y_ticks = np.arange(total_calls//yplot_step + 2) * yplot_step
@@ -128,15 +119,10 @@ def create_total_gflops_plot(benchmark_data, dst):
 
     max_time = np.max(data_df.worker_end_tstamp) - tzero
     runtime_bins = np.linspace(0, int(max_time), int(max_time), endpoint=False)
-    runtime_flops_hist = np.zeros((len(data_df), len(runtime_bins)))
-
-    for i in range(len(data_df)):
-        row = data_df.iloc[i]
-        s = row.worker_func_start_tstamp - tzero
-        e = row.worker_func_end_tstamp - tzero
-        a, b = np.searchsorted(runtime_bins, [s, e])
-        if b-a > 0:
-            runtime_flops_hist[i, a:b] = row.est_flops / float(b-a)
+    runtime_flops_hist = spread_sum(runtime_bins,
+                                    data_df.worker_func_start_tstamp.values - tzero,
+                                    data_df.worker_func_end_tstamp.values - tzero,
+                                    data_df.est_flops.values)
 
     results_by_endtime = data_df.sort_values('worker_end_tstamp')
     results_by_endtime['job_endtime_zeroed'] = data_df.worker_end_tstamp - tzero
@@ -146,7 +132,7 @@ def create_total_gflops_plot(benchmark_data, dst):
     fig = pylab.figure(figsize=(5, 5))
     ax = fig.add_subplot(1, 1, 1)
 
-    ax.plot(runtime_flops_hist.sum(axis=0)/1e9, label='Peak GFLOPS')
+    ax.plot(runtime_flops_hist/1e9, label='Peak GFLOPS')
     ax.plot(results_by_endtime.job_endtime_zeroed, results_by_endtime.rolling_flops_rate/1e9, label='Effective GFLOPS')
     ax.set_xlabel('Execution Time (sec)')
     ax.set_ylabel("GFLOPS")
@@ -6,7 +6,6 @@ any configuration of chunks size without repartitioning.
 
 import argparse
 import gzip
-import json
 import logging
 import math
 import os
@@ -19,10 +18,24 @@ from itertools import combinations_with_replacement, product
 import lithops
 import numpy as np
 import yaml
-from dataplug.fileobject import CloudObject
-from dataplug.formats.genomics.vcf import VCF, partition_num_chunks
-# from custom_vcf import VCF, partition_num_chunks
 from dataplug.util import setup_logging
+from mdr_dataset import (
+    SliceBatcher,
+    new_dataset,
+    num_slices,
+    pair_output_key,
+    partition_dataset,
+    preprocess_dataset,
+    read_manifest,
+    worker_slices,
+)
+from mdr_incremental import incremental_pairs, merge_ranges, plan_increment, update_manifest
+from mdr_pipeline import PairLoader, Uploader
+from mdr_phenotypes import build_phenotypes, mdr_errors, phenotype_names, phenotype_output_key, read_phenotypes
+from mdr_results import load_summary, save_results
+from mdr_staging import SliceStage
+from mdr_topk import ERROR_BUFFER_ROWS, HIST_BINS, TopK, error_histogram, merge_topk, tolerance_for
+from mdr_telemetry import ProgressMonitor, ProgressReporter, public_telemetry_config, telemetry_config
 
 
 def parse_labels(labels_data):
@@ -104,122 +117,6 @@ def transform_patients(x):
     return ptcode
 
 
-def count_occurrences(data):
-    """Transform the counts to an array"""
-    unique, counts = np.unique(data, return_counts=True)
-    dtcounts = dict(zip(unique, counts))
-
-    aux = list()
-    for i in range(10):
-        if i in dtcounts:
-            aux.append(dtcounts[i])
-        else:
-            aux.append(0)
-
-    return np.array(aux)
-
-
-def apply_risk(patients, risk):
-    """Apply risk vector to classify the patients"""
-    prediction = np.zeros(len(patients))
-    casevalues = np.where(risk == 1)
-
-    for n in casevalues[0][1:]:
-        prediction[patients == n] = 1
-
-    return prediction.astype(int)
-
-
-def get_risk_array(
-    patients,
-    cv_sets,
-    trainset,
-    testset,
-    npcases,
-    npcontrols,
-    ccratio,
-):
-    """
-    Count number of cases and number of controls for each column and return the high risk combinations.
-    Then, use the high risk predictor to obtain the classification and prediction error.
-    """
-    # Error list
-    # trainerror = list()
-    testerror = list()
-
-    for i in range(cv_sets):
-        # 1 - Get the sets for the iteration
-        traindata = trainset[i]
-        testdata = testset[i]
-        # Ntrain = np.sum(traindata)
-        Ntest = np.sum(testdata)
-
-        # 2 - Sum only the cases from training set
-        cases = patients * npcases.T * traindata.T
-        sumcases = count_occurrences(cases)
-
-        # 2 - Sum only the controls
-        controls = patients * npcontrols.T * traindata.T
-        sumcontrols = count_occurrences(controls)
-
-        # 3 - Get risk array
-        # risk = sumcases/sumcontrols
-        risk = np.divide(
-            sumcases,
-            sumcontrols,
-            out=np.zeros(sumcases.shape, dtype=float),
-            where=sumcontrols != 0,
-        )
-        # risk[np.isnan(risk)] = 0
-
-        # 4 - Transform to high risk = 1, low risk = 0
-        risk[risk >= ccratio] = 1
-        risk[risk < ccratio] = 0
-
-        # 5 - Classify training set
-        prediction = apply_risk(patients, risk)
-
-        # Get classification error
-        # trainerror.append((((npcases.T[0] == prediction)*traindata.T)[0]).sum()/Ntrain)
-
-        # 6 - Get classification error
-        cv_testerror = (prediction + npcases.T[0]) % 2
-        cv_testerror = (1 - cv_testerror) * testdata.T
-        testerror.append((cv_testerror.sum() / Ntest))
-
-    return testerror
-
-
-def apply_mdr_dict(
-    x,
-    rd1,
-    rd2,
-    cv_sets,
-    trainset,
-    testset,
-    npcases,
-    npcontrols,
-    ccratio,
-):
-    """Apply MDR to every SNP-SNP combination reading from a dict"""
-    key1 = x[0]
-    key2 = x[1]
-    row1 = rd1[key1]
-    row2 = rd2[key2]
-
-    patients = transform_patients((row1, row2))
-    testerror = get_risk_array(
-        patients,
-        cv_sets,
-        trainset,
-        testset,
-        npcases,
-        npcontrols,
-        ccratio,
-    )
-    return (x[0], x[1]), testerror
-
-
 def process_files(
     input_file: str,
     # worker_id: int,
@@ -233,18 +130,21 @@ def process_files(
 
     # timer_00 = timeit.default_timer()
     timer_00 = time.time()
-    worker_id, num_chunks, paired_slice_ids, mdr_config = pickle.load(open(input_file, "rb"))
-
-    co = CloudObject.from_bucket_key(
-        VCF,
-        mdr_config["bucket"],
-        mdr_config["samples_key"],
-    )
-    data_slices = co.partition(partition_num_chunks, num_chunks=num_chunks)
+    # Slices of the pairs of this worker, by global slice id, partitioned by the driver
+    worker_id, num_chunks, paired_slice_ids, data_slices, mdr_config = pickle.load(open(input_file, "rb"))
     # paired_slices = list(combinations_with_replacement(data_slices, 2))
     # start, end = chunk_ranges
     # pairs_of_slices = paired_slices[start:end]
 
+    # Copy the slices of this worker to node-local storage, once per node
+    stage = None
+    if mdr_config.get("stage_dir"):
+        stage = SliceStage(mdr_config["stage_dir"], mdr_config["stage_id"], worker_id)
+        stage.stage(
+            data_slices, [slice_id for pair in paired_slice_ids for slice_id in pair], mdr_config.get("coalesce", 1)
+        )
+        print(f"Worker {worker_id} staged {stage.staged_bytes} bytes to {stage.path} in {stage.stage_time} s")
+
     # timer_01 = timeit.default_timer()
     timer_01 = time.time()
 
@@ -253,25 +153,18 @@ def process_files(
     #     print(f"Worker {worker_id} -> {one.chunk_id}-{other.chunk_id}")
 
     # Get storage client from the cloud object
-    storage = co.storage
-
-    # Read patients information from storage
-    res = storage.get_object(Bucket=mdr_config["bucket"], Key=mdr_config["patients_key"])
-    labels = parse_labels(res["Body"].read().decode("utf-8"))
-
-    # Get np array with cases == 1
-    npcases = np.array(labels)
+    storage = data_slices[0].cloud_object.storage
 
-    # Get np array with controls == 1
-    npcontrols = np.where((npcases == 0) | (npcases == 1), npcases ^ 1, npcases)
-
-    # Get cases/controls ratio. We will use the number as the high risk/low risk separator
-    ccratio = npcases.sum(axis=0) / npcontrols.sum(axis=0)
-    print(f"Ratio of cases/controls is {ccratio}")
+    # Read patients information of every phenotype from storage
+    phenotype_labels = []
+    for patients_key in mdr_config["patients_keys"]:
+        res = storage.get_object(Bucket=mdr_config["bucket"], Key=patients_key)
+        phenotype_labels.append(parse_labels(res["Body"].read().decode("utf-8")))
+    names = mdr_config["phenotypes"]
 
     # print('Creating CV sets...')
     # Create training and test set
-    n_patients = len(labels)
+    n_patients = len(phenotype_labels[0])
     # TODO: check that number of patients corresponds with number of samples
     if "n_patients" in mdr_config:
         assert n_patients == mdr_config["n_patients"]
@@ -292,25 +185,50 @@ def process_files(
         trainset.append(nptrain)
         testset.append(nptest)
 
+    # Cases, controls and cases/controls ratio (the high risk/low risk separator) of every phenotype
+    phenotypes = build_phenotypes(phenotype_labels, trainset, testset)
+    print(f"Ratio of cases/controls is {dict(zip(names, phenotypes['ccratio'].tolist()))}")
+
     # timer_02 = timeit.default_timer()
     timer_02 = time.time()
 
     all_pairs = 0
     all_candidates = 0
+    phenotype_candidates = np.zeros(len(names), dtype=np.int64)
+    cumulative_histogram = np.zeros((len(names), HIST_BINS), dtype=np.int64)
+    # Cumulative errors are binned every ERROR_BUFFER_ROWS SNP pairs, so memory does not grow with the slice size
+    cumulative_errors = np.empty((ERROR_BUFFER_ROWS, len(names)), dtype=np.float64)
+    # Top-K mode: keep the best pairs of each phenotype instead of writing all candidates
+    top_k = mdr_config.get("top_k")
+    top_pairs = [TopK(top_k) for _ in names] if top_k else None
+    cache_hits = 0
     time_breakdown = []
+    fetch_times = []
+    pair_ids = []
+    reporter = ProgressReporter(
+        mdr_config.get("telemetry"), worker_id, len(paired_slice_ids), storage, mdr_config["bucket"]
+    )
 
-    for one_slice_id, other_slice_id in paired_slice_ids:
-        # timer_1 = timeit.default_timer()
-        timer_1 = time.time()
+    # Read up to `coalesce` upcoming slices with a single range request when they are adjacent
+    batcher = SliceBatcher(data_slices, PairLoader.read_order(paired_slice_ids), mdr_config.get("coalesce", 1))
+
+    def read_slice(slice_id):
+        return parse_sample(stage.get(slice_id, data_slices[slice_id]) if stage else batcher.get(slice_id))
 
+    # Read samples files in the background, reusing the slices already loaded for the previous pair
+    prefetch = mdr_config.get("prefetch", 0)
+    loader = iter(PairLoader(paired_slice_ids, read_slice, prefetch))
+    uploader = Uploader(prefetch)
+
+    # timer_1 = timeit.default_timer()
+    timer_1 = time.time()
+    for (one_slice_id, other_slice_id), samples, hits, t_fetch, t_fetched in loader:
         one_slice = data_slices[one_slice_id]
         other_slice = data_slices[other_slice_id]
-        print(f"    > Worker {worker_id} > Loading data slices {one_slice.chunk_id} and {other_slice.chunk_id}.")
-
-        # Read samples files
-        # FIXME: do not download the same slice twice
-        sample_1 = parse_sample(one_slice.get())
-        sample_2 = parse_sample(other_slice.get())
+        print(f"    > Worker {worker_id} > Loaded data slices {one_slice.chunk_id} and {other_slice.chunk_id}.")
+        cache_hits += hits
+        sample_1 = samples[one_slice_id]
+        sample_2 = samples[other_slice_id]
         # timer_2 = timeit.default_timer()
         timer_2 = time.time()
 
@@ -327,45 +245,53 @@ def process_files(
 
         # Compute MDR
         print(f"    > Worker {worker_id} > Applying MDR...")
-        mdr_error = list()
-        cv_sets = mdr_config["CV_sets"]
+        mdr_error = [list() for _ in names]
         prediction_power_tol = float(mdr_config["prediction_power_tol"])
         total_pairs = 0
         candidate_pairs = 0
+        buffered = 0
         for x in cartesiankeys:
             # print(f"MDR on pair {x}")
             total_pairs += 1
-            MDR_results = apply_mdr_dict(
-                x,
-                sample_1,
-                sample_2,
-                cv_sets,
-                trainset,
-                testset,
-                npcases,
-                npcontrols,
-                ccratio,
-            )
-            cumulative_error = sum(MDR_results[1])
-            # Check if SNPij is candidate to be saved
-            if cumulative_error > prediction_power_tol:
-                continue
-            mdr_error.append(MDR_results)
-            candidate_pairs += 1
+            # Encode the SNP pair once, and get the test errors of all phenotypes
+            testerror = mdr_errors(transform_patients((sample_1[x[0]], sample_2[x[1]])), phenotypes)
+            cumulative_error = testerror.sum(axis=1)
+            cumulative_errors[buffered] = cumulative_error
+            buffered += 1
+            if buffered == ERROR_BUFFER_ROWS:
+                cumulative_histogram += error_histogram(cumulative_errors, mdr_config["CV_sets"])
+                buffered = 0
+            # Check if SNPij is candidate to be saved, for each phenotype
+            for p in np.flatnonzero(~(cumulative_error > prediction_power_tol)):
+                if not top_k:
+                    mdr_error[p].append((x, testerror[p].tolist()))
+                phenotype_candidates[p] += 1
+                candidate_pairs += 1
+            if top_k:
+                for p, top in enumerate(top_pairs):
+                    top.push(cumulative_error[p], x, testerror[p])
+        if buffered:
+            cumulative_histogram += error_histogram(cumulative_errors[:buffered], mdr_config["CV_sets"])
 
         # timer_3 = timeit.default_timer()
         timer_3 = time.time()
-        # Save results to file
-        if len(mdr_error) > 0:
-            output_path = f"{mdr_config['output_key']}/{one_slice.chunk_id}-{other_slice.chunk_id}.vcf.gz"
-            save_output(storage, mdr_config["bucket"], output_path, mdr_error)
+        # Save results to file, one per phenotype (in the background with prefetch)
+        output_paths = []
+        uploads = []
+        for p, phenotype_error in enumerate(mdr_error):
+            if len(phenotype_error) > 0:
+                output_key = phenotype_output_key(mdr_config["output_key"], names, p)
+                output_path = pair_output_key(output_key, mdr_config["dataset"], one_slice, other_slice)
+                uploads.append((save_output, (storage, mdr_config["bucket"], output_path, phenotype_error)))
+                output_paths.append(output_path)
+        uploader.submit(len(time_breakdown), uploads)
 
         # timer_4 = timeit.default_timer()
         timer_4 = time.time()
         print(
             f"    > MDR applied to {total_pairs} pairs by worker {worker_id}.",
-            f"    > Saving {candidate_pairs} MDRERROR to file {output_path}."
-            if len(mdr_error) > 0
+            f"    > Saving {candidate_pairs} MDRERROR to files {output_paths}."
+            if candidate_pairs > 0
             else "    > No candidate pairs found. Skipping output file.",
             f"    > {one_slice.chunk_id} and {other_slice.chunk_id} combined in {timer_4 - timer_1}.",
             f"    > COMBS/SEC/CORE: {total_pairs / (timer_4 - timer_1)}",
@@ -376,21 +302,45 @@ def process_files(
         all_candidates += candidate_pairs
         # pair init -> read slices -> MDR -> save output
         time_breakdown.append([timer_1, timer_2, timer_3, timer_4])
+        fetch_times.append([t_fetch, t_fetched])
+        pair_ids.append((one_slice_id, other_slice_id))
+        reporter.update(len(time_breakdown), all_pairs, all_candidates, total_pairs / (timer_4 - timer_1), cache_hits)
+        timer_1 = time.time()
 
+    uploader.close()
     # timer_03 = timeit.default_timer()
     timer_03 = time.time()
     total_time = timer_03 - timer_00
+    reporter.update(len(time_breakdown), all_pairs, all_candidates, 0.0, cache_hits, done=True)
+    reporter.close()
+    if stage is not None and stage.release():
+        print(f"Worker {worker_id} removed the stage directory {stage.path}")
     return {
         "total_time": total_time,
         "total_pairs": all_pairs,
         "candidate_pairs": all_candidates,
+        "cache_hits": cache_hits,
+        "slice_reads": batcher.reads,
+        "stage_time": stage.stage_time if stage else 0.0,
+        "staged_bytes": stage.staged_bytes if stage else 0,
+        "phenotype_candidates": phenotype_candidates,
+        "error_histogram": cumulative_histogram,
+        "top_pairs": [top.items() for top in top_pairs] if top_k else None,
         "worker_times": [
             timer_00,  # start
             timer_01,  # load inputs + slice partitioning
             timer_02,  # parse labels
             timer_03,  # all MDR chunk pairs
         ],
-        "mdr_breakdown": time_breakdown,
+        "mdr_breakdown": np.array(time_breakdown, dtype=np.float64).reshape(-1, 4),
+        # background read start -> read end -> upload end, overlapping the breakdown with prefetch
+        "mdr_overlap": np.column_stack(
+            [
+                np.array(fetch_times, dtype=np.float64).reshape(-1, 2),
+                [uploader.upload_end[i] for i in range(len(time_breakdown))],
+            ]
+        ),
+        "mdr_pairs": np.array(pair_ids, dtype=np.int32).reshape(-1, 2),
     }
 
 
@@ -428,39 +378,92 @@ def compute_chunk_ranges_balanced(n_tasks, n_workers):
     return chunk_ranges
 
 
-def compute_combinations(workers, num_chunks, mdr_config):
-    """ "Main driver code."""
+def compute_combinations(workers, num_chunks, mdr_config, previous_job=None):
+    """ "Main driver code.
+
+    With `previous_job`, only the pairs involving slices not covered by that run are computed.
+    """
     # timer_start = timeit.default_timer()
     timer_start = time.time()
-    co = CloudObject.from_bucket_key(VCF, mdr_config["bucket"], mdr_config["samples_key"])
-    # Preprocessing only once per file
-    parallel_config = {"verbose": 10}
-    co.preprocess(parallel_config=parallel_config, debug=True, force=True)
-    print(co)
-
-    slice_ids = list(range(0, num_chunks))[mdr_config["chunk_start"]: mdr_config["chunk_end"]]
-    paired_slice_ids = list(combinations_with_replacement(slice_ids, 2))
+    runtime_memory = 1024
+    cloud_objects = preprocess_dataset(mdr_config["bucket"], mdr_config["samples_keys"])
+    sizes = [co.size for co in cloud_objects]
+    body_offsets = [co["body_offset"] for co in cloud_objects]
+    input_bytes = sum(size - offset for size, offset in zip(sizes, body_offsets))
+
+    # Number of patients, checked by workers and recorded to calibrate the planner
+    res = cloud_objects[0].storage.get_object(Bucket=mdr_config["bucket"], Key=mdr_config["patients_keys"][0])
+    mdr_config["n_patients"] = len(parse_labels(res["Body"].read().decode("utf-8")))
+
+    auto_plan = None
+    if mdr_config["auto"] is not None and previous_job is None:
+        # Only the driver needs the planner (and its plotting dependencies)
+        from mdr_planner import calibrate, calibration_runs, plan
+
+        calibration = mdr_config["auto"] or calibration_runs(mdr_config["plots"])
+        if not calibration:
+            raise ValueError(f"No previous results in {mdr_config['plots']} to calibrate --auto with")
+        model = calibrate(calibration)
+        auto_plan = plan(model, input_bytes, mdr_config["n_patients"], workers, runtime_memory)[0]
+        workers, num_chunks = auto_plan["workers"], auto_plan["num_chunks"]
+        print(f"Auto plan from {len(calibration)} runs: {auto_plan}")
+
+    if previous_job is not None:
+        dataset, covered, new_ids = plan_increment(
+            previous_job, mdr_config, mdr_config["samples_keys"], sizes, body_offsets
+        )
+        paired_slice_ids = incremental_pairs(covered, new_ids)
+        mdr_config["covered_slices"] = merge_ranges(covered + [[i, i + 1] for i in new_ids])
+        print(f"Incremental run: {len(new_ids)} new slices, previously covered {covered}")
+    else:
+        # Intra-file and cross-file pairs, all in one global id space
+        dataset = new_dataset(mdr_config["samples_keys"], sizes, body_offsets, num_chunks)
+        slice_ids = list(range(0, num_slices(dataset)))[mdr_config["chunk_start"]: mdr_config["chunk_end"]]
+        paired_slice_ids = list(combinations_with_replacement(slice_ids, 2))
+        mdr_config["covered_slices"] = merge_ranges([[i, i + 1] for i in slice_ids])
+    mdr_config["dataset"] = dataset
+    num_chunks = num_slices(dataset)
+    # Partition every file once here, workers only get the slices of their pairs
+    data_slices = partition_dataset(mdr_config["bucket"], dataset, cloud_objects)
+    co = cloud_objects[0]
+    for sample in dataset["samples"]:
+        print(f"Samples file {sample['key']} ({sample['name']}): {sum(n for n, _ in sample['segments'])} slices")
 
     print(f"Will check {len(paired_slice_ids)} file slice combinations/pairs...")
     # for num, (one, other) in enumerate(paired_slices):
     #     print(f"    > Pair {num} > Slices {one.chunk_id}-{other.chunk_id}")
 
     chunk_ranges = compute_chunk_ranges_balanced(len(paired_slice_ids), workers)
+    fexec = lithops.FunctionExecutor(runtime_memory=runtime_memory, runtime_timeout=43200)
+    if mdr_config["stage_dir"]:
+        mdr_config["stage_id"] = fexec.executor_id
+    if mdr_config["telemetry_interval"] != 0:
+        mdr_config["telemetry"] = telemetry_config(fexec, mdr_config["output_key"], mdr_config["telemetry_interval"])
     iterdata = []
     for id, (start, end) in enumerate(chunk_ranges):
         print(f"Worker {id} > Pairs {start}-{end}")
         input_file = f"{mdr_config['bucket']}.meta/input/{id}.pickle"
         worker_pairs = paired_slice_ids[start:end]
-        worker_input = (id, num_chunks, worker_pairs, mdr_config)
+        worker_input = (id, num_chunks, worker_pairs, worker_slices(data_slices, worker_pairs), mdr_config)
         pickle.dump(worker_input, open(input_file, "wb"), -1)
         iterdata.append(input_file)
 
     # timer_preprocess = timeit.default_timer()
     timer_preprocess = time.time()
     print("Running workers...")
-    fexec = lithops.FunctionExecutor(runtime_memory=1024, runtime_timeout=43200)
+    monitor = None
+    if mdr_config.get("telemetry"):
+        monitor = ProgressMonitor(
+            mdr_config["telemetry"],
+            [end - start for start, end in chunk_ranges],
+            storage=co.storage,
+            bucket=mdr_config["bucket"],
+        )
+        monitor.start()
     futures = fexec.map(process_files, iterdata)
     results = fexec.get_result(futures, throw_except=False, threadpool_size=112)
+    if monitor is not None:
+        monitor.stop()
 
     # results = []
     # for id, (start, end) in enumerate(chunk_ranges):
@@ -478,11 +481,16 @@ def compute_combinations(workers, num_chunks, mdr_config):
     times = []
     pairs = []
     candidates = []
+    names = mdr_config["phenotypes"]
+    phenotype_candidates = np.zeros(len(names), dtype=np.int64)
+    cumulative_histogram = np.zeros((len(names), HIST_BINS), dtype=np.int64)
     for result in results:
         if result is not None:
             times.append(result["total_time"])
             pairs.append(result["total_pairs"])
             candidates.append(result["candidate_pairs"])
+            phenotype_candidates += result["phenotype_candidates"]
+            cumulative_histogram += result["error_histogram"]
 
     total_pairs = sum(pairs)
     total_candidates = sum(candidates)
@@ -492,37 +500,69 @@ def compute_combinations(workers, num_chunks, mdr_config):
         # print(times)
         print(f"MDR applied to a total of {total_pairs} pairs")
         print(f"Found a total of {total_candidates} candidate pairs")
+        if len(mdr_config["phenotypes"]) > 1:
+            for name, n in zip(mdr_config["phenotypes"], phenotype_candidates.tolist()):
+                print(f"    > Phenotype {name}: {n} candidate pairs")
         print(f"Total COMBS/SEC: {total_pairs / total_time}")
         print(f"Total COMBS/SEC/CORE: {total_pairs / total_time / workers}")
+        for n in (10**3, 10**6):
+            tolerances = tolerance_for(cumulative_histogram, mdr_config["CV_sets"], n)
+            print(f"Tolerance for ~{n} candidate pairs: {dict(zip(names, tolerances.round(4).tolist()))}")
     else:
         print("MDR functions failed. No results.")
 
-    dataset_name = mdr_config["samples_key"].split("/", 1)[0]
+    dataset_name = mdr_config["samples_keys"][0].split("/", 1)[0]
     execution_name = f"{dataset_name}-{workers}-{num_chunks}[{mdr_config['chunk_start']}-{mdr_config['chunk_end']}]-{fexec.executor_id}"
     worker_stats = [f.stats for f in futures if not f.error]
 
     plots = pathlib.Path(mdr_config["plots"])
     plots.mkdir(parents=True, exist_ok=True)
-    json.dump(worker_stats, open(f"{plots}/{execution_name}-stats.json", "w"))
 
+    # The RabbitMQ URL of the telemetry config holds credentials, keep it out of the saved results
+    saved_config = dict(mdr_config)
+    if saved_config.get("telemetry"):
+        saved_config["telemetry"] = public_telemetry_config(saved_config["telemetry"])
     job_results = {
-        "worker_results": results,
-        "job_results": {
-            "num_workers": workers,
-            "num_chunks": num_chunks,
-            "start_tstmp": timer_start,
-            "preproc_tstmp": timer_preprocess,
-            "end_tstmp": timer_end,
-            "total_time": total_time,
-            "total_pairs": total_pairs,
-            "total_candidates": total_candidates,
-            "score": total_pairs / total_time,
-            "core_store": total_pairs / total_time / workers,
-            "mdr_config": mdr_config,
-        },
+        "num_workers": workers,
+        "num_chunks": num_chunks,
+        "start_tstmp": timer_start,
+        "preproc_tstmp": timer_preprocess,
+        "end_tstmp": timer_end,
+        "total_time": total_time,
+        "input_bytes": input_bytes,
+        "n_patients": mdr_config["n_patients"],
+        "auto_plan": auto_plan,
+        "total_pairs": total_pairs,
+        "total_candidates": total_candidates,
+        "phenotype_candidates": dict(zip(mdr_config["phenotypes"], phenotype_candidates.tolist())),
+        "score": total_pairs / total_time,
+        "core_store": total_pairs / total_time / workers,
+        "mdr_config": saved_config,
     }
 
-    json.dump(job_results, open(f"{plots}/{execution_name}-results.json", "w"))
+    if mdr_config["top_k"]:
+        # Merge the best pairs of all workers, one output per phenotype
+        for p, name in enumerate(names):
+            top = merge_topk([result["top_pairs"][p] for result in results if result is not None], mdr_config["top_k"])
+            output_key = phenotype_output_key(mdr_config["output_key"], names, p)
+            output_path = f"{output_key}/top{mdr_config['top_k']}-{fexec.executor_id}.vcf.gz"
+            save_output(co.storage, mdr_config["bucket"], output_path, [(pair, testerror) for _, pair, testerror in top])
+            print(f"Saved the {len(top)} best pairs of {name} to {output_path}")
+
+    save_results(f"{plots}/{execution_name}-results", results, job_results, worker_stats)
+    np.save(f"{plots}/{execution_name}-results/error_histogram.npy", cumulative_histogram)
+    update_manifest(
+        co.storage,
+        mdr_config["bucket"],
+        mdr_config["output_key"],
+        {
+            "execution_name": execution_name,
+            "incremental": previous_job is not None,
+            "slice_pairs": len(paired_slice_ids),
+            "dataset": dataset,
+            "covered_slices": mdr_config["covered_slices"],
+        },
+    )
 
     print(f"Plotting the execution... {execution_name}")
     fexec.plot(dst=f"{plots}/{execution_name}")
@@ -531,7 +571,7 @@ def compute_combinations(workers, num_chunks, mdr_config):
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="MDR compute.")
     parser.add_argument("config_file", type=str, help="Path to the YAML config file")
-    parser.add_argument("-w", "--nworkers", type=int, help="Number of workers")
+    parser.add_argument("-w", "--nworkers", type=int, help="Number of workers (the maximum with --auto)")
     parser.add_argument("-c", "--nchunks", type=int, help="Number of partitions of the samples file to make")
     parser.add_argument(
         "-s",
@@ -557,14 +597,79 @@ if __name__ == "__main__":
         default="plots",
         required=False,
     )
+    parser.add_argument(
+        "-i",
+        "--incremental",
+        type=str,
+        help="Results directory of a previous run. Only pairs with slices it did not cover are computed, "
+        "and written to its output. -s/-e then limit the new slices (by default, all the uncovered ones).",
+        default=None,
+        required=False,
+    )
+    parser.add_argument(
+        "-a",
+        "--auto",
+        type=str,
+        nargs="*",
+        help="Choose the number of chunks and workers with mdr_planner.py, calibrated with these results "
+        "(by default, all the runs in the plots directory that record their input size). -c is ignored. "
+        "Not allowed with -i, incremental runs keep the partitioning of the previous run.",
+        default=None,
+        required=False,
+    )
+    parser.add_argument(
+        "-k",
+        "--top-k",
+        type=int,
+        help="Keep only the K pairs with the lowest cumulative error of each worker, merged into K per phenotype, "
+        "instead of all the pairs under prediction_power_tol.",
+        default=None,
+        required=False,
+    )
+    parser.add_argument(
+        "--stage",
+        type=str,
+        help="Node-local directory to stage slices to before computing, e.g. '$TMPDIR' or the GekkoFS mount. "
+        "Expanded on each worker. (Empty means reading from the storage root)",
+        default=None,
+        required=False,
+    )
+    parser.add_argument(
+        "--coalesce",
+        type=int,
+        help="Upcoming slices of a worker to read together, merging adjacent byte ranges into one request. "
+        "Each one is held in memory until used. (1 reads slices one by one)",
+        default=8,
+        required=False,
+    )
+    parser.add_argument(
+        "--prefetch",
+        type=int,
+        help="Slice pairs to read ahead in the background while computing, and uploads in flight. "
+        "Each one holds the parsed slices of a pair in memory. (0 means a serial loop)",
+        default=1,
+        required=False,
+    )
+    parser.add_argument(
+        "-t",
+        "--telemetry",
+        type=float,
+        help="Seconds between worker progress reports. (Empty means 5x the Lithops monitoring_interval, 0 disables)",
+        default=None,
+        required=False,
+    )
 
     args = parser.parse_args()
+    if args.auto is not None and args.incremental:
+        parser.error("--auto cannot be used with -i/--incremental, which keeps the chunks of the previous run")
     config_file = args.config_file
     workers = args.nworkers
     nchunks = args.nchunks
     chunk_start = args.start
     chunk_end = args.end
     plots_dir = args.plots
+    telemetry_interval = args.telemetry
+    previous_job = load_summary(args.incremental)["job_results"] if args.incremental else None
 
     with open(config_file, "r") as file:
         config = yaml.safe_load(file)
@@ -579,9 +684,13 @@ if __name__ == "__main__":
     # MDR PARAMETERS
     mdr_config = {
         "bucket": config["root_path"],
-        "samples_key": config["samples_file"],
-        "patients_key": config["patients_file"],
-        "output_key": f"{config['output_dir']}/nchks-{str(nchunks)}[{chunk_start}-{chunk_end}]",
+        "samples_keys": read_manifest(config),
+        "patients_keys": read_phenotypes(config),
+        "output_key": (
+            previous_job["mdr_config"]["output_key"]
+            if previous_job
+            else f"{config['output_dir']}/nchks-{'auto' if args.auto is not None else str(nchunks)}[{chunk_start}-{chunk_end}]"
+        ),
         "plots": plots_dir,
         "chunk_start": chunk_start,
         "chunk_end": chunk_end,
@@ -589,10 +698,17 @@ if __name__ == "__main__":
         "CV_sets": config["CV_sets"],
         "filter_imp": config["filter_imp"],  # FIXME unused?
         "prediction_power_tol": config["prediction_power_tol"],
+        "telemetry_interval": telemetry_interval,
+        "auto": args.auto,
+        "top_k": args.top_k,
+        "stage_dir": args.stage,
+        "prefetch": args.prefetch,
+        "coalesce": args.coalesce,
     }
+    mdr_config["phenotypes"] = phenotype_names(mdr_config["patients_keys"])
 
     # Compute all combinations
     print("Starting to compute all the combinations ...")
     print(f"Workers: {workers}, Chunks: {nchunks}, Range: {chunk_start}-{chunk_end}")
-    compute_combinations(workers, nchunks, mdr_config)
+    compute_combinations(workers, nchunks, mdr_config, previous_job)
     print(f"    > Total execution time {timeit.default_timer() - timer_0}")
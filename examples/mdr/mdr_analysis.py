@@ -0,0 +1,219 @@
+# /usr/bin/env python3
+"""
+Analysis of MDR job results. Loads one or many runs into flat NumPy columns
+(one row per slice pair) and renders timelines, phase histograms and per-worker
+utilization without per-pair Python loops.
+
+Runs are read from columnar `-results` directories (memory-mapped, see
+`mdr_results.py`) or from the `-results.json` files of older runs.
+"""
+
+import argparse
+import csv
+import gc
+import json
+import os
+import pathlib
+
+import numpy as np
+
+from mdr_plot import create_phase_histograms, create_timeline, create_utilization_plot
+from mdr_results import load_results
+
+PHASES = ("read", "compute", "write")
+
+
+def run_name(results_file):
+    """Name of a run, taken from its results file name."""
+    name = pathlib.Path(results_file).name
+    for suffix in ("-results.json", ".json", "-results"):
+        if name.endswith(suffix):
+            return name[: -len(suffix)]
+    return name
+
+
+def columns_from_results(results):
+    """Flatten nested `worker_results` into per-pair and per-worker NumPy columns."""
+    worker_results = results["worker_results"]
+    n_workers = len(worker_results)
+
+    breakdowns = []
+    pair_counts = np.zeros(n_workers, dtype=np.int64)
+    worker_times = np.full((n_workers, 4), np.nan)
+    total_time = np.full(n_workers, np.nan)
+    total_pairs = np.zeros(n_workers, dtype=np.int64)
+    candidate_pairs = np.zeros(n_workers, dtype=np.int64)
+    for i, result in enumerate(worker_results):
+        if result is None:
+            continue
+        breakdown = np.asarray(result["mdr_breakdown"], dtype=np.float64).reshape(-1, 4)
+        breakdowns.append(breakdown)
+        pair_counts[i] = len(breakdown)
+        worker_times[i] = result["worker_times"]
+        total_time[i] = result["total_time"]
+        total_pairs[i] = result["total_pairs"]
+        candidate_pairs[i] = result["candidate_pairs"]
+
+    breakdown = np.concatenate(breakdowns) if breakdowns else np.empty((0, 4))
+    return {
+        "job": results["job_results"],
+        "worker": np.repeat(np.arange(n_workers, dtype=np.int32), pair_counts),
+        "t_init": breakdown[:, 0],
+        "t_read": breakdown[:, 1],
+        "t_compute": breakdown[:, 2],
+        "t_write": breakdown[:, 3],
+        "worker_times": worker_times,
+        "total_time": total_time,
+        "total_pairs": total_pairs,
+        "candidate_pairs": candidate_pairs,
+    }
+
+
+def load_run(results_file):
+    """Load a run as columns.
+
+    Columnar runs are memory-mapped. Legacy JSON runs are parsed whole, and the
+    nested structure is released right after flattening.
+    """
+    if os.path.isdir(results_file):
+        run = load_results(results_file)
+    else:
+        with open(results_file, "r") as f:
+            results = json.load(f)
+        run = columns_from_results(results)
+        del results
+        gc.collect()
+    run["name"] = run_name(results_file)
+    return run
+
+
+def phase_durations(run):
+    """Durations of the read, compute and write phase of every slice pair."""
+    return {
+        "read": run["t_read"] - run["t_init"],
+        "compute": run["t_compute"] - run["t_read"],
+        "write": run["t_write"] - run["t_compute"],
+    }
+
+
+def worker_utilization(run):
+    """Per-worker busy time for each phase, as a fraction of the worker lifetime."""
+    n_workers = len(run["total_time"])
+    span = run["worker_times"][:, 3] - run["worker_times"][:, 0]
+    span = np.where(span > 0, span, np.nan)
+
+    utilization = {"worker": np.arange(n_workers), "span": span}
+    busy = np.zeros(n_workers)
+    for phase, durations in phase_durations(run).items():
+        phase_time = np.bincount(run["worker"], weights=durations, minlength=n_workers)
+        utilization[phase] = phase_time / span
+        busy += phase_time
+    utilization["busy"] = busy / span
+    utilization["pairs"] = np.bincount(run["worker"], minlength=n_workers)
+    return utilization
+
+
+def hidden_fraction(exposed, background):
+    """Fraction of the background time (reads or uploads) not exposed in the breakdown."""
+    total = np.nansum(background)
+    if not total:
+        return float("nan")
+    return float(np.nansum(np.clip(background - exposed, 0, None)) / total)
+
+
+def run_summary(run):
+    """One summary row for a run."""
+    job = run["job"]
+    work_time = job["end_tstmp"] - job["preproc_tstmp"]
+    durations = phase_durations(run)
+    utilization = worker_utilization(run)
+    summary = {
+        "run": run["name"],
+        "num_workers": job["num_workers"],
+        "num_chunks": job["num_chunks"],
+        "slice_pairs": len(run["worker"]),
+        "total_pairs": job["total_pairs"],
+        "total_candidates": job["total_candidates"],
+        "total_time": job["total_time"],
+        "preproc_time": job["preproc_tstmp"] - job["start_tstmp"],
+        "combs_sec": job["total_pairs"] / job["total_time"],
+        "combs_sec_no_preproc": job["total_pairs"] / work_time,
+        "combs_sec_core": job["total_pairs"] / work_time / job["num_workers"],
+    }
+    for phase in PHASES:
+        summary[f"mean_{phase}"] = float(np.mean(durations[phase])) if len(durations[phase]) else float("nan")
+        summary[f"p99_{phase}"] = (
+            float(np.percentile(durations[phase], 99)) if len(durations[phase]) else float("nan")
+        )
+    if "t_fetch_start" in run:
+        summary["hidden_read"] = hidden_fraction(durations["read"], run["t_fetch_end"] - run["t_fetch_start"])
+        summary["hidden_write"] = hidden_fraction(durations["write"], run["t_upload_end"] - run["t_compute"])
+    else:
+        summary["hidden_read"] = summary["hidden_write"] = float("nan")
+    summary["mean_utilization"] = float(np.nanmean(utilization["busy"])) if run["worker"].size else float("nan")
+    return summary
+
+
+def write_csv(rows, dst):
+    with open(dst, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def analyze(results_files, outdir, width=1600, height=900, max_segments=20000):
+    """Render per-run plots and a summary CSV for every results file."""
+    os.makedirs(outdir, exist_ok=True)
+    summaries = []
+    durations = {}
+    for results_file in results_files:
+        run = load_run(results_file)
+        prefix = os.path.join(outdir, run["name"])
+        print(f"Analyzing {run['name']}: {len(run['total_time'])} workers, {len(run['worker'])} slice pairs")
+
+        summary = run_summary(run)
+        summaries.append(summary)
+        for phase in PHASES:
+            print(f"    > Average {phase} time: {summary[f'mean_{phase}']} s")
+        print(f"    > Total COMBS/SEC: {summary['combs_sec']}")
+        if not np.isnan(summary["hidden_read"]):
+            print(f"    > Hidden by prefetch: {summary['hidden_read']:.1%} of reads, {summary['hidden_write']:.1%} of writes")
+
+        utilization = worker_utilization(run)
+        write_csv(
+            [dict(zip(utilization.keys(), row)) for row in zip(*utilization.values())],
+            f"{prefix}_utilization.csv",
+        )
+        create_timeline(run, prefix, width=width, height=height, max_segments=max_segments)
+        create_utilization_plot(utilization, f"{prefix}_utilization.png")
+
+        durations[run["name"]] = phase_durations(run)
+        del run
+
+    create_phase_histograms(durations, os.path.join(outdir, "phase_histograms.png"))
+    write_csv(summaries, os.path.join(outdir, "summary.csv"))
+    print(f"Summary of {len(summaries)} runs saved to {os.path.join(outdir, 'summary.csv')}")
+    return summaries
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="MDR results analysis.")
+    parser.add_argument(
+        "results_files", type=str, nargs="+", help="Paths to MDR results directories (or legacy JSON files)"
+    )
+    parser.add_argument("-o", "--outdir", type=str, help="Directory for the analysis output", default="plots/analysis")
+    parser.add_argument("--width", type=int, help="Timeline resolution in pixels (time axis)", default=1600)
+    parser.add_argument("--height", type=int, help="Timeline resolution in pixels (worker axis)", default=900)
+    parser.add_argument(
+        "--max-segments",
+        type=int,
+        help="Above this many slice pairs, the timeline is rasterized to the plot resolution",
+        default=20000,
+    )
+    args = parser.parse_args()
+
+    for results_file in args.results_files:
+        if not os.path.exists(results_file):
+            raise FileNotFoundError(f"{results_file} does not exist!")
+
+    analyze(args.results_files, args.outdir, args.width, args.height, args.max_segments)
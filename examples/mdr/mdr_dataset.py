@@ -0,0 +1,289 @@
+"""
+MDR datasets made of one or many VCF files sharing one patients file.
+
+Each file is partitioned independently, with a number of chunks proportional
+to its size so that all slices are about the same size. Slices of all files
+share one global id space, so intra-file and cross-file slice pairs are
+scheduled together without concatenating the files.
+
+A dataset is a plain dict, stored in the MDR config of every run:
+
+    samples: one entry per file, with its storage `key`, a short `name` used to
+             tag outputs, and its partition `segments` as [num_chunks, end_offset].
+             The first segment starts at the VCF body offset, and each following
+             one where the previous ends (see `partition_segments`).
+    layout:  blocks of global slice ids, as [file index, first local chunk id, num_chunks].
+             Blocks are only ever appended, so global ids never change.
+"""
+
+import pathlib
+from collections import defaultdict
+from math import ceil
+
+from dataplug.entities import PartitioningStrategy
+from dataplug.fileobject import CloudObject
+from dataplug.formats.genomics.vcf import VCF, VCFSlice, partition_num_chunks
+
+
+@PartitioningStrategy(dataformat=VCF)
+def partition_segments(cloud_object, segments, padding=256):
+    """
+    This partition strategy chunks each segment of a VCF file in a fixed number of chunks.
+    A single segment ending at the file size is the same as `partition_num_chunks`.
+    """
+    num_chunks = sum(n for n, _ in segments)
+    size = cloud_object.size
+
+    slices = []
+    seg_start = cloud_object["body_offset"]
+    for seg_chunks, seg_end in segments:
+        chunk_size = ceil((seg_end - seg_start) / seg_chunks)
+        for i in range(seg_chunks):
+            chunk_id = len(slices)
+            r0 = (chunk_size * i) + seg_start
+            r1 = min(r0 + chunk_size - 1, seg_end - 1)  # one less because ranges are inclusive
+            # Read one extra byte from the previous chunk, we will check if it is a newline
+            r0 = r0 - 1 if chunk_id != 0 else r0
+            r1 = (size - 1) if r1 > size else r1
+            data_slice = VCFSlice(range_0=r0, range_1=r1, chunk_id=chunk_id, num_chunks=num_chunks, padding=padding)
+            slices.append(data_slice)
+        seg_start = seg_end
+
+    return slices
+
+
+def read_manifest(config):
+    """Samples files of an MDR config: `samples_files` list, `samples_manifest` file, or a single `samples_file`."""
+    if "samples_files" in config:
+        return list(config["samples_files"])
+    if "samples_manifest" in config:
+        with open(config["samples_manifest"], "r") as f:
+            return [line.strip() for line in f if line.strip() and not line.startswith("#")]
+    return [config["samples_file"]]
+
+
+def sample_names(keys):
+    """Short unique names of the samples files, to tag outputs with their source."""
+    names = []
+    for key in keys:
+        name = pathlib.Path(key).name.split(".", 1)[0]
+        while name in names:
+            name = f"{name}_{len(names)}"
+        names.append(name)
+    return names
+
+
+def new_dataset(keys, sizes, body_offsets, num_chunks):
+    """Partition every file in a number of chunks proportional to its body size, `num_chunks` in total."""
+    bodies = [size - offset for size, offset in zip(sizes, body_offsets)]
+    total = sum(bodies)
+    samples = []
+    layout = []
+    for i, (key, name, size, body) in enumerate(zip(keys, sample_names(keys), sizes, bodies)):
+        n = max(1, round(num_chunks * body / total))
+        samples.append({"key": key, "name": name, "segments": [[n, size]]})
+        layout.append([i, 0, n])
+    return {"samples": samples, "layout": layout}
+
+
+def extend_dataset(dataset, keys, sizes, body_offsets):
+    """Add slices for bytes appended to known files and for new files, keeping all existing slice ids.
+
+    New slices are made with the chunk size of the first file, so they stay about the same size.
+    """
+    known = [s["key"] for s in dataset["samples"]]
+    if keys[: len(known)] != known:
+        raise ValueError(f"Samples files can only be appended to the dataset: {known} is not a prefix of {keys}")
+
+    samples = [{**s, "segments": [list(seg) for seg in s["segments"]]} for s in dataset["samples"]]
+    layout = [list(block) for block in dataset["layout"]]
+    first = samples[0]["segments"][0]
+    chunk_size = ceil((first[1] - body_offsets[0]) / first[0])
+
+    for i, (sample, size) in enumerate(zip(samples, sizes)):
+        last_end = sample["segments"][-1][1]
+        if size < last_end:
+            raise ValueError(f"Samples file {sample['key']} shrank from {last_end} to {size} bytes. Run a full MDR instead.")
+        if size > last_end:
+            n = ceil((size - last_end) / chunk_size)
+            layout.append([i, sum(seg[0] for seg in sample["segments"]), n])
+            sample["segments"].append([n, size])
+
+    names = sample_names(keys)
+    for i in range(len(known), len(keys)):
+        n = ceil((sizes[i] - body_offsets[i]) / chunk_size)
+        samples.append({"key": keys[i], "name": names[i], "segments": [[n, sizes[i]]]})
+        layout.append([i, 0, n])
+    return {"samples": samples, "layout": layout}
+
+
+def num_slices(dataset):
+    return sum(n for _, _, n in dataset["layout"])
+
+
+def slice_sources(dataset):
+    """(file index, local chunk id) of every global slice id."""
+    return [(f, first + i) for f, first, n in dataset["layout"] for i in range(n)]
+
+
+def preprocess_dataset(bucket, keys):
+    """Preprocess every samples file (driver side). Returns the cloud objects."""
+    cloud_objects = []
+    parallel_config = {"verbose": 10}
+    for key in keys:
+        co = CloudObject.from_bucket_key(VCF, bucket, key)
+        # Preprocessing only once per file
+        co.preprocess(parallel_config=parallel_config, debug=True, force=True)
+        print(co)
+        cloud_objects.append(co)
+    return cloud_objects
+
+
+def partition_dataset(bucket, dataset, cloud_objects=None):
+    """Slices of a dataset, indexed by global slice id.
+
+    Partitioned once on the driver, with the already preprocessed `cloud_objects` of the samples files if given,
+    and sent to each worker with `worker_slices`.
+    """
+    file_slices = []
+    for i, sample in enumerate(dataset["samples"]):
+        if cloud_objects is not None:
+            co = cloud_objects[i]
+        else:
+            co = CloudObject.from_bucket_key(VCF, bucket, sample["key"])
+        if len(sample["segments"]) > 1:
+            file_slices.append(co.partition(partition_segments, segments=sample["segments"]))
+        else:
+            file_slices.append(co.partition(partition_num_chunks, num_chunks=sample["segments"][0][0]))
+    return [file_slices[f][chunk_id] for f, chunk_id in slice_sources(dataset)]
+
+
+def worker_slices(data_slices, paired_slice_ids):
+    """Slices used by the pairs of a worker, by global slice id. Slice 0 is always included for its storage client."""
+    slice_ids = {0} | {slice_id for pair in paired_slice_ids for slice_id in pair}
+    return {slice_id: data_slices[slice_id] for slice_id in sorted(slice_ids)}
+
+
+def pair_output_key(output_key, dataset, one_slice, other_slice):
+    """Output object of a slice pair. Outputs of multi-file datasets are tagged with their source files."""
+    name = f"{one_slice.chunk_id}-{other_slice.chunk_id}.vcf.gz"
+    if len(dataset["samples"]) == 1:
+        return f"{output_key}/{name}"
+    names = {s["key"]: s["name"] for s in dataset["samples"]}
+    one_name = names[one_slice.cloud_object.path.key]
+    other_name = names[other_slice.cloud_object.path.key]
+    return f"{output_key}/{one_name}-{other_name}/{name}"
+
+
+def coalesce_ranges(slices, max_gap=0):
+    """Group slices into as few byte ranges as possible, merging ranges of the same file that overlap,
+    touch, or are at most `max_gap` bytes apart. Returns (cloud object, first byte, last byte, slices) groups.
+    """
+    by_file = defaultdict(list)
+    for data_slice in slices:
+        by_file[data_slice.cloud_object.path.key].append(data_slice)
+
+    groups = []
+    for file_slices in by_file.values():
+        file_slices.sort(key=lambda sl: sl.range_0)
+        group = None
+        for data_slice in file_slices:
+            if group is not None and data_slice.range_0 <= group[2] + 1 + max_gap:
+                group[2] = max(group[2], data_slice.range_1)
+                group[3].append(data_slice)
+            else:
+                group = [data_slice.cloud_object, data_slice.range_0, data_slice.range_1, [data_slice]]
+                groups.append(group)
+    return [tuple(group) for group in groups]
+
+
+def _read_range(cloud_object, r0, r1):
+    res = cloud_object.storage.get_object(
+        Bucket=cloud_object.path.bucket, Key=cloud_object.path.key, Range=f"bytes={r0}-{r1}"
+    )
+    return res["Body"].read()
+
+
+def _split_slice(data_slice, buffer, base):
+    """Lines of a slice within a buffer starting at byte `base`, as `VCFSlice.get` would return them.
+
+    The buffer is extended in place when the last line of the slice goes past its end.
+    """
+    start = data_slice.range_0 - base
+    end = data_slice.range_1 - base + 1
+
+    head = start
+    if data_slice.chunk_id != 0:
+        # Skip a partial first line, it is read by the previous chunk
+        if buffer[start: start + 1] == b"\n":
+            head = start + 1
+        else:
+            newline = buffer.find(b"\n", start, end)
+            head = newline + 1 if newline >= 0 else end
+
+    tail = end
+    if data_slice.chunk_id != data_slice.num_chunks - 1 and buffer[end - 1: end] != b"\n":
+        # Complete the last line with the bytes after the slice
+        newline = buffer.find(b"\n", end)
+        while newline < 0:
+            extra = _read_range(data_slice.cloud_object, base + len(buffer), base + len(buffer) + data_slice.padding - 1)
+            if not extra:
+                newline = len(buffer) - 1
+                break
+            buffer.extend(extra)
+            newline = buffer.find(b"\n", end)
+        tail = newline + 1
+    return buffer[head:tail].decode("utf-8")
+
+
+def fetch_slices(slices, max_gap=0):
+    """Contents of many slices, the same as `VCFSlice.get`, reading adjacent slices with a single range request.
+
+    The header of each file is read once, instead of once per slice.
+    Returns a dict from slice chunk (file key, chunk id) to its contents.
+    """
+    headers = dict()
+    contents = dict()
+    for cloud_object, r0, r1, group in coalesce_ranges(slices, max_gap):
+        key = cloud_object.path.key
+        if key not in headers:
+            res = cloud_object.storage.get_object(Bucket=cloud_object.meta_path.bucket, Key=cloud_object.meta_path.key)
+            headers[key] = res["Body"].read().decode("utf-8")
+        # Read past the last slice, to complete its last line
+        last = min(r1 + group[-1].padding, cloud_object.size - 1)
+        buffer = bytearray(_read_range(cloud_object, r0, last))
+        for data_slice in group:
+            contents[(key, data_slice.chunk_id)] = headers[key] + "\n" + _split_slice(data_slice, buffer, r0)
+    return contents
+
+
+class SliceBatcher:
+    """Read slices ahead in coalesced batches.
+
+    `read_order` is the order in which slice ids will be read. When a slice is
+    not buffered, it is fetched together with the next `batch_size - 1` slices
+    to be read, and buffered until then.
+    """
+
+    def __init__(self, data_slices, read_order, batch_size=1):
+        self.data_slices = data_slices
+        self.read_order = read_order
+        self.batch_size = batch_size
+        self.position = 0
+        self.buffered = dict()
+        self.reads = 0
+
+    def get(self, slice_id):
+        if slice_id not in self.buffered:
+            if self.batch_size <= 1:
+                self.reads += 1
+                return self.data_slices[slice_id].get()
+            while self.position < len(self.read_order) and self.read_order[self.position] != slice_id:
+                self.position += 1
+            batch = list(dict.fromkeys(self.read_order[self.position: self.position + self.batch_size] or [slice_id]))
+            contents = fetch_slices([self.data_slices[i] for i in batch])
+            self.reads += 1
+            for i in batch:
+                data_slice = self.data_slices[i]
+                self.buffered[i] = contents[(data_slice.cloud_object.path.key, data_slice.chunk_id)]
+        return self.buffered.pop(slice_id)
@@ -0,0 +1,100 @@
+"""
+Incremental MDR: screen only the slice pairs involving newly added SNPs.
+
+A run covers a set of slices when all the pairs among them are computed. Given
+the metadata of a previous run, an incremental run schedules new-by-old and
+new-by-new slice pairs only, and writes them into the same candidate store.
+
+SNPs appended to the samples files, or added as new files, become new slices
+with new global ids (see `mdr_dataset.extend_dataset`), so the slices of the
+previous run keep their byte ranges and ids.
+"""
+
+import json
+from itertools import combinations_with_replacement, product
+
+from mdr_dataset import extend_dataset, num_slices, sample_names
+
+
+def merge_ranges(ranges):
+    """Merge overlapping or contiguous [start, end) ranges."""
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def previous_dataset(previous_job):
+    """Dataset of a previous run. Older single-file runs are converted."""
+    previous_config = previous_job["mdr_config"]
+    if "dataset" in previous_config:
+        return previous_config["dataset"]
+    key = previous_config["samples_key"]
+    if "partition_segments" in previous_config:
+        segments = previous_config["partition_segments"]
+    else:
+        # Runs before incremental support always partitioned the whole file
+        print("Previous run has no partition metadata. Assuming an unchanged samples file.")
+        segments = [[previous_job["num_chunks"], None]]
+    layout = []
+    first = 0
+    for n, _ in segments:
+        layout.append([0, first, n])
+        first += n
+    return {"samples": [{"key": key, "name": sample_names([key])[0], "segments": segments}], "layout": layout}
+
+
+def plan_increment(previous_job, mdr_config, keys, sizes, body_offsets):
+    """Dataset, covered slices and new slice ids of an incremental run."""
+    previous_config = dict(previous_job["mdr_config"])
+    if "patients_keys" not in previous_config:
+        previous_config["patients_keys"] = [previous_config["patients_key"]]
+    for key in ("patients_keys", "CV_sets", "prediction_power_tol"):
+        if previous_config[key] != mdr_config[key]:
+            raise ValueError(f"Incremental run must keep '{key}': {previous_config[key]} != {mdr_config[key]}")
+
+    dataset = previous_dataset(previous_job)
+    if dataset["samples"][0]["segments"][-1][1] is None:
+        dataset["samples"][0]["segments"][-1][1] = sizes[0]
+    dataset = extend_dataset(dataset, keys, sizes, body_offsets)
+    num_chunks = num_slices(dataset)
+
+    covered = previous_config.get("covered_slices") or [
+        [previous_config["chunk_start"], previous_config["chunk_end"] or previous_job["num_chunks"]]
+    ]
+    covered = merge_ranges(covered)
+    covered_ids = {i for start, end in covered for i in range(start, end)}
+
+    # By default, screen all slices not covered yet
+    start = mdr_config["chunk_start"] if mdr_config["chunk_start"] is not None else 0
+    end = mdr_config["chunk_end"] if mdr_config["chunk_end"] is not None else num_chunks
+    new_ids = [i for i in range(start, min(end, num_chunks)) if i not in covered_ids]
+    return dataset, covered, new_ids
+
+
+def incremental_pairs(covered, new_ids):
+    """New-by-old and new-by-new slice pairs, as (lower id, higher id)."""
+    old_ids = [i for start, end in covered for i in range(start, end)]
+    pairs = [tuple(sorted(p)) for p in product(old_ids, new_ids)]
+    pairs += list(combinations_with_replacement(new_ids, 2))
+    return sorted(pairs)
+
+
+def update_manifest(storage, bucket, output_key, run_entry):
+    """Merge a run into the `_manifest.json` of a candidate store."""
+    key = f"{output_key}/_manifest.json"
+    try:
+        res = storage.get_object(Bucket=bucket, Key=key)
+        manifest = json.loads(res["Body"].read())
+    except Exception:
+        manifest = {"runs": []}
+    manifest["runs"].append(run_entry)
+    manifest["dataset"] = run_entry["dataset"]
+    manifest["covered_slices"] = merge_ranges(
+        [r for run in manifest["runs"] for r in run["covered_slices"]]
+    )
+    storage.put_object(Bucket=bucket, Key=key, Body=json.dumps(manifest, indent=2).encode("utf-8"))
+    return manifest
@@ -6,7 +6,6 @@ that saves back to storage for workers to read.
 
 import argparse
 import gzip
-import json
 import logging
 import math
 import os
@@ -23,6 +22,8 @@ from dataplug.fileobject import CloudObject
 from dataplug.formats.genomics.vcf import VCF, partition_num_chunks
 # from custom_vcf import VCF, partition_num_chunks
 from dataplug.util import setup_logging
+from mdr_results import save_results
+from mdr_telemetry import ProgressMonitor, ProgressReporter, public_telemetry_config, telemetry_config
 
 
 def parse_labels(labels_data):
@@ -297,7 +298,13 @@ def process_files(
 
     all_pairs = 0
     all_candidates = 0
+    cache_hits = 0
+    loaded_samples = dict()
     time_breakdown = []
+    pair_ids = []
+    reporter = ProgressReporter(
+        mdr_config.get("telemetry"), worker_id, len(paired_slice_keys), storage, mdr_config["bucket"]
+    )
 
     for one_slice_key, other_slice_key in paired_slice_keys:
         # timer_1 = timeit.default_timer()
@@ -312,14 +319,20 @@ def process_files(
         # other_slice_key = slice_keys[other_slice_id]
         print(f"    > Worker {worker_id} > Loading data slices {one_slice_id} and {other_slice_id}.")
 
-        # Read samples files
-        # FIXME: do not download the same slice twice
-        # sample_1 = parse_sample(one_slice.get())
-        res = storage.get_object(Bucket=mdr_config["bucket"], Key=one_slice_key)
-        sample_1 = parse_sample(res["Body"].read().decode("utf-8"))
-        # sample_2 = parse_sample(other_slice.get())
-        res = storage.get_object(Bucket=mdr_config["bucket"], Key=other_slice_key)
-        sample_2 = parse_sample(res["Body"].read().decode("utf-8"))
+        # Read samples files, reusing the slices already loaded for the previous pair
+        samples = dict()
+        for slice_key in (one_slice_key, other_slice_key):
+            if slice_key in samples:
+                cache_hits += 1
+            elif slice_key in loaded_samples:
+                cache_hits += 1
+                samples[slice_key] = loaded_samples[slice_key]
+            else:
+                res = storage.get_object(Bucket=mdr_config["bucket"], Key=slice_key)
+                samples[slice_key] = parse_sample(res["Body"].read().decode("utf-8"))
+        loaded_samples = samples
+        sample_1 = samples[one_slice_key]
+        sample_2 = samples[other_slice_key]
         # timer_2 = timeit.default_timer()
         timer_2 = time.time()
 
@@ -385,21 +398,27 @@ def process_files(
         all_candidates += candidate_pairs
         # pair init -> read slices -> MDR -> save output
         time_breakdown.append([timer_1, timer_2, timer_3, timer_4])
+        pair_ids.append((int(one_slice_id), int(other_slice_id)))
+        reporter.update(len(time_breakdown), all_pairs, all_candidates, total_pairs / (timer_4 - timer_1), cache_hits)
 
     # timer_03 = timeit.default_timer()
     timer_03 = time.time()
     total_time = timer_03 - timer_00
+    reporter.update(len(time_breakdown), all_pairs, all_candidates, 0.0, cache_hits, done=True)
+    reporter.close()
     return {
         "total_time": total_time,
         "total_pairs": all_pairs,
         "candidate_pairs": all_candidates,
+        "cache_hits": cache_hits,
         "worker_times": [
             timer_00,  # start
             timer_01,  # load inputs + slice partitioning
             timer_02,  # parse labels
             timer_03,  # all MDR chunk pairs
         ],
-        "mdr_breakdown": time_breakdown,
+        "mdr_breakdown": np.array(time_breakdown, dtype=np.float64).reshape(-1, 4),
+        "mdr_pairs": np.array(pair_ids, dtype=np.int32).reshape(-1, 2),
     }
 
 
@@ -477,6 +496,9 @@ def compute_combinations(workers, num_chunks, mdr_config):
     #     print(f"    > Pair {num} > Slices {one.chunk_id}-{other.chunk_id}")
 
     chunk_ranges = compute_chunk_ranges_balanced(len(paired_slice_keys), workers)
+    fexec = lithops.FunctionExecutor(runtime_memory=1024, runtime_timeout=43200)
+    if mdr_config["telemetry_interval"] != 0:
+        mdr_config["telemetry"] = telemetry_config(fexec, mdr_config["output_key"], mdr_config["telemetry_interval"])
     iterdata = []
     for id, (start, end) in enumerate(chunk_ranges):
         print(f"Worker {id} > Pairs {start}-{end}")
@@ -489,9 +511,19 @@ def compute_combinations(workers, num_chunks, mdr_config):
     # timer_preprocess = timeit.default_timer()
     timer_preprocess = time.time()
     print("Running workers...")
-    fexec = lithops.FunctionExecutor(runtime_memory=1024, runtime_timeout=43200)
+    monitor = None
+    if mdr_config.get("telemetry"):
+        monitor = ProgressMonitor(
+            mdr_config["telemetry"],
+            [end - start for start, end in chunk_ranges],
+            storage=co.storage,
+            bucket=mdr_config["bucket"],
+        )
+        monitor.start()
     futures = fexec.map(process_files, iterdata)
     results = fexec.get_result(futures, throw_except=False, threadpool_size=112)
+    if monitor is not None:
+        monitor.stop()
 
     # results = []
     # for id, (start, end) in enumerate(chunk_ranges):
@@ -534,38 +566,26 @@ def compute_combinations(workers, num_chunks, mdr_config):
 
     plots = pathlib.Path(mdr_config["plots"])
     plots.mkdir(parents=True, exist_ok=True)
-    json.dump(
-        worker_stats,
-        open(
-            f"{plots}/{execution_name}-stats.json",
-            "w",
-        ),
-    )
 
+    # The RabbitMQ URL of the telemetry config holds credentials, keep it out of the saved results
+    saved_config = dict(mdr_config)
+    if saved_config.get("telemetry"):
+        saved_config["telemetry"] = public_telemetry_config(saved_config["telemetry"])
     job_results = {
-        "worker_results": results,
-        "job_results": {
-            "num_workers": workers,
-            "num_chunks": num_chunks,
-            "start_tstmp": timer_start,
-            "preproc_tstmp": timer_preprocess,
-            "end_tstmp": timer_end,
-            "total_time": total_time,
-            "total_pairs": total_pairs,
-            "total_candidates": total_candidates,
-            "score": total_pairs / total_time,
-            "core_store": total_pairs / total_time / workers,
-            "mdr_config": mdr_config,
-        },
+        "num_workers": workers,
+        "num_chunks": num_chunks,
+        "start_tstmp": timer_start,
+        "preproc_tstmp": timer_preprocess,
+        "end_tstmp": timer_end,
+        "total_time": total_time,
+        "total_pairs": total_pairs,
+        "total_candidates": total_candidates,
+        "score": total_pairs / total_time,
+        "core_store": total_pairs / total_time / workers,
+        "mdr_config": saved_config,
     }
 
-    json.dump(
-        job_results,
-        open(
-            f"{plots}/{execution_name}-results.json",
-            "w",
-        ),
-    )
+    save_results(f"{plots}/{execution_name}-results", results, job_results, worker_stats)
 
     print(f"Plotting the execution... {execution_name}")
     fexec.plot(dst=f"{plots}/{execution_name}")
@@ -600,6 +620,14 @@ if __name__ == "__main__":
         default="plots",
         required=False,
     )
+    parser.add_argument(
+        "-t",
+        "--telemetry",
+        type=float,
+        help="Seconds between worker progress reports. (Empty means 5x the Lithops monitoring_interval, 0 disables)",
+        default=None,
+        required=False,
+    )
 
     args = parser.parse_args()
     config_file = args.config_file
@@ -608,6 +636,7 @@ if __name__ == "__main__":
     chunk_start = args.start
     chunk_end = args.end
     plots_dir = args.plots
+    telemetry_interval = args.telemetry
 
     with open(config_file, "r") as file:
         config = yaml.safe_load(file)
@@ -632,6 +661,7 @@ if __name__ == "__main__":
         "CV_sets": config["CV_sets"],
         "filter_imp": config["filter_imp"],  # FIXME unused?
         "prediction_power_tol": config["prediction_power_tol"],
+        "telemetry_interval": telemetry_interval,
     }
 
     # Compute all combinations
@@ -0,0 +1,95 @@
+"""
+Multi-phenotype MDR: screen the same genotype data against several patients files in one pass.
+
+Slices are read, parsed and encoded once per SNP pair, and the case/control
+counts of all phenotypes and CV sets are computed in one batched contingency
+table. Candidates are written per phenotype, under `<output_key>/<phenotype>/`.
+With a single patients file, outputs keep their usual location.
+"""
+
+import numpy as np
+
+from mdr_dataset import sample_names
+
+N_CODES = 10  # genotype combination codes counted by the contingency table (0-9)
+
+
+def read_phenotypes(config):
+    """Patients files of an MDR config: a `patients_files` list, or a single `patients_file`."""
+    if "patients_files" in config:
+        return list(config["patients_files"])
+    return [config["patients_file"]]
+
+
+def phenotype_names(keys):
+    return sample_names(keys)
+
+
+def phenotype_output_key(output_key, names, phenotype):
+    if len(names) == 1:
+        return output_key
+    return f"{output_key}/{names[phenotype]}"
+
+
+def build_phenotypes(labels, trainset, testset):
+    """Stack the labels of every phenotype and the CV sets into arrays for `mdr_errors`.
+
+    `labels` holds one list of patient labels per phenotype, `trainset` and `testset`
+    one (n_patients x 1) mask per CV set.
+    """
+    n_patients = {len(lab) for lab in labels}
+    if len(n_patients) != 1:
+        raise ValueError(f"All patients files must have the same number of patients, got {sorted(n_patients)}")
+
+    cases = np.array(labels)
+    controls = np.where((cases == 0) | (cases == 1), cases ^ 1, cases)
+    train = np.concatenate(trainset, axis=1).T
+    test = np.concatenate(testset, axis=1).T
+    return {
+        "cases": cases,
+        "controls": controls,
+        "ccratio": cases.sum(axis=1) / controls.sum(axis=1),
+        "first_label": cases[:, 0],
+        "train": train,
+        "test": test,
+        "n_test": test.sum(axis=1),
+    }
+
+
+def count_codes(values):
+    """Occurrences of codes 0-9 along the last axis of a (phenotypes x CV sets x patients) array."""
+    n_phenotypes, cv_sets, _ = values.shape
+    offsets = np.arange(n_phenotypes * cv_sets).reshape(n_phenotypes, cv_sets, 1) * N_CODES
+    valid = (values >= 0) & (values < N_CODES)
+    counts = np.bincount((values + offsets)[valid], minlength=n_phenotypes * cv_sets * N_CODES)
+    return counts.reshape(n_phenotypes, cv_sets, N_CODES)
+
+
+def mdr_errors(patients, phenotypes):
+    """Test error of every phenotype and CV set for one SNP pair, as a (phenotypes x CV sets) array.
+
+    Batched version of `get_risk_array`, with the same results for each phenotype.
+    """
+    masked = patients * phenotypes["train"]
+    sumcases = count_codes(masked * phenotypes["cases"][:, None, :])
+    sumcontrols = count_codes(masked * phenotypes["controls"][:, None, :])
+
+    risk = np.divide(
+        sumcases,
+        sumcontrols,
+        out=np.zeros(sumcases.shape, dtype=float),
+        where=sumcontrols != 0,
+    )
+    ccratio = phenotypes["ccratio"][:, None, None]
+    risk = np.where(risk >= ccratio, 1.0, risk)
+    risk = np.where(risk < ccratio, 0.0, risk)
+
+    # As in apply_risk, the first high risk code is not used to classify
+    high_risk = risk == 1
+    np.put_along_axis(high_risk, high_risk.argmax(axis=2)[..., None], False, axis=2)
+    known = (patients >= 0) & (patients < N_CODES)
+    prediction = (high_risk[:, :, np.clip(patients, 0, N_CODES - 1)] & known).astype(int)
+
+    testerror = (prediction + phenotypes["first_label"][:, None, None]) % 2
+    testerror = ((1 - testerror) * phenotypes["test"]).sum(axis=2)
+    return testerror / phenotypes["n_test"]
@@ -0,0 +1,134 @@
+"""
+Pipelined reads and writes of MDR slice pairs.
+
+`PairLoader` reads and parses the slices of the next pairs in a background
+thread while the current pair computes, keeping up to `depth` pairs ready.
+`Uploader` saves the outputs of a pair in background threads, with up to
+`depth` uploads in flight. With depth 0, both run inline, as a plain loop.
+
+Both record when their background work started and ended, so the breakdown
+can show how much read and write time was hidden behind computation.
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class PairLoader:
+    """Iterate (pair, samples, cache hits, fetch start, fetch end) over slice pairs.
+
+    Slices already loaded for the previous pair are reused instead of read again.
+    `read_slice(slice_id)` returns the parsed samples of a slice.
+    """
+
+    def __init__(self, paired_slice_ids, read_slice, depth=0):
+        self.paired_slice_ids = paired_slice_ids
+        self.read_slice = read_slice
+        self.depth = depth
+
+    @staticmethod
+    def read_order(paired_slice_ids):
+        """Slice ids in the order they are read, leaving out the ones reused from the previous pair."""
+        order = []
+        loaded = set()
+        for pair in paired_slice_ids:
+            order += [slice_id for slice_id in dict.fromkeys(pair) if slice_id not in loaded]
+            loaded = set(pair)
+        return order
+
+    def _load(self):
+        loaded_samples = dict()
+        for pair in self.paired_slice_ids:
+            t_fetch = time.time()
+            samples = dict()
+            cache_hits = 0
+            for slice_id in pair:
+                if slice_id in samples:
+                    cache_hits += 1
+                elif slice_id in loaded_samples:
+                    cache_hits += 1
+                    samples[slice_id] = loaded_samples[slice_id]
+                else:
+                    samples[slice_id] = self.read_slice(slice_id)
+            loaded_samples = samples
+            yield pair, samples, cache_hits, t_fetch, time.time()
+
+    def _prefetch(self, ready, stop):
+        try:
+            for item in self._load():
+                while not stop.is_set():
+                    try:
+                        ready.put(item, timeout=0.5)
+                        break
+                    except queue.Full:
+                        continue
+                if stop.is_set():
+                    return
+        except Exception as e:
+            ready.put(e)
+        ready.put(None)
+
+    def __iter__(self):
+        if self.depth == 0:
+            yield from self._load()
+            return
+
+        ready = queue.Queue(maxsize=self.depth)
+        stop = threading.Event()
+        thread = threading.Thread(target=self._prefetch, args=(ready, stop), daemon=True)
+        thread.start()
+        try:
+            while True:
+                item = ready.get()
+                if item is None:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            stop.set()
+
+
+class Uploader:
+    """Run the uploads of each pair, recording when the last one of every pair ended."""
+
+    def __init__(self, depth=0):
+        self.depth = depth
+        self.upload_end = dict()
+        self._lock = threading.Lock()
+        if depth > 0:
+            self._pool = ThreadPoolExecutor(max_workers=depth)
+            self._slots = threading.Semaphore(depth)
+            self._futures = []
+
+    def _done(self, index):
+        with self._lock:
+            self.upload_end[index] = time.time()
+
+    def _run(self, index, uploads):
+        try:
+            for upload, args in uploads:
+                upload(*args)
+        finally:
+            self._done(index)
+            self._slots.release()
+
+    def submit(self, index, uploads):
+        """Run `uploads`, a list of (function, args), for pair `index`."""
+        if self.depth == 0:
+            for upload, args in uploads:
+                upload(*args)
+            self._done(index)
+            return
+        self._slots.acquire()
+        self._futures.append(self._pool.submit(self._run, index, uploads))
+
+    def close(self):
+        """Wait for all uploads, raising the first error."""
+        if self.depth == 0:
+            return
+        self._pool.shutdown(wait=True)
+        for future in self._futures:
+            future.result()
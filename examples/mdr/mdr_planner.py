@@ -0,0 +1,180 @@
+# /usr/bin/env python3
+"""
+Chunk and worker count planner for MDR.
+
+A cost model is calibrated from the results of previous runs, and used to
+predict the runtime of a new input for every candidate number of chunks:
+
+    pair time   = read latency + slice bytes / read bandwidth
+                  + compute factor * slice bytes^2 / patients + write time
+    runtime     = preprocessing + worker startup + pairs per worker * pair time
+
+Slices of B bytes hold about B / patients SNPs, and each SNP pair costs time
+proportional to the number of patients, so the compute time of a slice pair
+grows with B^2 / patients.
+
+Runs made by `mdr.py` record their input size and number of patients. For older
+runs, pass them with --calibration-size and --calibration-patients.
+"""
+
+import argparse
+import math
+import pathlib
+import re
+
+import numpy as np
+
+from mdr_analysis import load_run, phase_durations
+from mdr_results import load_summary
+
+SIZE_UNITS = {"": 1, "K": 1024, "M": 1024**2, "G": 1024**3, "T": 1024**4}
+
+
+def parse_size(size):
+    """Bytes of a size like 123456, 512M or 1.5G."""
+    match = re.fullmatch(r"\s*([0-9.]+)\s*([KMGT]?)i?B?\s*", str(size), re.IGNORECASE)
+    if match is None:
+        raise ValueError(f"Invalid size: {size}")
+    return int(float(match.group(1)) * SIZE_UNITS[match.group(2).upper()])
+
+
+def run_profile(run, input_bytes=None, n_patients=None):
+    """Slice size, patients and median phase times of one run."""
+    job = run["job"]
+    input_bytes = job.get("input_bytes", input_bytes)
+    n_patients = job.get("n_patients", n_patients)
+    if input_bytes is None or n_patients is None:
+        raise ValueError(
+            f"Run {run.get('name')} has no input size or number of patients. "
+            "Pass --calibration-size and --calibration-patients."
+        )
+    durations = phase_durations(run)
+    if len(durations["read"]) == 0:
+        raise ValueError(f"Run {run.get('name')} has no slice pairs")
+    worker_times = np.asarray(run["worker_times"])
+    return {
+        "slice_bytes": input_bytes / job["num_chunks"],
+        "n_patients": n_patients,
+        "read": float(np.median(durations["read"])),
+        "compute": float(np.median(durations["compute"])),
+        "write": float(np.median(durations["write"])),
+        "startup": float(np.nanmedian(worker_times[:, 2] - worker_times[:, 0])),
+        "preproc": job["preproc_tstmp"] - job["start_tstmp"],
+    }
+
+
+def calibration_runs(plots_dir):
+    """Results of the runs in `plots_dir` that record their input size and number of patients.
+
+    Older runs, including every legacy `-results.json` file, do not and are skipped with a warning.
+    """
+    runs = []
+    for path in sorted(pathlib.Path(plots_dir).glob("*-results*")):
+        job = load_summary(path)["job_results"] if path.is_dir() else {}
+        if job.get("input_bytes") is None or job.get("n_patients") is None:
+            if path.is_dir() or path.suffix == ".json":
+                print(f"Skipping {path} for calibration: no input size or number of patients recorded")
+            continue
+        runs.append(str(path))
+    return runs
+
+
+def calibrate(results_files, input_bytes=None, n_patients=None):
+    """Fit the cost model to the profiles of previous runs."""
+    profiles = [run_profile(load_run(f), input_bytes, n_patients) for f in results_files]
+    slice_bytes = np.array([p["slice_bytes"] for p in profiles])
+    reads = np.array([p["read"] for p in profiles])
+
+    # Read time = latency + bytes / bandwidth, only when runs with different slice sizes are available
+    if len(np.unique(slice_bytes)) > 1:
+        (read_latency, read_per_byte), *_ = np.linalg.lstsq(
+            np.column_stack([np.ones_like(slice_bytes), slice_bytes]), reads, rcond=None
+        )
+    else:
+        read_latency, read_per_byte = 0.0, 0.0
+    if read_latency < 0 or read_per_byte <= 0:
+        read_latency, read_per_byte = 0.0, float(np.median(reads / slice_bytes))
+
+    return {
+        "runs": len(profiles),
+        "read_latency": float(read_latency),
+        "read_per_byte": float(read_per_byte),
+        "compute_factor": float(np.median([p["compute"] * p["n_patients"] / p["slice_bytes"] ** 2 for p in profiles])),
+        "write": float(np.median([p["write"] for p in profiles])),
+        "startup": float(np.median([p["startup"] for p in profiles])),
+        "preproc": float(np.median([p["preproc"] for p in profiles])),
+    }
+
+
+def predict(model, input_bytes, n_patients, num_chunks, workers):
+    """Predicted runtime (seconds) and per pair time of a run."""
+    slice_bytes = input_bytes / num_chunks
+    pair_time = (
+        model["read_latency"]
+        + model["read_per_byte"] * slice_bytes
+        + model["compute_factor"] * slice_bytes**2 / n_patients
+        + model["write"]
+    )
+    pairs = num_chunks * (num_chunks + 1) // 2
+    pairs_per_worker = math.ceil(pairs / min(workers, pairs))
+    return {
+        "num_chunks": num_chunks,
+        "workers": math.ceil(pairs / pairs_per_worker),  # fewest workers with the same pairs per worker
+        "slice_pairs": pairs,
+        "slice_bytes": slice_bytes,
+        "pair_time": pair_time,
+        "runtime": model["preproc"] + model["startup"] + pairs_per_worker * pair_time,
+    }
+
+
+def plan(model, input_bytes, n_patients, max_workers, worker_memory, memory_factor=10, max_chunks=100000):
+    """Candidate plans that fit in the worker memory, fastest first.
+
+    A worker holds about `memory_factor` times the slice size in memory
+    (two raw slices, their parsed samples and the cached previous pair).
+    """
+    usable = worker_memory * 1024**2 * 0.8
+    min_chunks = max(1, math.ceil(input_bytes * memory_factor / usable))
+    if min_chunks > max_chunks:
+        raise ValueError(f"Input needs more than {max_chunks} chunks to fit in {worker_memory} MB workers")
+    candidates = np.unique(np.geomspace(min_chunks, max_chunks, 400).astype(int))
+    plans = [predict(model, input_bytes, n_patients, int(c), max_workers) for c in candidates]
+    return sorted(plans, key=lambda p: (p["runtime"], p["num_chunks"]))
+
+
+def print_plans(plans, top=10):
+    print(f"{'chunks':>8} {'workers':>8} {'pairs':>12} {'slice MB':>10} {'pair s':>10} {'runtime s':>12}")
+    for p in plans[:top]:
+        print(
+            f"{p['num_chunks']:>8} {p['workers']:>8} {p['slice_pairs']:>12} {p['slice_bytes'] / 1024**2:>10.2f}"
+            f" {p['pair_time']:>10.3f} {p['runtime']:>12.1f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="MDR chunk and worker count planner.")
+    parser.add_argument(
+        "results_files", type=str, nargs="+", help="Results of previous runs to calibrate the cost model with"
+    )
+    parser.add_argument("-s", "--input-size", type=str, required=True, help="Size of the samples files (e.g. 50G)")
+    parser.add_argument("-n", "--patients", type=int, required=True, help="Number of patients")
+    parser.add_argument("-w", "--max-workers", type=int, required=True, help="Available workers")
+    parser.add_argument("-m", "--worker-memory", type=int, help="Memory per worker in MB", default=1024)
+    parser.add_argument(
+        "--memory-factor", type=float, help="Worker memory needed, as a multiple of the slice size", default=10
+    )
+    parser.add_argument("--calibration-size", type=str, help="Input size of older runs without it", default=None)
+    parser.add_argument("--calibration-patients", type=int, help="Patients of older runs without it", default=None)
+    parser.add_argument("--top", type=int, help="Number of plans to show", default=10)
+    args = parser.parse_args()
+
+    calibration_size = parse_size(args.calibration_size) if args.calibration_size else None
+    model = calibrate(args.results_files, calibration_size, args.calibration_patients)
+    print(f"Cost model from {model['runs']} runs: {model}")
+
+    plans = plan(
+        model, parse_size(args.input_size), args.patients, args.max_workers, args.worker_memory, args.memory_factor
+    )
+    print_plans(plans, args.top)
+    best = plans[0]
+    print(f"Recommended: -c {best['num_chunks']} -w {best['workers']} (predicted {best['runtime']:.1f} s)")
@@ -1,79 +1,69 @@
-import json
+import argparse
 import os
 import time
 
 import matplotlib.patches as mpatches
 import numpy as np
-import pandas as pd
 import pylab
 import seaborn as sns
 from matplotlib.collections import LineCollection
+from matplotlib.colors import ListedColormap
 
 sns.set_style("whitegrid")
 pylab.switch_backend("Agg")
 
 
-def create_timeline(results, dst, figsize=(10, 6)):
-    job_results = results["job_results"]
-    worker_results = results["worker_results"]
+def phase_segments(starts, ends, rows):
+    """Build an (N, 2, 2) array of [[start, row], [end, row]] line segments."""
+    return np.stack(
+        [np.column_stack([starts, rows]), np.column_stack([ends, rows])],
+        axis=1,
+    )
 
-    for stat in worker_results:
-        stat["mdr_breakdown"] = np.array(stat["mdr_breakdown"])
-    stats_df = pd.DataFrame(worker_results)
-    total_calls = len(stats_df)
-    # print(stats_df.mdr_breakdown)
-    times = stats_df.mdr_breakdown
-    # min_time = times.map(lambda a: a[0, 0]).min()
+
+def rasterize_segments(rows, starts, ends, n_rows, max_time, width, height):
+    """Count the segments covering each pixel of a (height x width) grid.
+
+    Uses difference arrays along the time axis, so the cost is O(N + width * height)
+    regardless of how many segments fall into each pixel.
+    """
+    height = max(1, min(height, n_rows))
+    dt = max_time / width
+    row_bin = (rows.astype(np.int64) * height) // n_rows
+    s = np.clip(np.floor(starts / dt), 0, width - 1).astype(np.int64)
+    e = np.clip(np.ceil(ends / dt), s + 1, width).astype(np.int64)
+
+    flat_size = height * (width + 1)
+    diff = np.bincount(row_bin * (width + 1) + s, minlength=flat_size)
+    diff -= np.bincount(row_bin * (width + 1) + e, minlength=flat_size)
+    return np.cumsum(diff.reshape(height, width + 1)[:, :width], axis=1)
+
+
+def create_timeline(run, dst, figsize=(10, 6), width=1600, height=900, max_segments=20000):
+    """Plot the per-pair read/compute/write breakdown of every worker.
+
+    Up to `max_segments` pairs are drawn as line segments. Bigger runs are
+    downsampled to a (height x width) raster, coloring each pixel with its dominant phase.
+    For runs with prefetch, background reads and uploads are drawn as thin lines
+    below and above each worker line, showing the latency hidden behind computation
+    (line segments only).
+    """
+    job_results = run["job"]
+    total_calls = len(run["total_time"])
     min_time = job_results["start_tstmp"]
-    max_time = (times.map(lambda a: a[-1, -1]).max() - min_time) * 1.25
-
-    read_times = []
-    compute_times = []
-    write_times = []
-    for worker_times in times:
-        for pair_times in worker_times:
-            read_times.append(pair_times[1] - pair_times[0])
-            compute_times.append(pair_times[2] - pair_times[1])
-            write_times.append(pair_times[3] - pair_times[2])
-
-    print("Chunk pair stats")
-    print(f"Average read time: {np.mean(read_times)} s")
-    print(f"Average compute time: {np.mean(compute_times)} s")
-    print(f"Average write time: {np.mean(write_times)} s")
-    print("")
+    rows = run["worker"] + 1  # skip 0 for driver line
+    t_init = run["t_init"] - min_time
+    t_read = run["t_read"] - min_time
+    t_comp = run["t_compute"] - min_time
+    t_writ = run["t_write"] - min_time
+    last = t_writ.max() if len(t_writ) else job_results["end_tstmp"] - min_time
+    max_time = max(last, job_results["end_tstmp"] - min_time) * 1.25
 
     palette = sns.color_palette("deep", 10)
 
     fig = pylab.figure(figsize=figsize)
     ax = fig.add_subplot(1, 1, 1)
 
-    # y = np.arange(total_calls)
-    # point_size = 10
-
-    times = times - min_time
-    # print(times)
-
-    # fields = [
-    #     ("pair init", times.map(lambda row: row[:, 0])),
-    #     ("pair read", times.map(lambda row: row[:, 1])),
-    #     ("pair compute", times.map(lambda row: row[:, 2])),
-    #     ("pair write", times.map(lambda row: row[:, 3])),
-    # ]
-
-    read_segments = []
-    comp_segments = []
-    writ_segments = []
-    for i, row in enumerate(times):
-        i += 1  # skip 0 for driver line
-        init = row[:, 0]
-        read = row[:, 1]
-        comp = row[:, 2]
-        writ = row[:, 3]
-        for j in range(len(init)):
-            read_segments.append([[init[j], i], [read[j], i]])
-            comp_segments.append([[read[j], i], [comp[j], i]])
-            writ_segments.append([[comp[j], i], [writ[j], i]])
-
     preproc_segments = [
         [
             [job_results["start_tstmp"] - min_time, 0],
@@ -98,28 +88,47 @@ def create_timeline(results, dst, figsize=(10, 6)):
     patches.append(mpatches.Patch(color=palette[4], label="wait"))
 
     # Workers breakdown:
-    line_segments = LineCollection(read_segments, linestyles="solid", color=palette[1], alpha=0.8, linewidth=2)
-    ax.add_collection(line_segments)
-    patches.append(mpatches.Patch(color=palette[1], label="read time"))
-    line_segments = LineCollection(comp_segments, linestyles="solid", color=palette[2], alpha=0.8, linewidth=2)
-    ax.add_collection(line_segments)
-    patches.append(mpatches.Patch(color=palette[2], label="compute time"))
-    line_segments = LineCollection(writ_segments, linestyles="solid", color=palette[3], alpha=0.8, linewidth=2)
-    ax.add_collection(line_segments)
-    patches.append(mpatches.Patch(color=palette[3], label="write time"))
-
-    # for f_i, (field_name, val) in enumerate(fields):
-    #     for i, val_row in enumerate(val):
-    #         for ts in val_row:
-    #             ax.scatter(
-    #                 ts,
-    #                 y[i],
-    #                 c=[palette[f_i]],
-    #                 edgecolor="none",
-    #                 s=point_size,
-    #                 alpha=0.8,
-    #             )
-    #     patches.append(mpatches.Patch(color=palette[f_i], label=field_name))
+    phases = [
+        ("read time", t_init, t_read, palette[1]),
+        ("compute time", t_read, t_comp, palette[2]),
+        ("write time", t_comp, t_writ, palette[3]),
+    ]
+    if len(rows) <= max_segments:
+        for label, starts, ends, color in phases:
+            line_segments = LineCollection(
+                phase_segments(starts, ends, rows), linestyles="solid", color=color, alpha=0.8, linewidth=2
+            )
+            ax.add_collection(line_segments)
+            patches.append(mpatches.Patch(color=color, label=label))
+        if "t_fetch_start" in run and job_results.get("mdr_config", {}).get("prefetch"):
+            background = [
+                ("background read", run["t_fetch_start"] - min_time, run["t_fetch_end"] - min_time, -0.3, palette[1]),
+                ("background write", t_comp, run["t_upload_end"] - min_time, 0.3, palette[3]),
+            ]
+            for label, starts, ends, offset, color in background:
+                line_segments = LineCollection(
+                    phase_segments(starts, ends, rows + offset), linestyles="solid", color=color, alpha=0.4, linewidth=1
+                )
+                ax.add_collection(line_segments)
+                patches.append(mpatches.Patch(color=color, alpha=0.4, label=label))
+    else:
+        occupancy = np.stack(
+            [rasterize_segments(rows - 1, s, e, total_calls, max_time, width, height) for _, s, e, _ in phases]
+        )
+        image = np.ma.masked_where(occupancy.sum(axis=0) == 0, occupancy.argmax(axis=0))
+        ax.imshow(
+            image,
+            cmap=ListedColormap([color for _, _, _, color in phases]),
+            vmin=0,
+            vmax=len(phases) - 1,
+            origin="lower",
+            aspect="auto",
+            interpolation="nearest",
+            alpha=0.8,
+            extent=(0, max_time, 0.5, total_calls + 0.5),
+        )
+        for label, _, _, color in phases:
+            patches.append(mpatches.Patch(color=color, label=label))
 
     ax.set_xlabel("Execution Time (sec)")
     ax.set_ylabel("Worker ID")
@@ -155,54 +164,106 @@ def create_timeline(results, dst, figsize=(10, 6)):
         dst = "{}_{}".format(os.path.realpath(dst), "breakdown.pdf")
 
     fig.savefig(dst)
+    pylab.close(fig)
+
+
+def create_phase_histograms(durations, dst, bins=50):
+    """Histogram of slice pair phase durations, one panel per phase and one series per run."""
+    phases = ["read", "compute", "write"]
+    fig, axes = pylab.subplots(nrows=1, ncols=len(phases), figsize=(5 * len(phases), 4))
+    palette = sns.color_palette("deep", max(len(durations), 1))
+
+    for ax, phase in zip(axes, phases):
+        values = [d[phase][d[phase] > 0] for d in durations.values()]
+        values = [v for v in values if len(v)]
+        if values:
+            low = min(v.min() for v in values)
+            high = max(v.max() for v in values)
+            edges = np.geomspace(low, max(high, low * 1.01), bins + 1)
+            for (name, d), color in zip(durations.items(), palette):
+                counts, _ = np.histogram(d[phase], bins=edges)
+                ax.stairs(counts, edges, label=name, color=color)
+            ax.set_xscale("log")
+        ax.set_title(f"{phase} time")
+        ax.set_xlabel("Seconds per slice pair")
+        ax.set_ylabel("Slice pairs")
+
+    if len(durations) <= 10:
+        axes[-1].legend(loc="upper right", fontsize="small")
+    fig.tight_layout()
+
+    dst = os.path.expanduser(dst) if "~" in dst else dst
+    fig.savefig(dst)
+    pylab.close(fig)
+
+
+def create_utilization_plot(utilization, dst, figsize=(10, 4)):
+    """Stacked per-worker read/compute/write share of the worker lifetime."""
+    palette = sns.color_palette("deep", 10)
+    workers = utilization["worker"]
+
+    fig = pylab.figure(figsize=figsize)
+    ax = fig.add_subplot(1, 1, 1)
+    ax.stackplot(
+        workers,
+        np.nan_to_num(utilization["read"]),
+        np.nan_to_num(utilization["compute"]),
+        np.nan_to_num(utilization["write"]),
+        labels=["read time", "compute time", "write time"],
+        colors=[palette[1], palette[2], palette[3]],
+        alpha=0.8,
+        step="mid",
+    )
+    ax.set_xlabel("Worker ID")
+    ax.set_ylabel("Fraction of worker time")
+    ax.set_ylim(0, 1.05)
+    ax.set_xlim(0, max(len(workers) - 1, 1))
+    ax.legend(loc="lower right", frameon=True)
+    fig.tight_layout()
+
+    dst = os.path.expanduser(dst) if "~" in dst else dst
+    fig.savefig(dst)
+    pylab.close(fig)
 
 
 if __name__ == "__main__":
-    results_file = "plots/scaling/synthetic_1.8MSNP_1f_1128p-15-1000[0-5]-d6da09-0-results.json"
-    output_prefix = "plots/scaling/synthetic_1.8MSNP_1f_1128p-15-1000[0-5]-d6da09-0"
+    from mdr_analysis import load_run, run_summary
+
+    parser = argparse.ArgumentParser(description="MDR execution breakdown plot.")
+    parser.add_argument("results_file", type=str, help="Path to the MDR results directory (or legacy JSON file)")
+    parser.add_argument(
+        "-o",
+        "--output-prefix",
+        type=str,
+        help="Prefix for the plot file. (Empty means next to the results)",
+        default=None,
+    )
+    args = parser.parse_args()
+    results_file = args.results_file
 
     if not os.path.exists(results_file):
         raise FileNotFoundError(f"{results_file} does not exist!")
 
-    results = json.load(open(results_file, "r"))
-    job_results = results["job_results"]
-    worker_results = results["worker_results"]
-
-    preproc_time = job_results["preproc_tstmp"] - job_results["start_tstmp"]
-    job_time = job_results["total_time"]
-    work_time = job_results["end_tstmp"] - job_results["preproc_tstmp"]
-    workers = job_results["num_workers"]
-
-    print(f"Job completed in {job_time} s")
-    print(f"Preprocessing in {preproc_time} s")
-
-    times = []
-    pairs = []
-    candidates = []
-    breakdowns = []
-    for result in worker_results:
-        if result is not None:
-            times.append(result["total_time"])
-            pairs.append(result["total_pairs"])
-            candidates.append(result["candidate_pairs"])
-            breakdowns.append(result["mdr_breakdown"])
-
-    total_pairs = sum(pairs)
-    total_candidates = sum(candidates)
-
-    if times:
-        print(f"MDR-function times. Max: {max(times)}")  # to take the worst-case
-        print(f"MDR applied to a total of {total_pairs} pairs")
-        print(f"Found a total of {total_candidates} candidate pairs")
-        print(f"Total COMBS/SEC: {total_pairs / job_time}")
-        print(f"Total COMBS/SEC/CORE: {total_pairs / job_time / workers}")
-        print(f"Without preprocessing. Time: {work_time}")
-        print(f"Total COMBS/SEC: {total_pairs / work_time}")
-        print(f"Total COMBS/SEC/CORE: {total_pairs / work_time / workers}")
+    run = load_run(results_file)
+    summary = run_summary(run)
+    output_prefix = args.output_prefix or os.path.join(os.path.dirname(os.path.normpath(results_file)), run["name"])
+
+    print(f"Job completed in {summary['total_time']} s")
+    print(f"Preprocessing in {summary['preproc_time']} s")
+
+    if summary["slice_pairs"]:
+        print(f"MDR-function times. Max: {np.nanmax(run['total_time'])}")  # to take the worst-case
+        print(f"MDR applied to a total of {summary['total_pairs']} pairs")
+        print(f"Found a total of {summary['total_candidates']} candidate pairs")
+        print(f"Total COMBS/SEC: {summary['combs_sec']}")
+        print(f"Without preprocessing. COMBS/SEC: {summary['combs_sec_no_preproc']}")
+        print(f"Total COMBS/SEC/CORE: {summary['combs_sec_core']}")
+        print("Chunk pair stats")
+        print(f"Average read time: {summary['mean_read']} s")
+        print(f"Average compute time: {summary['mean_compute']} s")
+        print(f"Average write time: {summary['mean_write']} s")
     else:
         print("MDR functions failed. No results.")
 
     print("")
-    plots_dir = os.path.dirname(results_file)
-
-    create_timeline(results, output_prefix)
+    create_timeline(run, output_prefix)
@@ -0,0 +1,110 @@
+"""
+Columnar storage of MDR job results.
+
+A run is saved as a directory with one `.npy` array per field plus a small
+`summary.json`, so analysis code can memory-map only the columns it needs:
+
+    <execution_name>-results/
+        summary.json         job results and MDR config
+        worker.npy           worker id of every slice pair
+        pair_one.npy         first slice id of every slice pair
+        pair_other.npy       second slice id of every slice pair
+        t_init.npy ...       one timestamp column per breakdown phase
+        t_fetch_start.npy .. background read and upload timestamps, if recorded
+        worker_times.npy     (workers x 4) worker timestamps
+        total_time.npy ...   one column per worker counter
+        stats/<key>.npy      one column per numeric Lithops future stat
+"""
+
+import json
+import os
+
+import numpy as np
+
+BREAKDOWN_FIELDS = ["t_init", "t_read", "t_compute", "t_write"]
+OVERLAP_FIELDS = ["t_fetch_start", "t_fetch_end", "t_upload_end"]
+WORKER_FIELDS = ["total_time", "total_pairs", "candidate_pairs", "cache_hits", "slice_reads", "stage_time", "staged_bytes"]
+FLOAT_FIELDS = ["total_time", "stage_time"]
+
+
+def save_results(dst, worker_results, job_results, worker_stats):
+    """Save worker results and Lithops stats of a run as columns under `dst`."""
+    os.makedirs(os.path.join(dst, "stats"), exist_ok=True)
+    n_workers = len(worker_results)
+    ok = np.array([result is not None for result in worker_results], dtype=bool)
+    done = [result for result in worker_results if result is not None]
+
+    breakdown_width = len(BREAKDOWN_FIELDS)
+    breakdowns = [np.asarray(r["mdr_breakdown"], dtype=np.float64).reshape(-1, breakdown_width) for r in done]
+    pairs = [np.asarray(r["mdr_pairs"], dtype=np.int32).reshape(-1, 2) for r in done]
+    counts = np.zeros(n_workers, dtype=np.int64)
+    counts[ok] = [len(b) for b in breakdowns]
+    breakdown = np.concatenate(breakdowns) if breakdowns else np.empty((0, breakdown_width))
+    pair_ids = np.concatenate(pairs) if pairs else np.empty((0, 2), dtype=np.int32)
+
+    np.save(os.path.join(dst, "worker.npy"), np.repeat(np.arange(n_workers, dtype=np.int32), counts))
+    np.save(os.path.join(dst, "pair_one.npy"), np.ascontiguousarray(pair_ids[:, 0]))
+    np.save(os.path.join(dst, "pair_other.npy"), np.ascontiguousarray(pair_ids[:, 1]))
+    for i, field in enumerate(BREAKDOWN_FIELDS):
+        np.save(os.path.join(dst, f"{field}.npy"), np.ascontiguousarray(breakdown[:, i]))
+    if any("mdr_overlap" in r for r in done):
+        overlap_width = len(OVERLAP_FIELDS)
+        overlaps = [
+            np.asarray(r["mdr_overlap"], dtype=np.float64).reshape(-1, overlap_width)
+            if "mdr_overlap" in r
+            else np.full((len(b), overlap_width), np.nan)
+            for r, b in zip(done, breakdowns)
+        ]
+        overlap = np.concatenate(overlaps)
+        for i, field in enumerate(OVERLAP_FIELDS):
+            np.save(os.path.join(dst, f"{field}.npy"), np.ascontiguousarray(overlap[:, i]))
+
+    worker_times = np.full((n_workers, 4), np.nan)
+    worker_times[ok] = [r["worker_times"] for r in done]
+    np.save(os.path.join(dst, "worker_times.npy"), worker_times)
+    for field in WORKER_FIELDS:
+        column = np.zeros(n_workers, dtype=np.float64 if field in FLOAT_FIELDS else np.int64)
+        column[ok] = [r.get(field, 0) for r in done]
+        np.save(os.path.join(dst, f"{field}.npy"), column)
+    np.save(os.path.join(dst, "ok.npy"), ok)
+
+    stat_keys = sorted({k for s in worker_stats for k, v in s.items() if isinstance(v, (int, float))})
+    for key in stat_keys:
+        column = np.array([s.get(key, np.nan) for s in worker_stats], dtype=np.float64)
+        np.save(os.path.join(dst, "stats", f"{key}.npy"), column)
+
+    summary = {
+        "job_results": job_results,
+        "num_workers": n_workers,
+        "num_slice_pairs": int(counts.sum()),
+        "stats": stat_keys,
+    }
+    with open(os.path.join(dst, "summary.json"), "w") as f:
+        json.dump(summary, f, indent=2)
+
+
+def load_summary(src):
+    with open(os.path.join(src, "summary.json"), "r") as f:
+        return json.load(f)
+
+
+def load_results(src, mmap=True):
+    """Load a columnar run. Arrays are memory-mapped unless `mmap` is False."""
+    mmap_mode = "r" if mmap else None
+    summary = load_summary(src)
+    run = {"job": summary["job_results"]}
+    for field in ["worker", "pair_one", "pair_other"] + BREAKDOWN_FIELDS + ["worker_times", "ok"]:
+        run[field] = np.load(os.path.join(src, f"{field}.npy"), mmap_mode=mmap_mode)
+    for field in OVERLAP_FIELDS:
+        path = os.path.join(src, f"{field}.npy")
+        if os.path.exists(path):
+            run[field] = np.load(path, mmap_mode=mmap_mode)
+    for field in WORKER_FIELDS:
+        # Runs saved before a counter was added have none
+        path = os.path.join(src, f"{field}.npy")
+        if os.path.exists(path):
+            run[field] = np.load(path, mmap_mode=mmap_mode)
+        else:
+            run[field] = np.zeros(len(run["worker_times"]), dtype=np.float64 if field in FLOAT_FIELDS else np.int64)
+    run["stats"] = {key: np.load(os.path.join(src, "stats", f"{key}.npy"), mmap_mode=mmap_mode) for key in summary["stats"]}
+    return run
@@ -0,0 +1,126 @@
+"""
+Staging of MDR slices to node-local storage.
+
+With a stage directory, each worker copies the slices it needs from the shared
+storage root to the stage directory before computing, and then reads them
+locally. Workers sharing the stage directory (i.e. running on the same node
+with `$TMPDIR`, or on any node with a GekkoFS mount) copy every slice only
+once: the first worker to claim a slice copies it, and the others wait for it.
+
+The stage directory is expanded on the worker, so `$TMPDIR` is the local
+scratch of its node. Any plain directory works too. Claims use exclusive file
+creation and completion marker files, without locks or renames, which
+GekkoFS may not support.
+
+Each worker also creates a `<worker_id>.active` marker while it uses the stage
+directory. The last worker to release its marker removes the directory, so staged
+copies do not pile up on node-local disks across runs.
+"""
+
+import os
+import shutil
+import time
+
+from mdr_dataset import fetch_slices
+
+
+class SliceStage:
+    """Slices of a run staged under `<stage_dir>/mdr-stage-<run_id>`."""
+
+    def __init__(self, stage_dir, run_id, worker_id=None, timeout=600, poll_interval=0.2):
+        self.path = os.path.join(os.path.expandvars(os.path.expanduser(stage_dir)), f"mdr-stage-{run_id}")
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.staged_bytes = 0
+        self.stage_time = 0.0
+        os.makedirs(self.path, exist_ok=True)
+        self.marker = None
+        if worker_id is not None:
+            self.marker = os.path.join(self.path, f"{worker_id}.active")
+            open(self.marker, "wb").close()
+
+    def release(self):
+        """Drop the marker of this worker, and remove the stage directory if no other worker is using it.
+
+        Returns True if the directory was removed.
+        """
+        if self.marker is None:
+            return False
+        try:
+            os.remove(self.marker)
+        except FileNotFoundError:
+            pass
+        self.marker = None
+        try:
+            if any(name.endswith(".active") for name in os.listdir(self.path)):
+                return False
+        except FileNotFoundError:
+            return False
+        shutil.rmtree(self.path, ignore_errors=True)
+        return True
+
+    def slice_path(self, slice_id):
+        return os.path.join(self.path, f"{slice_id}.vcf")
+
+    def is_staged(self, slice_id):
+        return os.path.exists(self.slice_path(slice_id) + ".done")
+
+    def _claim(self, slice_id):
+        try:
+            fd = os.open(self.slice_path(slice_id) + ".claim", os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        os.close(fd)
+        return True
+
+    def _copy(self, slice_ids, data_slices):
+        # A worker of this node may have just removed the directory
+        os.makedirs(self.path, exist_ok=True)
+        contents = fetch_slices([data_slices[slice_id] for slice_id in slice_ids])
+        for slice_id in slice_ids:
+            data_slice = data_slices[slice_id]
+            data = contents[(data_slice.cloud_object.path.key, data_slice.chunk_id)].encode("utf-8")
+            with open(self.slice_path(slice_id), "wb") as f:
+                f.write(data)
+            open(self.slice_path(slice_id) + ".done", "wb").close()
+            self.staged_bytes += len(data)
+
+    def stage(self, data_slices, slice_ids, batch_size=1):
+        """Copy the slices not staged yet, then wait for the ones claimed by other workers.
+
+        Claimed slices are copied in batches of `batch_size`, reading adjacent ones with a single request.
+        Slices still missing after `timeout` seconds are left to be read from storage.
+        """
+        t0 = time.time()
+        pending = []
+        claimed = []
+        for slice_id in sorted(set(slice_ids)):
+            if self.is_staged(slice_id):
+                continue
+            if self._claim(slice_id):
+                claimed.append(slice_id)
+                if len(claimed) >= batch_size:
+                    self._copy(claimed, data_slices)
+                    claimed = []
+            else:
+                pending.append(slice_id)
+        if claimed:
+            self._copy(claimed, data_slices)
+
+        while pending and time.time() - t0 < self.timeout:
+            pending = [slice_id for slice_id in pending if not self.is_staged(slice_id)]
+            if pending:
+                time.sleep(self.poll_interval)
+        if pending:
+            print(f"Slices {pending} not staged in {self.timeout} s. Reading them from storage.")
+        self.stage_time += time.time() - t0
+
+    def get(self, slice_id, data_slice):
+        """Slice contents, from the stage directory if staged."""
+        try:
+            if self.is_staged(slice_id):
+                with open(self.slice_path(slice_id), "rb") as f:
+                    return f.read().decode("utf-8")
+        except FileNotFoundError:
+            pass  # removed by another worker that finished
+        return data_slice.get()
@@ -0,0 +1,251 @@
+"""
+Live progress telemetry for MDR runs.
+
+Workers publish periodic progress records through the channel configured in the
+`monitoring` key of the Lithops config (RabbitMQ or storage). The driver aggregates
+them into a cluster-wide throughput line with an ETA and a list of stragglers.
+"""
+
+import json
+import threading
+import time
+
+import numpy as np
+
+
+def telemetry_config(fexec, output_key, interval=None):
+    """Telemetry settings for workers, taken from the Lithops config of an executor."""
+    lithops_config = fexec.config["lithops"]
+    backend = lithops_config.get("monitoring", "storage").lower()
+    if interval is None:
+        interval = lithops_config.get("monitoring_interval", 2) * 5
+    config = {
+        "backend": backend,
+        "interval": interval,
+        "run_id": fexec.executor_id,
+        "prefix": f"{output_key}/_progress/{fexec.executor_id}",
+    }
+    if backend == "rabbitmq":
+        config["amqp_url"] = fexec.config["rabbitmq"]["amqp_url"]
+        config["queue"] = f"mdr-progress-{fexec.executor_id}"
+    return config
+
+
+def public_telemetry_config(config):
+    """Telemetry settings without the broker URL, which holds credentials, to save along the results."""
+    if not config:
+        return config
+    return {k: v for k, v in config.items() if k != "amqp_url"}
+
+
+def connect_rabbitmq(config):
+    """Channel to the progress queue, or None if the broker is unreachable."""
+    try:
+        import pika
+
+        parameters = pika.URLParameters(config["amqp_url"])
+        # Workers only publish between slice pairs, so the connection is idle for long periods
+        parameters.heartbeat = 0
+        connection = pika.BlockingConnection(parameters)
+        channel = connection.channel()
+        channel.queue_declare(queue=config["queue"])
+        return connection, channel
+    except Exception as e:
+        print(f"Could not connect to RabbitMQ for progress telemetry: {e}")
+        return None, None
+
+
+class ProgressReporter:
+    """Worker side. Publishes a progress record at most every `interval` seconds."""
+
+    def __init__(self, config, worker_id, slice_pairs_total, storage=None, bucket=None):
+        self.config = config
+        self.worker_id = worker_id
+        self.slice_pairs_total = slice_pairs_total
+        self.storage = storage
+        self.bucket = bucket
+        self.last_publish = 0.0
+        self.channel = None
+        self.connection = None
+        if config and config["backend"] == "rabbitmq":
+            # Telemetry must never fail the computation, fall back to storage or disable it
+            self.connection, self.channel = connect_rabbitmq(config)
+            if self.channel is None:
+                self.config = dict(config, backend="storage") if storage is not None else None
+
+    def update(self, slice_pairs_done, pairs, candidates, combs_sec, cache_hits, done=False):
+        if not self.config or self.config["interval"] <= 0:
+            return
+        now = time.time()
+        if not done and now - self.last_publish < self.config["interval"]:
+            return
+        self.last_publish = now
+        record = json.dumps(
+            {
+                "worker_id": self.worker_id,
+                "time": now,
+                "slice_pairs_done": slice_pairs_done,
+                "slice_pairs_total": self.slice_pairs_total,
+                "pairs": pairs,
+                "candidates": candidates,
+                "combs_sec": combs_sec,
+                "cache_hits": cache_hits,
+                "done": done,
+            }
+        )
+        if self.channel is not None:
+            try:
+                self.channel.basic_publish(exchange="", routing_key=self.config["queue"], body=record)
+                return
+            except Exception as e:
+                # The driver also polls storage, so later records still reach it
+                print(f"    > Worker {self.worker_id} > Could not publish progress, switching to storage: {e}")
+                self.close()
+                self.connection, self.channel = None, None
+                if self.storage is None:
+                    self.config = None
+                    return
+        try:
+            self.storage.put_object(
+                Bucket=self.bucket,
+                Key=f"{self.config['prefix']}/{self.worker_id}.json",
+                Body=record.encode("utf-8"),
+            )
+        except Exception as e:
+            # Telemetry must never fail the computation
+            print(f"    > Worker {self.worker_id} > Could not publish progress: {e}")
+
+    def close(self):
+        if self.connection is not None:
+            try:
+                self.connection.close()
+            except Exception:
+                pass  # the broker already dropped the connection
+
+
+class ProgressMonitor(threading.Thread):
+    """Driver side. Polls progress records and prints a cluster-wide status line."""
+
+    def __init__(self, config, worker_pairs, storage=None, bucket=None, straggler_ratio=0.5):
+        super().__init__(daemon=True)
+        self.config = config
+        self.worker_pairs = np.asarray(worker_pairs)
+        self.storage = storage
+        self.bucket = bucket
+        self.straggler_ratio = straggler_ratio
+        self.records = {}
+        self.history = []
+        self.start_time = time.time()
+        self.stop_event = threading.Event()
+        self.connection = None
+        self.channel = None
+        if config["backend"] == "rabbitmq":
+            self.connection, self.channel = connect_rabbitmq(config)
+
+    def update_record(self, record):
+        latest = self.records.get(record["worker_id"])
+        if latest is None or record["time"] >= latest["time"]:
+            self.records[record["worker_id"]] = record
+
+    def poll(self):
+        """Update the latest record of each worker.
+
+        Workers that cannot reach the broker, or lose their connection, report to
+        storage instead, so storage is always polled as well as the queue.
+        """
+        if self.channel is not None:
+            while True:
+                method, _, body = self.channel.basic_get(queue=self.config["queue"], auto_ack=True)
+                if method is None:
+                    break
+                self.update_record(json.loads(body))
+        if self.storage is None:
+            return
+        for worker_id in range(len(self.worker_pairs)):
+            if self.records.get(worker_id, {}).get("done"):
+                continue
+            try:
+                res = self.storage.get_object(Bucket=self.bucket, Key=f"{self.config['prefix']}/{worker_id}.json")
+                self.update_record(json.loads(res["Body"].read()))
+            except Exception:
+                continue  # the worker did not report to storage yet
+
+    def status(self):
+        """Aggregate the latest records into a status dict."""
+        now = time.time()
+        n_workers = len(self.worker_pairs)
+        done = np.zeros(n_workers)
+        pairs = candidates = cache_hits = 0
+        combs_sec = 0.0
+        last_seen = np.full(n_workers, np.nan)
+        finished = np.zeros(n_workers, dtype=bool)
+        for worker_id, record in self.records.items():
+            done[worker_id] = record["slice_pairs_done"]
+            pairs += record["pairs"]
+            candidates += record["candidates"]
+            cache_hits += record["cache_hits"]
+            last_seen[worker_id] = record["time"]
+            finished[worker_id] = record["done"]
+            if not record["done"]:
+                combs_sec += record["combs_sec"]
+
+        total = self.worker_pairs.sum()
+        self.history.append((now, done.sum()))
+        # Slice pair rate over the last few polls, or since start if there is not enough history
+        t0, d0 = self.history[max(0, len(self.history) - 5)] if len(self.history) > 1 else (self.start_time, 0)
+        rate = (done.sum() - d0) / (now - t0) if now > t0 else 0.0
+        eta = (total - done.sum()) / rate if rate > 0 else float("inf")
+
+        # Stragglers: workers far behind the median progress, or that stopped reporting
+        fraction = np.divide(done, self.worker_pairs, out=np.ones(n_workers), where=self.worker_pairs > 0)
+        running = ~finished & (self.worker_pairs > 0)
+        stale = running & (now - np.nan_to_num(last_seen, nan=self.start_time) > 3 * self.config["interval"])
+        slow = running & (fraction < self.straggler_ratio * np.median(fraction[running])) if running.any() else running
+        stragglers = np.flatnonzero(stale | slow)
+
+        return {
+            "slice_pairs_done": int(done.sum()),
+            "slice_pairs_total": int(total),
+            "pairs": pairs,
+            "candidates": candidates,
+            "cache_hits": cache_hits,
+            "combs_sec": combs_sec,
+            "eta": eta,
+            "reporting": len(self.records),
+            "stragglers": stragglers,
+        }
+
+    def print_status(self, status):
+        eta = "--:--:--"
+        if np.isfinite(status["eta"]):
+            minutes, seconds = divmod(int(status["eta"]), 60)
+            hours, minutes = divmod(minutes, 60)
+            eta = f"{hours:02d}:{minutes:02d}:{seconds:02d}"
+        stragglers = status["stragglers"]
+        print(
+            f"[progress] {status['slice_pairs_done']}/{status['slice_pairs_total']} slice pairs"
+            f" ({100 * status['slice_pairs_done'] / max(status['slice_pairs_total'], 1):.1f}%)"
+            f" | {status['reporting']} workers reporting"
+            f" | COMBS/SEC: {status['combs_sec']:.1f}"
+            f" | pairs: {status['pairs']} | candidates: {status['candidates']} | cache hits: {status['cache_hits']}"
+            f" | ETA {eta}"
+            + (f" | {len(stragglers)} stragglers: {stragglers[:10].tolist()}" if len(stragglers) else ""),
+            flush=True,
+        )
+
+    def run(self):
+        while not self.stop_event.wait(self.config["interval"]):
+            try:
+                self.poll()
+                self.print_status(self.status())
+            except Exception as e:
+                print(f"[progress] Could not collect progress: {e}")
+
+    def stop(self):
+        self.stop_event.set()
+        self.join()
+        self.poll()
+        self.print_status(self.status())
+        if self.connection is not None:
+            self.channel.queue_delete(queue=self.config["queue"])
+            self.connection.close()
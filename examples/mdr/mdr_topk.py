@@ -0,0 +1,91 @@
+# /usr/bin/env python3
+"""
+Bounded MDR candidates: the K best SNP pairs and a histogram of all cumulative errors.
+
+In top-K mode, each worker keeps a heap of the K pairs with the lowest
+cumulative error of each phenotype instead of writing every pair under
+`prediction_power_tol`, and the driver merges them into one output per
+phenotype. So output volume and merging are bounded by K per worker.
+
+In every run, workers count the cumulative errors of all the SNP pairs in a
+histogram, saved as `error_histogram.npy` with the results. It tells how many
+candidates any tolerance would give, without rerunning:
+
+    python mdr_topk.py plots/<execution_name>-results -n 10000
+"""
+
+import argparse
+import heapq
+import itertools
+import json
+import os
+
+import numpy as np
+
+HIST_BINS = 1000
+ERROR_BUFFER_ROWS = 65536  # SNP pairs binned at once by workers
+
+
+class TopK:
+    """The `k` SNP pairs with the lowest cumulative error, as (error, pair, test errors)."""
+
+    def __init__(self, k):
+        self.k = k
+        self.heap = []  # max-heap on the error, by negating it
+        self.counter = itertools.count()
+
+    def push(self, error, pair, testerror):
+        error = float(error)
+        if len(self.heap) < self.k:
+            heapq.heappush(self.heap, (-error, next(self.counter), pair, testerror.tolist()))
+        elif error < -self.heap[0][0]:
+            heapq.heapreplace(self.heap, (-error, next(self.counter), pair, testerror.tolist()))
+
+    def items(self):
+        return sorted((-neg_error, pair, testerror) for neg_error, _, pair, testerror in self.heap)
+
+
+def merge_topk(worker_items, k):
+    """Merge the sorted top-K items of many workers."""
+    return list(itertools.islice(heapq.merge(*worker_items), k))
+
+
+def histogram_edges(cv_sets, bins=HIST_BINS):
+    """Cumulative errors are the sum of one test error in [0, 1] per CV set."""
+    return np.linspace(0, cv_sets, bins + 1)
+
+
+def error_histogram(cumulative_errors, cv_sets, bins=HIST_BINS):
+    """Counts of a (SNP pairs x phenotypes) array of cumulative errors, as a (phenotypes x bins) array."""
+    cumulative_errors = np.asarray(cumulative_errors, dtype=np.float64)
+    n_phenotypes = cumulative_errors.shape[1]
+    bin_ids = np.clip((cumulative_errors * bins / cv_sets).astype(np.int64), 0, bins - 1)
+    bin_ids += np.arange(n_phenotypes) * bins
+    return np.bincount(bin_ids.ravel(), minlength=n_phenotypes * bins).reshape(n_phenotypes, bins)
+
+
+def tolerance_for(histogram, cv_sets, n_candidates):
+    """Lowest bin edge keeping at least `n_candidates` pairs (or all of them) for each phenotype."""
+    edges = histogram_edges(cv_sets, histogram.shape[-1])
+    cumulative = np.cumsum(histogram, axis=-1)
+    last_bin = np.array([np.searchsorted(c, min(n_candidates, c[-1])) for c in np.atleast_2d(cumulative)])
+    return edges[last_bin + 1]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pick an MDR tolerance from the error histogram of a run.")
+    parser.add_argument("results_dir", type=str, help="Path to the MDR results directory")
+    parser.add_argument(
+        "-n", "--candidates", type=int, nargs="+", help="Desired number of candidate pairs", default=[1000, 10**6]
+    )
+    args = parser.parse_args()
+
+    with open(os.path.join(args.results_dir, "summary.json"), "r") as f:
+        mdr_config = json.load(f)["job_results"]["mdr_config"]
+    histogram = np.load(os.path.join(args.results_dir, "error_histogram.npy"))
+    names = mdr_config.get("phenotypes", ["phenotype"])
+    print(f"{histogram.sum(axis=1).tolist()} SNP pairs, tolerance in use: {mdr_config['prediction_power_tol']}")
+    for n_candidates in args.candidates:
+        tolerances = tolerance_for(histogram, mdr_config["CV_sets"], n_candidates)
+        for name, tolerance in zip(names, tolerances.tolist()):
+            print(f"    > {name}: prediction_power_tol {tolerance:.4f} for ~{n_candidates} candidates")
@@ -0,0 +1,113 @@
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import lithops
+
+
+"""
+Parallel cleanup of storage prefixes, e.g. the temporary objects of os_benchmark
+or the partitions (`<samples_key>_parts<N>/`) and outputs of MDR runs.
+
+Keys under the prefixes are listed, split in shards and deleted in parallel,
+by a pool of threads in this process or by Lithops tasks (--backend):
+
+  python hpc_cleanup.py $bucket_name <prefix> [<prefix> ...] --dry-run
+  python hpc_cleanup.py $bucket_name <prefix> -w 64
+"""
+
+
+"""
+Sorted keys under any of the prefixes.
+"""
+def list_prefixes(storage, bucket, prefixes):
+  keys = set()
+  for prefix in prefixes:
+    keys.update(storage.list_keys(bucket, prefix))
+  return sorted(keys)
+
+
+def shard_keys(keys, shard_size):
+  return [keys[i:i + shard_size] for i in range(0, len(keys), shard_size)]
+
+
+"""
+Delete a shard of keys, one by one if the backend fails to delete them at once.
+"""
+def delete_shard(storage, bucket, keys):
+  try:
+    storage.delete_objects(bucket, keys)
+  except Exception:
+    for key in keys:
+      storage.delete_object(bucket, key)
+  return len(keys)
+
+
+class Progress:
+  def __init__(self, total, interval=1.0):
+    self.total = total
+    self.done = 0
+    self.interval = interval
+    self.start = time.time()
+    self.last_report = 0.0
+
+  def update(self, count):
+    self.done += count
+    now = time.time()
+    if now - self.last_report >= self.interval or self.done == self.total:
+      elapsed = now - self.start
+      print(f"Deleted {self.done}/{self.total} objects in {elapsed:.1f} s ({self.done / max(elapsed, 1e-9):.0f}/s)")
+      self.last_report = now
+
+
+"""
+Delete keys in shards of `shard_size`, with `workers` threads,
+or with Lithops tasks of the given compute backend.
+"""
+def delete_keys(storage, bucket, keys, workers=32, shard_size=1000, backend=None, dry_run=False):
+  shards = shard_keys(keys, shard_size)
+  if dry_run:
+    for key in keys[:10]:
+      print(f"Would delete {bucket}/{key}")
+    print(f"Would delete {len(keys)} objects in {len(shards)} shards")
+    return 0
+
+  progress = Progress(len(keys))
+  if backend is not None:
+    from lithops.wait import ANY_COMPLETED
+
+    def delete_task(keys, storage):
+      return delete_shard(storage, bucket, keys)
+
+    fexec = lithops.FunctionExecutor(backend=backend, storage=storage.backend)
+    pending = fexec.map(delete_task, [(shard,) for shard in shards])
+    while pending:
+      done, pending = fexec.wait(pending, return_when=ANY_COMPLETED, throw_except=False, show_progressbar=False)
+      for future in done:
+        progress.update(future.result(throw_except=False) or 0)
+    fexec.clean()
+  else:
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+      futures = [pool.submit(delete_shard, storage, bucket, shard) for shard in shards]
+      for future in as_completed(futures):
+        progress.update(future.result())
+  return progress.done
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Delete every object under some storage prefixes in parallel")
+  parser.add_argument("bucket", type=str, help="Bucket (or storage directory) holding the objects")
+  parser.add_argument("prefixes", type=str, nargs="+", help="Key prefixes to delete")
+  parser.add_argument("-s", "--storage", type=str, default=None, help="Storage backend, default from the Lithops config")
+  parser.add_argument("-b", "--backend", type=str, default=None, help="Delete with Lithops tasks of this compute backend")
+  parser.add_argument("-w", "--workers", type=int, default=32, help="Threads deleting shards, without --backend")
+  parser.add_argument("--shard-size", type=int, default=1000, help="Keys deleted per request or task")
+  parser.add_argument("--dry-run", action="store_true", help="List what would be deleted")
+  args = parser.parse_args()
+
+  storage = lithops.Storage(backend=args.storage)
+  t0 = time.time()
+  keys = list_prefixes(storage, args.bucket, args.prefixes)
+  print(f"Listed {len(keys)} objects in {time.time() - t0:.1f} s")
+  deleted = delete_keys(storage, args.bucket, keys, args.workers, args.shard_size, args.backend, args.dry_run)
+  print(f"Done! Deleted {deleted} objects in {time.time() - t0:.1f} s")
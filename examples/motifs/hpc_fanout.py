@@ -0,0 +1,118 @@
+import math
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import lithops
+from lithops.wait import ANY_COMPLETED
+
+
+"""
+Fan-out of a large map over several FunctionExecutors from one process.
+
+The iterdata is split in chunks of at most `max_tasks_per_executor` calls (or
+in `executors` chunks), and each chunk is mapped by its own FunctionExecutor in
+a thread of this process. Futures are streamed back as they complete, so the
+caller aggregates results and stats incrementally instead of holding every
+batch until the end:
+
+  fan_out = FanOut(compute_flops, iterdata, max_tasks_per_executor=896, backend=backend)
+  for future, result in fan_out:
+    ...
+  print(fan_out.start_time, fan_out.end_time)
+
+`start_time` is the time the first chunk was submitted, `end_time` the time
+the last future yielded completed. If the caller stops iterating, or a chunk
+fails, the other executors stop waiting for their futures and clean up in the
+background.
+"""
+
+
+"""
+Split `iterdata` in `executors` chunks of similar size, or in chunks of at most
+`max_tasks_per_executor` when `executors` is not given.
+"""
+def split_iterdata(iterdata, executors=None, max_tasks_per_executor=None):
+  iterdata = list(iterdata)
+  if not iterdata:
+    return []
+  if executors is None:
+    executors = math.ceil(len(iterdata) / max_tasks_per_executor) if max_tasks_per_executor else 1
+  executors = max(1, min(executors, len(iterdata)))
+  size = math.ceil(len(iterdata) / executors)
+  return [iterdata[i:i + size] for i in range(0, len(iterdata), size)]
+
+
+class FanOut:
+  _DONE = object()
+
+  def __init__(self, func, iterdata, executors=None, max_tasks_per_executor=None, map_args=None, **executor_args):
+    self.func = func
+    self.chunks = split_iterdata(iterdata, executors, max_tasks_per_executor)
+    self.map_args = map_args or {}
+    self.executor_args = executor_args
+    self.submit_times = [None] * len(self.chunks)
+    self.end_time = None
+    self._cancel = threading.Event()
+    self.completed = 0
+    self.failed = 0
+
+  @property
+  def start_time(self):
+    submitted = [t for t in self.submit_times if t is not None]
+    return min(submitted) if submitted else None
+
+  @property
+  def total(self):
+    return sum(len(chunk) for chunk in self.chunks)
+
+  """
+  Map a chunk in its own executor and put its futures in `done` as they complete, until cancelled.
+  """
+  def _run_chunk(self, index, done):
+    try:
+      fexec = lithops.FunctionExecutor(**self.executor_args)
+      self.submit_times[index] = time.time()
+      pending = fexec.map(self.func, self.chunks[index], **self.map_args)
+      while pending and not self._cancel.is_set():
+        finished, pending = fexec.wait(pending, return_when=ANY_COMPLETED, download_results=True,
+                                       throw_except=False, show_progressbar=False)
+        for future in finished:
+          done.put((future, future.result(throw_except=False)))
+      fexec.clean()
+      done.put(self._DONE)
+    except Exception as e:
+      done.put(e)
+
+  """
+  Yield (future, result) of every call as it completes, result being None for failed calls.
+  """
+  def __iter__(self):
+    if not self.chunks:
+      return
+    done = queue.Queue()
+    pool = ThreadPoolExecutor(max_workers=len(self.chunks))
+    try:
+      for i in range(len(self.chunks)):
+        pool.submit(self._run_chunk, i, done)
+
+      running = len(self.chunks)
+      while running:
+        item = done.get()
+        if item is self._DONE:
+          running -= 1
+          continue
+        if isinstance(item, Exception):
+          raise item
+        future, result = item
+        self.end_time = time.time()
+        if future.error:
+          self.failed += 1
+        else:
+          self.completed += 1
+        yield future, result
+    finally:
+      # Without waiting for the executors (or their clean up) when a chunk failed or the caller stopped early
+      self._cancel.set()
+      pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,81 @@
+import mmap
+import os
+
+
+"""
+Zero-copy reads of storage objects on POSIX file systems.
+
+With the pfs storage backend, or a bucket given as a directory path, objects
+are plain files under storage_root/storage_bucket. They are mapped in memory
+instead of copied into new bytes by get_object, so only the pages touched are
+read, without an extra copy. Other backends fall back to get_object.
+
+  with map_object(storage, bucket, key) as obj:
+    header = bytes(obj.data[:100])
+
+Views of obj.data are not valid after the object is closed. Copy what is
+needed before leaving the with block.
+"""
+
+ADVICE = {
+  'normal': mmap.MADV_NORMAL,
+  'sequential': mmap.MADV_SEQUENTIAL,
+  'random': mmap.MADV_RANDOM,
+  'willneed': mmap.MADV_WILLNEED,
+}
+
+
+"""
+Path of an object in a file system storage backend, or None for other backends.
+"""
+def object_path(storage, bucket, key):
+  backend_config = getattr(storage, 'config', {}).get(getattr(storage, 'backend', None), None) or {}
+  if backend_config.get('storage_root'):
+    return os.path.join(backend_config['storage_root'], bucket, key)
+  if os.path.isabs(bucket):
+    return os.path.join(bucket, key)
+  return None
+
+
+"""
+Read-only view of bytes [start, end) of an object, as a memoryview in `data`.
+`advice` is the read-ahead hint for the mapped pages: normal, sequential, random or willneed.
+"""
+class MappedObject:
+  def __init__(self, storage, bucket, key, start=0, end=None, advice='sequential'):
+    self._mmap = None
+    path = object_path(storage, bucket, key)
+    self.mapped = path is not None and os.path.isfile(path)
+    if self.mapped:
+      with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        end = size if end is None else min(end, size)
+        if end <= start:
+          self.data = memoryview(b'')
+          return
+        # Maps must start at a multiple of the allocation granularity
+        offset = start - start % mmap.ALLOCATIONGRANULARITY
+        self._mmap = mmap.mmap(f.fileno(), end - offset, access=mmap.ACCESS_READ, offset=offset)
+      if advice and hasattr(self._mmap, 'madvise'):
+        self._mmap.madvise(ADVICE[advice])
+      self.data = memoryview(self._mmap)[start - offset:]
+    else:
+      extra_get_args = {}
+      if start > 0 or end is not None:
+        extra_get_args['Range'] = 'bytes={}-{}'.format(start, '' if end is None else end - 1)
+      self.data = memoryview(storage.get_object(bucket, key, extra_get_args=extra_get_args))
+
+  def close(self):
+    self.data.release()
+    if self._mmap is not None:
+      self._mmap.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc):
+    self.close()
+
+
+def map_object(storage, bucket, key, start=0, end=None, advice='sequential'):
+  return MappedObject(storage, bucket, key, start, end, advice)
@@ -0,0 +1,51 @@
+import numpy as np
+
+
+"""
+Timeline analysis of benchmark runs with many calls, in O(N + bins).
+
+Curves over time (concurrent calls, aggregate rates) are built with
+difference arrays: each call adds its weight at the bin where it starts and
+removes it at the bin where it ends, and a cumulative sum gives the value of
+every bin. No (calls x bins) matrix is allocated.
+"""
+
+
+"""
+Sum over calls of `weights` (1 by default) in the bins each call spans.
+
+A call spans bins [a, b), with a and b the insertion points of its start
+and end in `bins`, as found by searchsorted.
+"""
+def interval_sum(bins, starts, ends, weights=None):
+  first = np.searchsorted(bins, starts)
+  last = np.searchsorted(bins, ends)
+  valid = last > first
+  weights = np.ones(len(first)) if weights is None else np.broadcast_to(np.asarray(weights, dtype=float), first.shape)
+  diff = np.bincount(first[valid], weights[valid], minlength=len(bins) + 1)
+  diff -= np.bincount(last[valid], weights[valid], minlength=len(bins) + 1)
+  return np.cumsum(diff)[:len(bins)]
+
+
+"""
+Like interval_sum, with each call's `totals` spread evenly over the bins it spans.
+"""
+def spread_sum(bins, starts, ends, totals):
+  first = np.searchsorted(bins, starts)
+  last = np.searchsorted(bins, ends)
+  span = np.maximum(last - first, 1)
+  return interval_sum(bins, starts, ends, np.asarray(totals, dtype=float) / span)
+
+
+"""
+At most `max_segments` of the (start, end) segments of the calls, evenly
+strided over the call index, as an array for a LineCollection with the
+call index as y.
+"""
+def downsample_segments(starts, ends, max_segments=2000):
+  starts = np.asarray(starts, dtype=float)
+  ends = np.asarray(ends, dtype=float)
+  index = np.arange(len(starts))
+  if len(starts) > max_segments:
+    index = np.linspace(0, len(starts) - 1, max_segments).astype(int)
+  return np.stack([np.column_stack([starts[index], index]), np.column_stack([ends[index], index])], axis=1)
@@ -8,6 +8,7 @@ import csv
 import fasta_generator as fg
 from CNN_model import MultiMotifCNN, one_hot_encode_seq, model_params
 from hpc_data_connectors import set_device
+from hpc_storage import map_object
 
 
 # Check if GPU is available
@@ -29,7 +30,8 @@ def chunk_prediction(id,chunk_key):
   from CNN_model import MultiMotifCNN, one_hot_encode_seq, model_params
   print(f"Using device: {device}")
   storage = lithops.Storage()
-  fasta_chunk_str = storage.get_object(bucket, chunk_key).decode('utf-8')
+  with map_object(storage, bucket, chunk_key) as chunk:
+    fasta_chunk_str = str(chunk.data, 'utf-8')
 
   # one-hot encode sequeces
   X, y = [], []
@@ -64,7 +66,7 @@ def chunk_prediction(id,chunk_key):
 
 def chunk_model_detect(storage,chunk_keys,threshold=0.51):
   fexec = lithops.FunctionExecutor()
-  fexec.map(chunk_prediction, chunk_keys,include_modules=['CNN_model'])
+  fexec.map(chunk_prediction, chunk_keys,include_modules=['CNN_model', 'hpc_storage'])
   results = fexec.get_result()
   fexec.clean()
 
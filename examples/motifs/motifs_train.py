@@ -9,6 +9,7 @@ import io
 import fasta_generator as fg
 from CNN_model import MultiMotifCNN, one_hot_encode_seq, model_params
 from hpc_data_connectors import set_device
+from hpc_storage import map_object
 
 # Check if GPU is available
 #device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
@@ -19,7 +20,8 @@ from hpc_data_connectors import set_device
 def chunk_model_training(id,chunk_key):
   print(f"Using device: {device}")
   storage = lithops.Storage()
-  fasta_chunk_str = storage.get_object(bucket, chunk_key).decode('utf-8')
+  with map_object(storage, bucket, chunk_key) as chunk:
+    fasta_chunk_str = str(chunk.data, 'utf-8')
 
   # one-hot encode sequeces
   X, y = [], []
@@ -14,14 +14,31 @@
 # limitations under the License.
 #
 
+import mmap
+import os
+import random
+import re
+import sys
+import threading
 import uuid
+import zlib
 import numpy as np
 import time
 import hashlib
 import pickle
 import click
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
 
 from lithops import FunctionExecutor, Storage
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'motifs'))
+from hpc_cleanup import delete_keys
+from hpc_storage import map_object, object_path
 from plots import create_execution_histogram, create_rates_histogram, create_agg_bdwth_plot
 
 
@@ -33,19 +50,26 @@ class RandomDataGenerator(object):
     2. Actually generates random data to eliminate
     false metrics based on compression.
 
-    It does this by generating data in 1MB blocks
-    from np.random where each block is seeded with
-    the block number.
+    It does this by generating one random base block per seed
+    (see data_seed), only as long as the data when it is shorter
+    than 1MB, and deriving every 1MB block from it with a XOR of a
+    word mixed from (seed, block number). No block repeats within
+    an object nor across objects, and producing one costs a single
+    vectorized pass. Blocks are kept in a small cache and served
+    through memoryview slices, and readinto() copies them straight
+    into the caller's buffer.
     """
 
-    def __init__(self, bytes_total):
+    BLOCK_SIZE_BYTES = 1024*1024
+    CACHED_BLOCKS = 4
+
+    def __init__(self, bytes_total, seed=0, sampler=None):
         self.bytes_total = bytes_total
         self.pos = 0
-        self.current_block_id = None
-        self.current_block_data = ""
-        self.BLOCK_SIZE_BYTES = 1024*1024
-        self.block_random = np.random.randint(0, 256, dtype=np.uint8,
-                                              size=self.BLOCK_SIZE_BYTES)
+        self.seed = seed
+        self.sampler = sampler
+        self.blocks = {}
+        self.base = None
 
     def __len__(self):
         return self.bytes_total
@@ -54,6 +78,9 @@ class RandomDataGenerator(object):
     def len(self):
         return self.bytes_total 
 
+    def readable(self):
+        return True
+
     def tell(self):
         return self.pos
 
@@ -64,65 +91,246 @@ class RandomDataGenerator(object):
             self.pos += pos
         elif whence == 2:
             self.pos = self.bytes_total - pos
+        return self.pos
 
-    def get_block(self, block_id):
-        if block_id == self.current_block_id:
-            return self.current_block_data
+    def block_key(self, block_id):
+        """splitmix64 of (seed, block_id), so neighbouring blocks get unrelated words."""
+        mask = 2**64 - 1
+        z = (self.seed * 0x9E3779B97F4A7C15 + block_id + 1) & mask
+        z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & mask
+        z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & mask
+        return np.uint64(z ^ (z >> 31))
 
-        self.current_block_id = block_id
-        self.current_block_data = (block_id + self.block_random).tostring()
-        return self.current_block_data
+    def get_block(self, block_id):
+        block = self.blocks.get(block_id)
+        if block is None:
+            if self.base is None:
+                # Raw SFC64 output, so a shorter base is a prefix of the full one (what the Verifier generates)
+                words = -(-min(self.bytes_total, self.BLOCK_SIZE_BYTES) // 8)
+                self.base = np.random.SFC64(self.seed).random_raw(words)
+            out = None
+            if len(self.blocks) >= self.CACHED_BLOCKS:
+                out = self.blocks.pop(next(iter(self.blocks))).obj
+            words = np.bitwise_xor(self.base, self.block_key(block_id), out=out)
+            block = memoryview(words).cast('B')
+            self.blocks[block_id] = block
+        return block
 
     def get_block_coords(self, abs_pos):
         block_id = abs_pos // self.BLOCK_SIZE_BYTES
         within_block_pos = abs_pos - block_id * self.BLOCK_SIZE_BYTES
         return block_id, within_block_pos
 
-    def read(self, bytes_requested):
+    def iter_chunks(self, bytes_out):
+        """Memoryview slices of the blocks covering the next bytes_out bytes."""
+        byte_pos = 0
+        while byte_pos < bytes_out:
+            block_id, within_block_pos = self.get_block_coords(self.pos + byte_pos)
+            chunk = self.get_block(block_id)[within_block_pos:within_block_pos + bytes_out - byte_pos]
+            byte_pos += len(chunk)
+            yield chunk
+
+    def readinto(self, buffer):
+        out = memoryview(buffer).cast('B')
+        bytes_out = min(self.bytes_total - self.pos, len(out))
+        byte_pos = 0
+        for chunk in self.iter_chunks(bytes_out):
+            out[byte_pos:byte_pos + len(chunk)] = chunk
+            byte_pos += len(chunk)
+        self.pos += bytes_out
+        if self.sampler is not None:
+            self.sampler.add(bytes_out)
+        return bytes_out
+
+    def read(self, bytes_requested=-1):
         remaining_bytes = self.bytes_total - self.pos
-        if remaining_bytes == 0:
+        if remaining_bytes <= 0:
             return b''
+        if bytes_requested is None or bytes_requested < 0:
+            bytes_requested = remaining_bytes
 
         bytes_out = min(remaining_bytes, bytes_requested)
-        start_pos = self.pos
+        byte_data = b''.join(self.iter_chunks(bytes_out))
+        self.pos += bytes_out
+        if self.sampler is not None:
+            self.sampler.add(bytes_out)
+        return byte_data
 
-        byte_data = b''
-        byte_pos = 0
-        while byte_pos < bytes_out:
-            abs_pos = start_pos + byte_pos
-            bytes_remaining = bytes_out - byte_pos
 
-            block_id, within_block_pos = self.get_block_coords(abs_pos)
-            block = self.get_block(block_id)
-            # how many bytes can we copy?
-            chunk = block[within_block_pos:within_block_pos + bytes_remaining]
+def data_seed(key_name, part=0):
+    """Seed of the data of a part of an object, so every object (and part) holds different bytes."""
+    digest = hashlib.blake2b('{}/{}'.format(key_name, part).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'little')
 
-            byte_data += chunk
 
-            byte_pos += len(chunk)
+class BandwidthSampler(object):
+    """
+    Records (timestamp, cumulative bytes) samples of a task.
 
-        self.pos += bytes_out
+    A sample is taken whenever `interval` seconds or `interval_bytes`
+    bytes passed since the last one, so the bandwidth of every task
+    can be followed over time instead of averaged over its run.
+    Streams of the same task share one sampler.
+    """
 
-        return byte_data
+    def __init__(self, interval=0.1, interval_bytes=0):
+        self.interval = interval
+        self.interval_bytes = interval_bytes
+        self.bytes = 0
+        self.last_time = time.time()
+        self.last_bytes = 0
+        self.samples = [(self.last_time, 0)]
+        self.lock = threading.Lock()
+
+    def add(self, bytes_n):
+        with self.lock:
+            self.bytes += bytes_n
+            now = time.time()
+            if (now - self.last_time >= self.interval
+                    or 0 < self.interval_bytes <= self.bytes - self.last_bytes):
+                self.samples.append((now, self.bytes))
+                self.last_time, self.last_bytes = now, self.bytes
+
+    def array(self):
+        """Samples as a (samples x 2) array, ending with the bytes at this moment."""
+        with self.lock:
+            if self.samples[-1][1] != self.bytes:
+                self.samples.append((time.time(), self.bytes))
+            return np.array(self.samples, dtype=np.float64)
+
+
+VERIFY_MODES = ['none', 'crc32', 'adler32', 'xxhash', 'md5', 'pattern']
+
+
+class Verifier(object):
+    """
+    Checks the data read from an object, block by block.
+
+    Checksum modes compute a running checksum of the data, and pattern
+    mode compares it to the content written by RandomDataGenerator with
+    the same seed, starting at the same offset. The time spent in
+    update() is kept apart, so it is not counted as I/O time.
+    """
+
+    def __init__(self, mode, seed=0, start=0):
+        if mode == 'xxhash' and xxhash is None:
+            raise ImportError('xxhash verification needs the xxhash package: pip install xxhash')
+        self.mode = mode
+        self.verify_time = 0.0
+        self.errors = 0
+        self.state = None
+        if mode == 'md5':
+            self.state = hashlib.md5()
+        elif mode == 'xxhash':
+            self.state = xxhash.xxh3_64()
+        elif mode == 'crc32':
+            self.state = 0
+        elif mode == 'adler32':
+            self.state = 1
+        elif mode == 'pattern':
+            self.expected = RandomDataGenerator(sys.maxsize, seed=seed)
+            self.expected.seek(start)
+
+    def update(self, buf):
+        if self.mode == 'none':
+            return
+        t0 = time.time()
+        if self.mode in ('md5', 'xxhash'):
+            self.state.update(buf)
+        elif self.mode == 'crc32':
+            self.state = zlib.crc32(buf, self.state)
+        elif self.mode == 'adler32':
+            self.state = zlib.adler32(buf, self.state)
+        elif self.mode == 'pattern':
+            if buf != self.expected.read(len(buf)):
+                self.errors += 1
+        self.verify_time += time.time() - t0
+
+    def result(self):
+        """Checksum, or number of blocks not matching the pattern."""
+        if self.mode in ('md5', 'xxhash'):
+            return self.state.hexdigest()
+        if self.mode == 'pattern':
+            return self.errors
+        return self.state
 
 
 runtime_bins = np.linspace(0, 50, 50)
 
 
-def write(backend, storage, bucket_name, mb_per_file, number, key_prefix, debug):
+def part_key(key_name, part, parts):
+    """Key of one part of an object written with several streams."""
+    if parts == 1:
+        return key_name
+    return '{}.part{:04d}'.format(key_name, part)
+
+
+def stored_keys(res_write):
+    """All the keys written by a write test, including the parts of every object."""
+    parts = res_write.get('streams', 1)
+    return [part_key(k, i, parts) for k in res_write['keynames'] for i in range(parts)]
+
+
+def split_range(bytes_total, n):
+    """Split [0, bytes_total) into n contiguous (start, end) ranges of about the same size."""
+    bounds = [bytes_total * i // n for i in range(n + 1)]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def stream_segments(part_sizes, streams):
+    """Split the bytes of an object stored in parts into one list of (part, start, end) per stream."""
+    part_starts = np.cumsum([0] + part_sizes)
+    segments = []
+    for start, end in split_range(int(part_starts[-1]), streams):
+        stream = []
+        for part, size in enumerate(part_sizes):
+            lo = max(start, part_starts[part])
+            hi = min(end, part_starts[part] + size)
+            if lo < hi:
+                stream.append((part, int(lo - part_starts[part]), int(hi - part_starts[part])))
+        segments.append(stream)
+    return segments
+
+
+def rate(bytes_n, seconds):
+    """MB/s, or NaN when no time elapsed (empty streams, or below the clock resolution)."""
+    return bytes_n/seconds/1e6 if seconds > 0 else float('nan')
+
+
+def stream_stats(start_time, end_time, bytes_n, verify_time=0.0):
+    return {'start_time': start_time, 'end_time': end_time, 'bytes': bytes_n,
+            'mb_rate': rate(bytes_n, end_time-start_time), 'verify_time': verify_time,
+            'io_mb_rate': rate(bytes_n, end_time-start_time-verify_time)}
+
+
+def write(backend, storage, bucket_name, mb_per_file, number, key_prefix, debug, streams=1, sample_interval=0.1,
+          sample_bytes=0):
+
+    def write_part(key_name, storage, part, bytes_n, sampler):
+        d = RandomDataGenerator(bytes_n, seed=data_seed(key_name, part), sampler=sampler)
+        start_time = time.time()
+        storage.put_object(bucket_name, part_key(key_name, part, streams), d)
+        return stream_stats(start_time, time.time(), bytes_n)
 
     def write_object(key_name, storage):
         bytes_n = mb_per_file * 1024**2
-        d = RandomDataGenerator(bytes_n)
         print(key_name)
+        sampler = BandwidthSampler(sample_interval, sample_bytes)
         start_time = time.time()
-        storage.put_object(bucket_name, key_name, d)
+        if streams == 1:
+            stream_results = [write_part(key_name, storage, 0, bytes_n, sampler)]
+        else:
+            with ThreadPoolExecutor(max_workers=streams) as pool:
+                stream_results = list(pool.map(
+                    lambda p: write_part(key_name, storage, p[0], p[1][1] - p[1][0], sampler),
+                    enumerate(split_range(bytes_n, streams))))
         end_time = time.time()
 
-        mb_rate = bytes_n/(end_time-start_time)/1e6
+        mb_rate = rate(bytes_n, end_time-start_time)
         print('MB Rate: '+str(mb_rate))
 
-        return {'start_time': start_time, 'end_time': end_time, 'mb_rate': mb_rate}
+        return {'start_time': start_time, 'end_time': end_time, 'mb_rate': mb_rate, 'streams': stream_results,
+                'samples': sampler.array()}
 
     # create list of random keys
     keynames = [key_prefix + str(uuid.uuid4().hex.upper()) for unused in range(number)]
@@ -142,45 +350,176 @@ def write(backend, storage, bucket_name, mb_per_file, number, key_prefix, debug)
            'worker_stats': worker_stats,
            'bucket_name': bucket_name,
            'keynames': keynames,
+           'streams': streams,
            'results': results}
 
     return res
 
 
-def read(backend, storage, bucket_name, number, keylist_raw, read_times, debug):
+CACHE_MODES = ['warm', 'fadvise', 'direct']
+READ_METHODS = ['stream', 'mmap']
+DIRECT_ALIGNMENT = 4096
+
+
+def drop_cache(path):
+    """Flush a file and drop its pages from the page cache of this node."""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    finally:
+        os.close(fd)
+
+
+def direct_blocks(path, start, end, blocksize):
+    """Read bytes [start, end) of a file with O_DIRECT, as memoryviews of an aligned buffer.
+
+    O_DIRECT reads whole aligned blocks, so blocksize is rounded up to DIRECT_ALIGNMENT.
+    """
+    # Anonymous maps are page aligned, as O_DIRECT needs
+    buf = mmap.mmap(-1, -(-blocksize // DIRECT_ALIGNMENT) * DIRECT_ALIGNMENT)
+    block = memoryview(b'')
+    fd = None
+    try:
+        fd = os.open(path, os.O_RDONLY | os.O_DIRECT)
+        if end is None:
+            end = os.fstat(fd).st_size
+        pos = start - start % DIRECT_ALIGNMENT
+        while pos < end:
+            bytes_n = os.preadv(fd, [buf], pos)
+            if bytes_n <= 0:
+                break
+            block = memoryview(buf)[max(start - pos, 0):min(bytes_n, end - pos)]
+            yield block
+            # The buffer is reused for the next block
+            block.release()
+            pos += bytes_n
+    finally:
+        if fd is not None:
+            os.close(fd)
+        # The buffer can only be closed without views of it
+        block.release()
+        buf.close()
+
+
+def mapped_blocks(storage, bucket_name, key_name, start, end, blocksize, touch=False):
+    """Read bytes [start, end) of an object through a memory map, as memoryviews of blocksize bytes.
+
+    Mapped pages are only read from storage when accessed, so with `touch`
+    one byte of every page is read, for checks that do not access the data.
+    """
+    with map_object(storage, bucket_name, key_name, start, end) as obj:
+        for pos in range(0, len(obj.data), blocksize):
+            block = obj.data[pos:pos + blocksize]
+            if touch:
+                bytes(block[::mmap.PAGESIZE])
+            yield block
+            block.release()
+
+
+def derangement(n, rng):
+    """Random permutation of range(n) that moves every element."""
+    if n < 2:
+        return list(range(n))
+    while True:
+        perm = list(range(n))
+        rng.shuffle(perm)
+        if all(i != p for i, p in enumerate(perm)):
+            return perm
+
+
+def read(backend, storage, bucket_name, number, keylist_raw, read_times, debug, streams=1, parts=1, verify='md5',
+         sample_interval=0.1, sample_bytes=0, cache_mode='warm', shuffle_keys=False, read_method='stream'):
 
     blocksize = 1024*1024
 
+    def read_segments(storage, key_name, segments, sampler):
+        bytes_read = 0
+        verify_time = 0.0
+        checks = []
+        start_time = time.time()
+        for part, start, end in segments:
+            # Parts are written with a seed from their object key and number
+            m = Verifier(verify, seed=data_seed(key_name, part), start=start)
+            # Open and read errors fail the task, so it is left out of the rates
+            if read_method == 'mmap':
+                blocks = mapped_blocks(storage, bucket_name, part_key(key_name, part, parts), start, end,
+                                       blocksize, touch=verify == 'none')
+            elif cache_mode == 'direct':
+                blocks = direct_blocks(object_path(storage, bucket_name, part_key(key_name, part, parts)),
+                                       start, end, blocksize)
+            else:
+                if end is None:
+                    fileobj = storage.get_object(bucket_name, key_name, stream=True)
+                else:
+                    fileobj = storage.get_object(bucket_name, part_key(key_name, part, parts), stream=True,
+                                                 extra_get_args={'Range': 'bytes={}-{}'.format(start, end - 1)})
+                blocks = iter(lambda: fileobj.read(blocksize), b'')
+            for buf in blocks:
+                if len(buf) == 0:
+                    break
+                bytes_read += len(buf)
+                sampler.add(len(buf))
+                m.update(buf)
+            verify_time += m.verify_time
+            checks.append(m.result())
+        stats = stream_stats(start_time, time.time(), bytes_read, verify_time)
+        stats['checks'] = checks
+        return stats
+
     def read_object(key_name, storage):
-        m = hashlib.md5()
         bytes_read = 0
+        verify_time = 0.0
+        stream_results = []
         print(key_name)
 
+        if object_path(storage, bucket_name, key_name) is None:
+            if cache_mode != 'warm':
+                raise ValueError('Cache mode {} needs a file system storage backend'.format(cache_mode))
+            if read_method == 'mmap':
+                print('Not a file system storage backend, mmap reads use get_object')
+
+        sampler = BandwidthSampler(sample_interval, sample_bytes)
         start_time = time.time()
+        if streams == 1 and parts == 1:
+            # Whole object in a single request, without ranges
+            segments = [[(0, 0, None)]]
+        else:
+            part_sizes = [int(storage.head_object(bucket_name, part_key(key_name, i, parts))['content-length'])
+                          for i in range(parts)]
+            segments = stream_segments(part_sizes, streams)
         for unused in range(read_times):
-            fileobj = storage.get_object(bucket_name, key_name, stream=True)
-            try:
-                buf = fileobj.read(blocksize)
-                while len(buf) > 0:
-                    bytes_read += len(buf)
-                    #if bytes_read % (blocksize *10) == 0:
-                    #    mb_rate = bytes_read/(time.time()-t1)/1e6
-                    #    print('POS:'+str(bytes_read)+' MB Rate: '+ str(mb_rate))
-                    m.update(buf)
-                    buf = fileobj.read(blocksize)
-            except Exception as e:
-                print(e)
-                pass
+            if cache_mode == 'fadvise':
+                for i in range(parts):
+                    drop_cache(object_path(storage, bucket_name, part_key(key_name, i, parts)))
+            with ThreadPoolExecutor(max_workers=streams) as pool:
+                times_results = list(pool.map(lambda s: read_segments(storage, key_name, s, sampler), segments))
+            bytes_read += sum(r['bytes'] for r in times_results)
+            # Streams verify in parallel, so only the slowest one delays the task
+            verify_time += max(r['verify_time'] for r in times_results)
+            stream_results += times_results
         end_time = time.time()
-        mb_rate = bytes_read/(end_time-start_time)/1e6
+        mb_rate = rate(bytes_read, end_time-start_time)
         print('MB Rate: '+str(mb_rate))
 
-        return {'start_time': start_time, 'end_time': end_time, 'mb_rate': mb_rate, 'bytes_read': bytes_read}
+        res = {'start_time': start_time, 'end_time': end_time, 'mb_rate': mb_rate, 'bytes_read': bytes_read,
+               'cache_mode': cache_mode, 'read_method': read_method, 'verify': verify, 'verify_time': verify_time,
+               'io_mb_rate': rate(bytes_read, end_time-start_time-verify_time), 'streams': stream_results,
+               'samples': sampler.array()}
+        if verify == 'pattern':
+            res['verify_errors'] = sum(sum(r['checks']) for r in stream_results)
+            print('Blocks not matching the pattern: '+str(res['verify_errors']))
+        return res
 
+    if read_method == 'mmap' and cache_mode == 'direct':
+        raise ValueError('mmap reads can not use O_DIRECT')
     if number == 0:
         keynames = keylist_raw
     else:
         keynames = [keylist_raw[i % len(keylist_raw)] for i in range(number)]
+    if shuffle_keys:
+        # Task i wrote key i, so move every key to another task, most likely on another node
+        keynames = [keynames[i] for i in derangement(len(keynames), random.Random())]
 
     log_level = 'INFO' if not debug else 'DEBUG'
     fexec = FunctionExecutor(backend=backend, storage=storage, runtime_memory=1024, log_level=log_level)
@@ -196,21 +535,411 @@ def read(backend, storage, bucket_name, number, keylist_raw, read_times, debug):
     res = {'start_time': start_time,
            'total_time': total_time,
            'worker_stats': worker_stats,
+           'streams': streams,
+           'verify': verify,
+           'cache_mode': cache_mode,
+           'shuffle_keys': shuffle_keys,
+           'read_method': read_method,
            'results': results}
 
     return res
 
 
-def delete_temp_data(storage, bucket_name, keynames):
+SIZE_UNITS = {'': 1, 'K': 1024, 'M': 1024**2, 'G': 1024**3}
+
+
+def parse_sizes(sizes):
+    """List of byte sizes from a comma separated string like '4K,64K,1M'."""
+    parsed = []
+    for size in sizes.split(','):
+        match = re.fullmatch(r'\s*([0-9.]+)\s*([KMG]?)i?B?\s*', size, re.IGNORECASE)
+        if match is None:
+            raise click.BadParameter('Invalid size: {}'.format(size))
+        parsed.append(int(float(match.group(1)) * SIZE_UNITS[match.group(2).upper()]))
+    return parsed
+
+
+def timed_read(storage, bucket_name, key_name, start, size, blocksize, path=None):
+    """Read `size` bytes from offset `start` of an object, returning the latency in seconds.
+
+    With a file `path`, the bytes are read from it with O_DIRECT instead.
+    """
+    t0 = time.time()
+    if path is not None:
+        for unused in direct_blocks(path, start, start + size, blocksize):
+            pass
+        return time.time() - t0
+    fileobj = storage.get_object(bucket_name, key_name, stream=True,
+                                 extra_get_args={'Range': 'bytes={}-{}'.format(start, start + size - 1)})
+    buf = fileobj.read(blocksize)
+    while len(buf) > 0:
+        buf = fileobj.read(blocksize)
+    return time.time() - t0
+
+
+def pattern_cell(pattern, size, latencies, bytes_n, start_time, end_time):
+    return {'pattern': pattern, 'size': size, 'latencies': latencies, 'bytes': bytes_n,
+            'start_time': start_time, 'end_time': end_time}
+
+
+def access_patterns(backend, storage, bucket_name, mb_per_file, number, key_prefix, range_sizes, block_sizes, stride,
+                    small_sizes, requests, debug, cache_mode='warm'):
+
+    bytes_n = mb_per_file * 1024**2
+
+    def write_task(key_name, storage):
+        print(key_name)
+        storage.put_object(bucket_name, key_name, RandomDataGenerator(bytes_n, seed=data_seed(key_name)))
+        return key_name
+
+    def pattern_task(key_name, storage):
+        rng = np.random.default_rng()
+        cells = []
+        print(key_name)
+        path = object_path(storage, bucket_name, key_name)
+        if cache_mode != 'warm' and path is None:
+            raise ValueError('Cache mode {} needs a file system storage backend'.format(cache_mode))
+        direct_path = path if cache_mode == 'direct' else None
+
+        def start_cell():
+            if cache_mode == 'fadvise':
+                drop_cache(path)
+            return time.time()
+
+        # Random byte ranges, like the slice reads of MDR
+        for size in range_sizes:
+            starts = rng.integers(0, max(bytes_n - size, 0) + 1, size=requests)
+            start_time = start_cell()
+            latencies = [timed_read(storage, bucket_name, key_name, int(start), size, size, direct_path)
+                         for start in starts]
+            cells.append(pattern_cell('random_range', size, latencies, size * requests, start_time, time.time()))
+
+        # Strided reads: `size` bytes out of every `stride * size`
+        for size in range_sizes:
+            starts = np.arange(0, bytes_n - size + 1, size * stride)[:requests]
+            start_time = start_cell()
+            latencies = [timed_read(storage, bucket_name, key_name, int(start), size, size, direct_path)
+                         for start in starts]
+            cells.append(pattern_cell('strided', size, latencies, size * len(starts), start_time, time.time()))
+
+        # Sequential reads of the whole object with several block sizes
+        for blocksize in block_sizes:
+            latencies = []
+            bytes_read = 0
+            start_time = start_cell()
+            if direct_path is not None:
+                blocks = direct_blocks(direct_path, 0, None, blocksize)
+            else:
+                fileobj = storage.get_object(bucket_name, key_name, stream=True)
+                blocks = iter(lambda: fileobj.read(blocksize), b'')
+            while True:
+                t0 = time.time()
+                buf = next(blocks, b'')
+                if len(buf) == 0:
+                    break
+                latencies.append(time.time() - t0)
+                bytes_read += len(buf)
+            cells.append(pattern_cell('block_read', blocksize, latencies, bytes_read, start_time, time.time()))
+
+        # Small objects, like pickled task results
+        for size in small_sizes:
+            data = RandomDataGenerator(size, seed=data_seed(key_name, size)).read()
+            small_keys = ['{}.small{}.{}'.format(key_name, size, i) for i in range(requests)]
+            latencies = []
+            start_time = time.time()
+            for small_key in small_keys:
+                t0 = time.time()
+                storage.put_object(bucket_name, small_key, data)
+                latencies.append(time.time() - t0)
+            cells.append(pattern_cell('small_write', size, latencies, size * requests, start_time, time.time()))
+            storage.delete_objects(bucket_name, small_keys)
+
+        return cells
+
+    keynames = [key_prefix + str(uuid.uuid4().hex.upper()) for unused in range(number)]
+
+    log_level = 'INFO' if not debug else 'DEBUG'
+    fexec = FunctionExecutor(backend=backend, storage=storage, runtime_memory=1024, log_level=log_level)
+    # Objects are written by a first map and read by another task in a second one, so reads do not
+    # come from the page cache of the node that wrote them (with a single task, use a cache mode)
+    fexec.get_result(fexec.map(write_task, keynames), throw_except=False)
+    read_keys = [keynames[i] for i in derangement(number, random.Random())]
+    try:
+        start_time = time.time()
+        worker_futures = fexec.map(pattern_task, read_keys)
+        results = fexec.get_result(worker_futures, throw_except=False)
+        end_time = time.time()
+    finally:
+        delete_temp_data(storage, bucket_name, keynames)
+
+    results = [cells for cells in results if cells is not None]
+    worker_stats = [f.stats for f in worker_futures if not f.error]
+
+    res = {'start_time': start_time,
+           'total_time': end_time - start_time,
+           'worker_stats': worker_stats,
+           'mb_per_file': mb_per_file,
+           'cache_mode': cache_mode,
+           'results': results,
+           'summary': summarize_patterns(results)}
+
+    return res
+
+
+def summarize_patterns(results):
+    """Latency percentiles and bandwidth of every (pattern, size) cell, over all tasks."""
+    cells = {}
+    for task_cells in results:
+        for cell in task_cells:
+            cells.setdefault((cell['pattern'], cell['size']), []).append(cell)
+
+    summary = []
+    for (pattern, size), task_cells in cells.items():
+        latencies = np.concatenate([c['latencies'] for c in task_cells]) * 1000
+        bytes_n = sum(c['bytes'] for c in task_cells)
+        wall_time = max(c['end_time'] for c in task_cells) - min(c['start_time'] for c in task_cells)
+        p50, p90, p99 = np.percentile(latencies, [50, 90, 99]) if len(latencies) else (np.nan,) * 3
+        summary.append({'pattern': pattern, 'size': size, 'requests': len(latencies),
+                        'p50_ms': p50, 'p90_ms': p90, 'p99_ms': p99,
+                        'max_ms': latencies.max() if len(latencies) else np.nan,
+                        'task_mb_rate': np.median([rate(c['bytes'], c['end_time'] - c['start_time'])
+                                                   for c in task_cells]),
+                        'agg_mb_rate': rate(bytes_n, wall_time)})
+    return summary
+
+
+def print_patterns(summary):
+    print('{:>13} {:>10} {:>9} {:>9} {:>9} {:>9} {:>9} {:>12} {:>12}'.format(
+        'pattern', 'size', 'requests', 'p50 ms', 'p90 ms', 'p99 ms', 'max ms', 'task MB/s', 'agg MB/s'))
+    for cell in summary:
+        print('{pattern:>13} {size:>10} {requests:>9} {p50_ms:>9.2f} {p90_ms:>9.2f} {p99_ms:>9.2f} {max_ms:>9.2f}'
+              ' {task_mb_rate:>12.1f} {agg_mb_rate:>12.1f}'.format(**cell))
+
+
+METADATA_PHASES = ['create', 'stat', 'list', 'open_close', 'delete']
+
+
+def storage_barrier(storage, bucket_name, prefix, task_id, number, timeout, poll_interval=0.05, max_interval=1.0):
+    """Wait until `number` tasks reach the barrier.
+
+    Every task creates a marker object. Task 0 lists the markers until all of
+    them exist and then creates a single `go` object, which the other tasks
+    poll for. Polls back off exponentially up to
+    `max_interval`, to keep the barrier load off the metadata being measured.
+    The `go` object holds a start time `max_interval` ahead, which every task
+    sees in time and waits for, so all of them leave the barrier together.
+    """
+    storage.put_object(bucket_name, '{}/arrived/{}'.format(prefix, task_id), b'')
+    go_key = '{}/go'.format(prefix)
+    t0 = time.time()
+    interval = poll_interval
+    while True:
+        if task_id == 0:
+            if len(storage.list_keys(bucket_name, prefix + '/arrived/')) >= number:
+                start_at = time.time() + max_interval
+                storage.put_object(bucket_name, go_key, repr(start_at).encode())
+                break
+        else:
+            try:
+                start_at = float(storage.get_object(bucket_name, go_key))
+                break
+            except Exception:
+                pass  # not released yet
+        if time.time() - t0 > timeout:
+            print('Barrier {} timed out, not all tasks are running'.format(prefix))
+            return
+        time.sleep(interval)
+        interval = min(interval * 2, max_interval)
+    time.sleep(max(start_at - time.time(), 0))
+
+
+def metadata(backend, storage, bucket_name, number, key_prefix, files_per_task, file_size, shared_dir,
+             barrier_timeout, debug):
+    run_id = uuid.uuid4().hex.upper()
+    root = '{}mdtest-{}'.format(key_prefix, run_id)
+
+    def timed(op, *args):
+        t0 = time.time()
+        op(*args)
+        return time.time() - t0
+
+    def open_close(storage, key_name):
+        fileobj = storage.get_object(bucket_name, key_name, stream=True)
+        if hasattr(fileobj, 'close'):
+            fileobj.close()
+
+    def metadata_task(task_id, storage):
+        if shared_dir:
+            directory = '{}/shared/'.format(root)
+            keys = ['{}{}.{}'.format(directory, task_id, i) for i in range(files_per_task)]
+        else:
+            directory = '{}/task{}/'.format(root, task_id)
+            keys = ['{}{}'.format(directory, i) for i in range(files_per_task)]
+        data = RandomDataGenerator(file_size, seed=data_seed(root, task_id)).read() if file_size else b''
+
+        ops = {
+            'create': lambda key_name: storage.put_object(bucket_name, key_name, data),
+            'stat': lambda key_name: storage.head_object(bucket_name, key_name),
+            'open_close': lambda key_name: open_close(storage, key_name),
+            'delete': lambda key_name: storage.delete_object(bucket_name, key_name),
+        }
+        phases = []
+        for phase in METADATA_PHASES:
+            # All tasks start every phase together, as with the MPI barriers of mdtest
+            storage_barrier(storage, bucket_name, '{}/barrier-{}'.format(root, phase), task_id, number,
+                            barrier_timeout)
+            start_time = time.time()
+            if phase == 'list':
+                latencies = [timed(storage.list_keys, bucket_name, directory)]
+            else:
+                latencies = [timed(ops[phase], key_name) for key_name in keys]
+            phases.append({'phase': phase, 'latencies': latencies, 'start_time': start_time,
+                           'end_time': time.time()})
+        return phases
+
+    log_level = 'INFO' if not debug else 'DEBUG'
+    fexec = FunctionExecutor(backend=backend, storage=storage, runtime_memory=1024, log_level=log_level)
+    start_time = time.time()
+    worker_futures = fexec.map(metadata_task, range(number))
+    results = fexec.get_result(throw_except=False)
+    end_time = time.time()
+
+    results = [phases for phases in results if phases is not None]
+    worker_stats = [f.stats for f in worker_futures if not f.error]
+    delete_temp_data(storage, bucket_name, Storage(backend=storage).list_keys(bucket_name, root + '/'))
+
+    res = {'start_time': start_time,
+           'total_time': end_time - start_time,
+           'worker_stats': worker_stats,
+           'bucket_name': bucket_name,
+           'files_per_task': files_per_task,
+           'file_size': file_size,
+           'shared_dir': shared_dir,
+           'results': results,
+           'summary': summarize_metadata(results)}
+
+    return res
+
+
+def summarize_metadata(results):
+    """Operations per second and latency percentiles of every metadata phase, over all tasks."""
+    summary = []
+    for phase in METADATA_PHASES:
+        task_phases = [p for phases in results for p in phases if p['phase'] == phase]
+        if not task_phases:
+            continue
+        latencies = np.concatenate([p['latencies'] for p in task_phases]) * 1000
+        wall_time = max(p['end_time'] for p in task_phases) - min(p['start_time'] for p in task_phases)
+        p50, p90, p99 = np.percentile(latencies, [50, 90, 99])
+        summary.append({'phase': phase, 'ops': len(latencies), 'ops_rate': len(latencies) / wall_time,
+                        'p50_ms': p50, 'p90_ms': p90, 'p99_ms': p99, 'max_ms': latencies.max()})
+    return summary
+
+
+def print_metadata(summary):
+    print('{:>10} {:>9} {:>12} {:>9} {:>9} {:>9} {:>9}'.format(
+        'phase', 'ops', 'ops/s', 'p50 ms', 'p90 ms', 'p99 ms', 'max ms'))
+    for phase in summary:
+        print('{phase:>10} {ops:>9} {ops_rate:>12.1f} {p50_ms:>9.2f} {p90_ms:>9.2f} {p99_ms:>9.2f} {max_ms:>9.2f}'
+              .format(**phase))
+
+
+def delete_temp_data(storage, bucket_name, keynames, workers=32):
     print('Deleting temp files...')
     storage = Storage(backend=storage)
     try:
-        storage.delete_objects(bucket_name, keynames)
-    except:
-        pass
+        delete_keys(storage, bucket_name, keynames, workers)
+    except Exception as e:
+        print(e)
     print('Done!')
 
 
+def parse_targets(targets):
+    """Dict of target name to bucket (a directory path with file system backends) from NAME=BUCKET strings."""
+    parsed = {}
+    for target in targets:
+        name, sep, bucket_name = target.partition('=')
+        if not sep or not name or not bucket_name:
+            raise click.BadParameter('Targets must be NAME=BUCKET, got {}'.format(target))
+        parsed[name] = bucket_name
+    return parsed
+
+
+def compare(backend, storage, targets, mb_per_file, number, read_times, streams, verify, files_per_task, repeats,
+            seed, debug, cache_mode='warm', shuffle_keys=False):
+    """Run the same write, read and metadata tests on every target, in random order."""
+    rng = random.Random(seed)
+    runs = []
+    for repeat in range(repeats):
+        # Each test runs on all the targets before the next one starts, so reads do not directly
+        # follow the writes of the same target, and the order of the targets changes every time
+        run = {name: {'target': name, 'bucket_name': bucket_name, 'repeat': repeat}
+               for name, bucket_name in targets.items()}
+        for test in ['write', 'read', 'metadata']:
+            order = list(targets)
+            rng.shuffle(order)
+            for name in order:
+                bucket_name = targets[name]
+                print('Executing {} test on {} ({}), repeat {}'.format(test, name, bucket_name, repeat))
+                if test == 'write':
+                    run[name]['write'] = write(backend, storage, bucket_name, mb_per_file, number, '', debug,
+                                               streams)
+                elif test == 'read':
+                    res_write = run[name]['write']
+                    run[name]['read'] = read(backend, storage, bucket_name, 0, res_write['keynames'], read_times,
+                                             debug, streams, streams, verify, cache_mode=cache_mode,
+                                             shuffle_keys=shuffle_keys)
+                    delete_temp_data(storage, bucket_name, stored_keys(res_write))
+                else:
+                    run[name]['metadata'] = metadata(backend, storage, bucket_name, number, '', files_per_task, 0,
+                                                     False, 60, debug)
+                run[name]['{}_order'.format(test)] = order.index(name)
+        runs += run.values()
+
+    return {'targets': targets,
+            'cache_mode': cache_mode,
+            'shuffle_keys': shuffle_keys,
+            'mb_per_file': mb_per_file,
+            'number': number,
+            'runs': runs,
+            'summary': summarize_comparison(runs, mb_per_file * 1024**2)}
+
+
+def bandwidth_stats(results, bytes_per_task=None):
+    """Aggregate MB/s and task duration percentiles of the tasks of a write or read test."""
+    if not results:
+        return {'agg_mb_rate': float('nan'), 'task_p50_s': float('nan'), 'task_p99_s': float('nan')}
+    bytes_n = sum(bytes_per_task if bytes_per_task else r['bytes_read'] for r in results)
+    durations = np.array([r['end_time'] - r['start_time'] for r in results])
+    wall_time = max(r['end_time'] for r in results) - min(r['start_time'] for r in results)
+    return {'agg_mb_rate': rate(bytes_n, wall_time),
+            'task_p50_s': np.percentile(durations, 50),
+            'task_p99_s': np.percentile(durations, 99)}
+
+
+def summarize_comparison(runs, bytes_per_task):
+    """Median over repeats of the bandwidth, tail latency and metadata rates of every target."""
+    summary = {}
+    for run in runs:
+        row = {}
+        for test in ['write', 'read']:
+            stats = bandwidth_stats(run[test]['results'], bytes_per_task if test == 'write' else None)
+            row.update({'{}_{}'.format(test, k): v for k, v in stats.items()})
+        for phase in run['metadata']['summary']:
+            row['{}_ops_rate'.format(phase['phase'])] = phase['ops_rate']
+            row['{}_p99_ms'.format(phase['phase'])] = phase['p99_ms']
+        summary.setdefault(run['target'], []).append(row)
+    return {target: {k: float(np.median([row[k] for row in rows])) for k in rows[0]}
+            for target, rows in summary.items()}
+
+
+def print_comparison(summary):
+    targets = list(summary)
+    print('{:>22}'.format('') + ''.join('{:>16}'.format(t) for t in targets))
+    for metric in summary[targets[0]]:
+        print('{:>22}'.format(metric) + ''.join('{:>16.2f}'.format(summary[t][metric]) for t in targets))
+
+
 def create_plots(res_write, res_read, outdir, name):
     create_execution_histogram(res_write, res_read, f"{outdir}/{name}_execution.png")
     create_rates_histogram(res_write, res_read, f"{outdir}/{name}_rates.png")
@@ -231,13 +960,18 @@ def cli():
 @click.option('--key_prefix', default='', help='Object key prefix')
 @click.option('--outdir', default='.', help='dir to save results in')
 @click.option('--name', default=None, help='filename to save results in')
+@click.option('--streams', default=1, help='parallel I/O streams per task', type=int)
+@click.option('--sample_interval', default=0.1, help='seconds between bandwidth samples of each task', type=float)
+@click.option('--sample_bytes', default=0, help='also sample every SAMPLE_BYTES bytes, 0 to disable', type=int)
 @click.option('--debug', '-d', is_flag=True, help='debug mode')
-def write_command(backend, storage, bucket_name, mb_per_file, number, key_prefix, outdir, name, debug):
+def write_command(backend, storage, bucket_name, mb_per_file, number, key_prefix, outdir, name, streams,
+                  sample_interval, sample_bytes, debug):
     if name is None:
         name = number
     if bucket_name is None:
         raise ValueError('You must provide a bucket name within --bucket_name parameter')
-    res_write = write(backend, storage, bucket_name, mb_per_file, number, key_prefix, debug)
+    res_write = write(backend, storage, bucket_name, mb_per_file, number, key_prefix, debug, streams,
+                      sample_interval, sample_bytes)
     pickle.dump(res_write, open('{}/{}_write.pickle'.format(outdir, name), 'wb'), -1)
 
 
@@ -249,8 +983,19 @@ def write_command(backend, storage, bucket_name, mb_per_file, number, key_prefix
 @click.option('--outdir', default='.', help='dir to save results in')
 @click.option('--name', default=None, help='filename to save results in')
 @click.option('--read_times', default=1, help="number of times to read each COS key")
+@click.option('--streams', default=1, help='parallel I/O streams per task', type=int)
+@click.option('--verify', default='md5', type=click.Choice(VERIFY_MODES),
+              help='check of the data read, timed apart from I/O')
+@click.option('--sample_interval', default=0.1, help='seconds between bandwidth samples of each task', type=float)
+@click.option('--sample_bytes', default=0, help='also sample every SAMPLE_BYTES bytes, 0 to disable', type=int)
+@click.option('--cache_mode', default='warm', type=click.Choice(CACHE_MODES),
+              help='warm: plain reads, fadvise: drop cached pages first, direct: O_DIRECT reads')
+@click.option('--shuffle_keys', is_flag=True, help='read keys written by other tasks')
+@click.option('--read_method', default='stream', type=click.Choice(READ_METHODS),
+              help='read objects with get_object streams, or map them in memory')
 @click.option('--debug', '-d', is_flag=True, help='debug mode')
-def read_command(backend, storage, key_file, number, outdir, name, read_times, debug):
+def read_command(backend, storage, key_file, number, outdir, name, read_times, streams, verify, sample_interval,
+                 sample_bytes, cache_mode, shuffle_keys, read_method, debug):
     if name is None:
         name = number
     if key_file:
@@ -259,22 +1004,146 @@ def read_command(backend, storage, key_file, number, outdir, name, read_times, d
         res_write = pickle.load(open('{}/{}_write.pickle'.format(outdir, name), 'rb'))
     bucket_name = res_write['bucket_name']
     keynames = res_write['keynames']
-    res_read = read(backend, storage, bucket_name, number, keynames, read_times, debug)
+    res_read = read(backend, storage, bucket_name, number, keynames, read_times, debug, streams,
+                    res_write.get('streams', 1), verify, sample_interval, sample_bytes, cache_mode, shuffle_keys,
+                    read_method)
     pickle.dump(res_read, open('{}/{}_read.pickle'.format(outdir, name), 'wb'), -1)
 
 
+@cli.command('read_methods')
+@click.option('--backend', '-b', default='aws_lambda', help='compute backend name', type=str)
+@click.option('--storage', '-s', default='aws_s3', help='storage backend name', type=str)
+@click.option('--key_file', default=None, help="filename generated by write command, which contains the keys to read")
+@click.option('--number', help='number of objects to read, 0 for all', type=int, default=0)
+@click.option('--outdir', default='.', help='dir to save results in')
+@click.option('--name', default=None, help='filename to save results in')
+@click.option('--rounds', default=3, help='times to read the objects with each method', type=int)
+@click.option('--cache_mode', default='fadvise', type=click.Choice(['warm', 'fadvise']),
+              help='warm: plain reads, fadvise: drop cached pages first')
+@click.option('--verify', default='none', type=click.Choice(VERIFY_MODES),
+              help='check of the data read, timed apart from I/O')
+@click.option('--debug', '-d', is_flag=True, help='debug mode')
+def read_methods_command(backend, storage, key_file, number, outdir, name, rounds, cache_mode, verify, debug):
+    if name is None:
+        name = number
+    if key_file:
+        res_write = pickle.load(open(key_file, 'rb'))
+    else:
+        res_write = pickle.load(open('{}/{}_write.pickle'.format(outdir, name), 'rb'))
+    bucket_name = res_write['bucket_name']
+    keynames = res_write['keynames']
+    parts = res_write.get('streams', 1)
+
+    res_methods = {method: [] for method in READ_METHODS}
+    for unused in range(rounds):
+        # Alternate the method that reads first, so that neither always finds the other's cached pages
+        for method in random.sample(READ_METHODS, len(READ_METHODS)):
+            print('Reading with {}'.format(method))
+            res_methods[method].append(read(backend, storage, bucket_name, number, keynames, 1, debug, parts, parts,
+                                            verify, cache_mode=cache_mode, read_method=method))
+    summary = {method: {k: float(np.median([bandwidth_stats(r['results'])[k] for r in res]))
+                        for k in ['agg_mb_rate', 'task_p50_s', 'task_p99_s']}
+               for method, res in res_methods.items()}
+    pickle.dump({'results': res_methods, 'summary': summary},
+                open('{}/{}_read_methods.pickle'.format(outdir, name), 'wb'), -1)
+    print_comparison(summary)
+
+
 @cli.command('delete')
+@click.option('--storage', '-s', default='aws_s3', help='storage backend name', type=str)
 @click.option('--key_file', default=None, help="filename generated by write command, which contains the keys to read")
 @click.option('--outdir', default='.', help='dir to save results in')
 @click.option('--name', default='os_benchmark', help='filename to save results in')
-def delete_command(key_file, outdir, name):
+@click.option('--workers', default=32, help='threads deleting objects in parallel', type=int)
+def delete_command(storage, key_file, outdir, name, workers):
     if key_file:
         res_write = pickle.load(open(key_file, 'rb'))
     else:
         res_write = pickle.load(open('{}/{}_write.pickle'.format(outdir, name), 'rb'))
     bucket_name = res_write['bucket_name']
-    keynames = res_write['keynames']
-    delete_temp_data(bucket_name, keynames)
+    keynames = stored_keys(res_write)
+    delete_temp_data(storage, bucket_name, keynames, workers)
+
+
+@cli.command('patterns')
+@click.option('--backend', '-b', default='aws_lambda', help='compute backend name', type=str)
+@click.option('--storage', '-s', default='aws_s3', help='storage backend name', type=str)
+@click.option('--bucket_name', help='bucket to save files in')
+@click.option('--mb_per_file', default=64, help='MB of the object read by each task', type=int)
+@click.option('--number', default=1, help='number of tasks', type=int)
+@click.option('--key_prefix', default='', help='Object key prefix')
+@click.option('--range_sizes', default='4K,64K,1M', help='sizes of random and strided range reads')
+@click.option('--block_sizes', default='64K,1M,8M', help='block sizes of sequential reads')
+@click.option('--stride', default=4, help='strided reads read one range every STRIDE ranges', type=int)
+@click.option('--small_sizes', default='1K,16K,256K', help='sizes of small object writes')
+@click.option('--requests', default=100, help='requests per task of each random, strided and small write cell',
+              type=int)
+@click.option('--cache_mode', default='warm', type=click.Choice(CACHE_MODES),
+              help='warm: plain reads, fadvise: drop cached pages before each cell, direct: O_DIRECT reads')
+@click.option('--outdir', default='.', help='dir to save results in')
+@click.option('--name', default='os_benchmark', help='filename to save results in')
+@click.option('--debug', '-d', is_flag=True, help='debug mode')
+def patterns_command(backend, storage, bucket_name, mb_per_file, number, key_prefix, range_sizes, block_sizes, stride,
+                     small_sizes, requests, cache_mode, outdir, name, debug):
+    if bucket_name is None:
+        raise ValueError('You must provide a bucket name within --bucket_name parameter')
+    res_patterns = access_patterns(backend, storage, bucket_name, mb_per_file, number, key_prefix,
+                                   parse_sizes(range_sizes), parse_sizes(block_sizes), stride,
+                                   parse_sizes(small_sizes), requests, debug, cache_mode)
+    pickle.dump(res_patterns, open(f'{outdir}/{name}_patterns.pickle', 'wb'), -1)
+    print_patterns(res_patterns['summary'])
+
+
+@cli.command('metadata')
+@click.option('--backend', '-b', default='aws_lambda', help='compute backend name', type=str)
+@click.option('--storage', '-s', default='aws_s3', help='storage backend name', type=str)
+@click.option('--bucket_name', help='bucket to save files in')
+@click.option('--number', default=1, help='number of tasks', type=int)
+@click.option('--key_prefix', default='', help='Object key prefix')
+@click.option('--files_per_task', default=1000, help='objects created by each task', type=int)
+@click.option('--file_size', default=0, help='bytes of each object', type=int)
+@click.option('--shared_dir/--task_dir', default=False, help='one directory for all tasks, or one per task')
+@click.option('--barrier_timeout', default=60, help='seconds to wait for all tasks at the start of each phase',
+              type=int)
+@click.option('--outdir', default='.', help='dir to save results in')
+@click.option('--name', default='os_benchmark', help='filename to save results in')
+@click.option('--debug', '-d', is_flag=True, help='debug mode')
+def metadata_command(backend, storage, bucket_name, number, key_prefix, files_per_task, file_size, shared_dir,
+                     barrier_timeout, outdir, name, debug):
+    if bucket_name is None:
+        raise ValueError('You must provide a bucket name within --bucket_name parameter')
+    res_metadata = metadata(backend, storage, bucket_name, number, key_prefix, files_per_task, file_size,
+                            shared_dir, barrier_timeout, debug)
+    pickle.dump(res_metadata, open(f'{outdir}/{name}_metadata.pickle', 'wb'), -1)
+    print_metadata(res_metadata['summary'])
+
+
+@cli.command('compare')
+@click.option('--backend', '-b', default='aws_lambda', help='compute backend name', type=str)
+@click.option('--storage', '-s', default='aws_s3', help='storage backend name', type=str)
+@click.option('--target', '-t', 'targets', multiple=True, required=True,
+              help='storage target as NAME=BUCKET, e.g. gkfs=$GKFS_MNT (repeat for each target)')
+@click.option('--mb_per_file', default=512, help='MB of each object', type=int)
+@click.option('--number', default=100, help='number of tasks', type=int)
+@click.option('--read_times', default=1, help="number of times to read each COS key")
+@click.option('--streams', default=1, help='parallel I/O streams per task', type=int)
+@click.option('--verify', default='none', type=click.Choice(VERIFY_MODES),
+              help='check of the data read, timed apart from I/O')
+@click.option('--cache_mode', default='warm', type=click.Choice(CACHE_MODES),
+              help='warm: plain reads, fadvise: drop cached pages first, direct: O_DIRECT reads')
+@click.option('--shuffle_keys', is_flag=True, help='read keys written by other tasks')
+@click.option('--files_per_task', default=1000, help='objects created by each task in the metadata test', type=int)
+@click.option('--repeats', default=3, help='times to run the tests on every target', type=int)
+@click.option('--seed', default=None, help='seed of the random order of the targets', type=int)
+@click.option('--outdir', default='.', help='dir to save results in')
+@click.option('--name', default='os_benchmark', help='filename to save results in')
+@click.option('--debug', '-d', is_flag=True, help='debug mode')
+def compare_command(backend, storage, targets, mb_per_file, number, read_times, streams, verify, cache_mode,
+                    shuffle_keys, files_per_task, repeats, seed, outdir, name, debug):
+    res_compare = compare(backend, storage, parse_targets(targets), mb_per_file, number, read_times, streams, verify,
+                          files_per_task, repeats, seed, debug, cache_mode, shuffle_keys)
+    pickle.dump(res_compare, open(f'{outdir}/{name}_compare.pickle', 'wb'), -1)
+    print_comparison(res_compare['summary'])
 
 
 @cli.command('run')
@@ -287,8 +1156,19 @@ def delete_command(key_file, outdir, name):
 @click.option('--outdir', default='.', help='dir to save results in')
 @click.option('--name', '-n', default=None, help='filename to save results in')
 @click.option('--read_times', default=1, help="number of times to read each COS key")
+@click.option('--streams', default=1, help='parallel I/O streams per task', type=int)
+@click.option('--verify', default='md5', type=click.Choice(VERIFY_MODES),
+              help='check of the data read, timed apart from I/O')
+@click.option('--sample_interval', default=0.1, help='seconds between bandwidth samples of each task', type=float)
+@click.option('--sample_bytes', default=0, help='also sample every SAMPLE_BYTES bytes, 0 to disable', type=int)
+@click.option('--cache_mode', default='warm', type=click.Choice(CACHE_MODES),
+              help='warm: plain reads, fadvise: drop cached pages first, direct: O_DIRECT reads')
+@click.option('--shuffle_keys', is_flag=True, help='read keys written by other tasks')
+@click.option('--read_method', default='stream', type=click.Choice(READ_METHODS),
+              help='read objects with get_object streams, or map them in memory')
 @click.option('--debug', '-d', is_flag=True, help='debug mode')
-def run(backend, storage, bucket_name, mb_per_file, number, key_prefix, outdir, name, read_times, debug):
+def run(backend, storage, bucket_name, mb_per_file, number, key_prefix, outdir, name, read_times, streams, verify,
+        sample_interval, sample_bytes, cache_mode, shuffle_keys, read_method, debug):
     if name is None:
         name = number
 
@@ -296,17 +1176,19 @@ def run(backend, storage, bucket_name, mb_per_file, number, key_prefix, outdir,
         print('Executing Write Test:')
         if bucket_name is None:
             bucket_name="/gpfs/scratch/cns102/andres/" #raise ValueError('You must provide a bucket name within --bucket_name parameter')
-        res_write = write(backend, storage, bucket_name, mb_per_file, number, key_prefix, debug)
+        res_write = write(backend, storage, bucket_name, mb_per_file, number, key_prefix, debug, streams,
+                          sample_interval, sample_bytes)
         pickle.dump(res_write, open(f'{outdir}/{name}_write.pickle', 'wb'), -1)
         print('Sleeping 20 seconds...')
         time.sleep(20)
         print('Executing Read Test:')
         bucket_name = res_write['bucket_name']
         keynames = res_write['keynames']
-        res_read = read(backend, storage, bucket_name, number, keynames, read_times, debug)
+        res_read = read(backend, storage, bucket_name, number, keynames, read_times, debug, streams, streams, verify,
+                        sample_interval, sample_bytes, cache_mode, shuffle_keys, read_method)
         pickle.dump(res_read, open(f'{outdir}/{name}_read.pickle', 'wb'), -1)
 
-        delete_temp_data(storage, bucket_name, keynames)
+        delete_temp_data(storage, bucket_name, stored_keys(res_write))
     else:
         res_write = pickle.load(open(f'{outdir}/{name}_write.pickle', 'rb'))
         res_read = pickle.load(open(f'{outdir}/{name}_read.pickle', 'rb'))
@@ -15,6 +15,7 @@
 #
 
 import os
+import sys
 import pylab
 import logging
 import numpy as np
@@ -22,6 +23,9 @@ import pandas as pd
 import seaborn as sns
 from matplotlib.collections import LineCollection
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'motifs'))
+from hpc_timeline import downsample_segments, interval_sum
+
 pylab.switch_backend("Agg")
 logger = logging.getLogger(__name__)
 
@@ -37,20 +41,9 @@ def create_execution_histogram(res_write, res_read, dst):
         tr_start_time = x[:, 0] - tzero
         tr_end_time = x[:, 1] - tzero
 
-        N = len(tr_start_time)
-
-        runtime_calls_hist = np.zeros((N, len(runtime_bins)))
-
-        for i in range(N):
-            s = tr_start_time[i]
-            e = tr_end_time[i]
-            a, b = np.searchsorted(runtime_bins, [s, e])
-            if b-a > 0:
-                runtime_calls_hist[i, a:b] = 1
-
         return {'start_time': tr_start_time,
                 'end_time': tr_end_time,
-                'runtime_calls_hist': runtime_calls_hist}
+                'runtime_calls_hist': interval_sum(runtime_bins, tr_start_time, tr_end_time)}
 
     fig, axes2d = pylab.subplots(nrows=1, ncols=2, sharex=True, sharey=True, figsize=(5, 5))
 
@@ -69,14 +62,12 @@ def create_execution_histogram(res_write, res_read, dst):
 
         time_hist = compute_times_rates(time_rates)
 
-        N = len(time_hist['start_time'])
-        line_segments = LineCollection([[[time_hist['start_time'][i], i],
-                                         [time_hist['end_time'][i], i]] for i in range(N)],
+        line_segments = LineCollection(downsample_segments(time_hist['start_time'], time_hist['end_time']),
                                        linestyles='solid', color='k', alpha=0.6, linewidth=0.4)
 
         ax.add_collection(line_segments)
 
-        ax.plot(runtime_bins, time_hist['runtime_calls_hist'].sum(axis=0), label='Parallel {} Functions'.format(l), zorder=-1, c=c)
+        ax.plot(runtime_bins, time_hist['runtime_calls_hist'], label='Parallel {} Functions'.format(l), zorder=-1, c=c)
 
         yplot_step = int(np.max([1, total_calls/20]))
         y_ticks = np.arange(total_calls//yplot_step + 2) * yplot_step
@@ -142,6 +133,45 @@ def create_rates_histogram(res_write, res_read, dst):
     fig.savefig(dst)
 
 
+def aggregate_bandwidth(samples, start_time, resolution=0.1):
+    """
+    Aggregate bandwidth over time of many tasks, from their
+    (timestamp, cumulative bytes) samples.
+
+    Bytes are interpolated linearly between the samples of each task.
+    The rates of all sample intervals are merged into one sorted list
+    of rate changes, so the cost grows with the number of samples and
+    not with tasks x time bins. Returns the bin end times (seconds from
+    start_time) and the GB/sec of each bin.
+    """
+    samples = [np.asarray(s, dtype=np.float64) for s in samples if len(s) > 1]
+    if not samples:
+        return np.zeros(0), np.zeros(0)
+    t0 = np.concatenate([s[:-1, 0] for s in samples]) - start_time
+    t1 = np.concatenate([s[1:, 0] for s in samples]) - start_time
+    delta = np.concatenate([np.diff(s[:, 1]) for s in samples])
+
+    # Intervals of zero length are bytes moved at a single instant
+    dt = t1 - t0
+    instant = dt <= 0
+    rate = np.where(instant, 0, delta / np.where(instant, 1, dt))
+
+    times = np.concatenate([t0, t1])
+    rate_change = np.concatenate([rate, -rate])
+    jumps = np.concatenate([np.where(instant, delta, 0), np.zeros_like(delta)])
+    order = np.argsort(times, kind='stable')
+    times, rate_change, jumps = times[order], rate_change[order], jumps[order]
+
+    rate_after = np.cumsum(rate_change)
+    cumulative = np.concatenate([[0], np.cumsum(rate_after[:-1] * np.diff(times))]) + np.cumsum(jumps)
+
+    bins = np.arange(0, times[-1] + resolution, resolution)
+    if len(bins) < 2:
+        bins = np.array([0, resolution])
+    cumulative_bins = np.interp(bins, times, cumulative, left=0)
+    return bins[1:], np.diff(cumulative_bins) / resolution / 1e9
+
+
 def create_agg_bdwth_plot(res_write, res_read, dst):
 
     def compute_times_rates(start_time, d):
@@ -152,25 +182,21 @@ def create_agg_bdwth_plot(res_write, res_read, dst):
         tr_end_time = x[:, 1] - tzero
         rate = x[:, 2]
 
-        N = len(tr_start_time)
-        runtime_rate_hist = np.zeros((N, len(runtime_bins)))
-
-        for i in range(N):
-            s = tr_start_time[i]
-            e = tr_end_time[i]
-            a, b = np.searchsorted(runtime_bins, [s, e])
-            if b-a > 0:
-                runtime_rate_hist[i, a:b] = rate[i]
-
         return {'start_time': tr_start_time,
                 'end_time': tr_end_time,
                 'rate': rate,
-                'runtime_rate_hist': runtime_rate_hist}
+                'runtime_rate_hist': interval_sum(runtime_bins, tr_start_time, tr_end_time, rate)}
 
     fig = pylab.figure(figsize=(5, 5))
     ax = fig.add_subplot(1, 1, 1)
     for datum, l, c in [(res_write, 'Aggregate Write Bandwidth', WRITE_COLOR), (res_read, 'Aggregate Read Bandwidth', READ_COLOR)]:
         start_time = datum['start_time']
+        if all('samples' in res for res in datum['results']):
+            # Bandwidth samples recorded by the tasks
+            times, gb_rates = aggregate_bandwidth([res['samples'] for res in datum['results']], start_time)
+            ax.plot(times, gb_rates, label=l, c=c)
+            continue
+
         mb_rates = [(res['start_time'], res['end_time'], res['mb_rate']) for res in datum['results']]
         max_seconds = int(max([mr[1]-start_time for mr in mb_rates])*1.2)
         max_seconds = 8 * round(max_seconds/8)
@@ -178,7 +204,7 @@ def create_agg_bdwth_plot(res_write, res_read, dst):
 
         mb_rates_hist = compute_times_rates(start_time, mb_rates)
 
-        ax.plot(mb_rates_hist['runtime_rate_hist'].sum(axis=0)/1000, label=l, c=c)
+        ax.plot(mb_rates_hist['runtime_rate_hist']/1000, label=l, c=c)
 
     ax.set_xlabel('Execution Time (sec)')
     ax.set_ylabel("GB/sec")